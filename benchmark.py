@@ -0,0 +1,173 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import resource
+import shutil
+import time
+import tracemalloc
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+
+import main
+from utils.coordinates import CoordinateStore
+from utils.files import apply_schema
+from utils.metrics import Metrics, profile
+from utils.results import RELATION_SCHEMA, SHIPMENT_SCHEMA
+from utils.synthetic import generate_network
+
+# STEP 4 to STEP 6 of main.py, the stages before need API keys and the input Excel file
+BENCHMARK_STAGES = [('intersect', main.create_intersection_points),
+                    ('sections', main.create_sections),
+                    ('evaluate', main.evaluate_sections)]
+
+parser = argparse.ArgumentParser(
+    description='Benchmark STEP 4 to STEP 6 of main.py on synthetic networks of routes sharing corridors, offline and '
+                'without input data, and record the wall time and peak memory of every stage per network size')
+parser.add_argument('--sizes', type=int, nargs='+', default=[100, 300, 1000],
+                    help='numbers of relations of the networks (default: 100 300 1000)')
+parser.add_argument('--grid-size', type=int, default=10,
+                    help='number of corridor junctions per row and column of the network (default: 10)')
+parser.add_argument('--vertices-per-edge', type=int, default=20,
+                    help='number of route vertices between two neighbouring junctions, i.e., the vertex density '
+                         '(default: 20)')
+parser.add_argument('--shipments-per-relation', type=int, default=20,
+                    help='mean number of shipments per relation (default: 20)')
+parser.add_argument('--seed', type=int, default=1, help='seed of the synthetic networks (default: 1)')
+parser.add_argument('--max-seconds', type=float, default=None,
+                    help='skip the larger sizes once a size took longer than this (default: no limit)')
+parser.add_argument('--no-memory', action='store_true',
+                    help='do not trace the peak memory, which slows down the stages, to measure the wall time only')
+parser.add_argument('--work-dir', default='temp/benchmark',
+                    help='directory of the intermediate results of the networks (default: temp/benchmark)')
+parser.add_argument('--output', default='output/benchmark',
+                    help='path of the results without extension, written as .json, .csv and .svg '
+                         '(default: output/benchmark)')
+args, main_argv = parser.parse_known_args()
+
+# the remaining arguments are passed to the stages, e.g., --engine edges or --workers 4
+main_args = main.parse_arguments(main_argv)
+
+
+def run_stage(stage: str, function, context: dict) -> dict:
+    """
+    Run a stage and measure its wall time and peak memory, the stage is profiled if a profiler is passed to the stages
+    :param stage: name of the stage
+    :param function: stage function of main.py, called with the context
+    :param context: dict of the pipeline, see main.main
+    :return: dict with the wall time in seconds, the peak traced memory and the maximum resident set size of the process
+        in MB
+    """
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    with profile(stage, main_args.profile):
+        function(context)
+    seconds = time.perf_counter() - start
+    return {'seconds': round(seconds, 3),
+            'peak_memory_mb': round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1) if tracemalloc.is_tracing()
+            else None,
+            # kilobytes on Linux, the maximum over the lifetime of the process
+            'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10, 1)}
+
+
+def benchmark_size(relations: int, work_dir: str) -> list:
+    """
+    Generate a synthetic network and run STEP 4 to STEP 6 on it in a fresh work directory
+    :param relations: number of relations of the network
+    :param work_dir: directory of the intermediate results, deleted first
+    :return: list of dicts, one per stage
+    """
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(os.path.join(work_dir, 'temp'))
+    os.makedirs(os.path.join(work_dir, 'output'))
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        start = time.perf_counter()
+        route_coordinates, distances, df_relations, df_shipments = generate_network(
+            relations, grid_size=args.grid_size, vertices_per_edge=args.vertices_per_edge,
+            shipments_per_relation=args.shipments_per_relation, seed=args.seed)
+        route_store = CoordinateStore.from_coordinates(route_coordinates, distances, main.ROUTES_PATH,
+                                                       dtype=main.ROUTE_COORDINATE_DTYPE)
+        network = {'relations': relations,
+                   'vertices': len(route_store.vertices),
+                   'shipments': len(df_shipments)}
+        rows = [dict(network, stage='generate', seconds=round(time.perf_counter() - start, 3), peak_memory_mb=None,
+                     max_rss_mb=None)]
+
+        context = {'args': main_args,
+                   'metrics': Metrics(),
+                   'routes_path': main.ROUTES_PATH,
+                   'results_path': main.RESULTS_PATH,
+                   'df_relations': apply_schema(df_relations, RELATION_SCHEMA),
+                   'df_shipments': apply_schema(df_shipments, SHIPMENT_SCHEMA),
+                   'route_store': route_store}
+        # the stages print their progress, which is kept in a log file instead of the console
+        with open('benchmark.log', 'w') as log, contextlib.redirect_stdout(log):
+            for stage, function in BENCHMARK_STAGES:
+                rows.append(dict(network, stage=stage, **run_stage(stage, function, context)))
+        # the timers and counters of the hot loops of every size
+        context['metrics'].write(main_args.metrics)
+        for row in rows:
+            row.update(intersection_points=len(context['df_intersection_points']),
+                       sections=len(context['df_sections']),
+                       section_combinations=len(context['df_contiguous_section_combinations']))
+        return rows
+    finally:
+        os.chdir(cwd)
+
+
+def plot_scaling_curves(rows: list, filename: str):
+    """
+    Plot the wall time of every stage over the number of relations
+    :param rows: list of dicts, see benchmark_size
+    :param filename: path of the plot
+    :return: None
+    """
+    fig, ax = plt.subplots(figsize=(7, 5))
+    for stage in ['generate'] + [stage for stage, _ in BENCHMARK_STAGES]:
+        stage_rows = [row for row in rows if row['stage'] == stage]
+        ax.plot([row['relations'] for row in stage_rows], [row['seconds'] for row in stage_rows], marker='o',
+                label=stage)
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_xlabel('Relations')
+    ax.set_ylabel('Wall time $[t]=s$')
+    ax.legend(loc='upper left')
+    ax.grid(True)
+    ax.set_title(f'Scaling of the stages, engine {main_args.engine}')
+    fig.tight_layout()
+    fig.savefig(filename)
+    plt.close(fig)
+
+
+if not args.no_memory:
+    tracemalloc.start()
+
+results = []
+for size in sorted(args.sizes):
+    print(f'Benchmarking {size} relations')
+    size_rows = benchmark_size(size, os.path.join(args.work_dir, str(size)))
+    for row in size_rows:
+        memory = f', peak memory {row["peak_memory_mb"]} MB' if row['peak_memory_mb'] is not None else ''
+        print(f'{row["stage"]:>10}: {row["seconds"]:9.3f} s{memory}')
+    results.extend(size_rows)
+    if args.max_seconds is not None and sum(row['seconds'] for row in size_rows) > args.max_seconds:
+        print(f'{size} relations took longer than {args.max_seconds} s, skipping the larger sizes.')
+        break
+
+os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+with open(args.output + '.json', 'w') as f:
+    json.dump({'arguments': vars(args), 'stage_arguments': vars(main_args), 'results': results}, f, indent=4)
+with open(args.output + '.csv', 'w', newline='') as f:
+    writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+    writer.writeheader()
+    writer.writerows(results)
+plot_scaling_curves(results, args.output + '.svg')
+print(f'Results written to {args.output}.json, {args.output}.csv and {args.output}.svg')
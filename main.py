@@ -1,555 +1,1019 @@
+import argparse
 import json
+import multiprocessing
+import os
 import time
-import statistics
 
 import shapely.geometry
 from shapely.geometry import shape, MultiLineString, GeometryCollection, Point, LineString, mapping
 from shapely import ops
+from utils.cache import *
+from utils.coordinates import *
+from utils.corridors import *
 from utils.files import *
+from utils.freight import *
+from utils.geometry import *
+from utils.graph import *
+from utils.incremental import *
+from utils.ingestion import *
+from utils.metrics import *
 from utils.spatial import *
 from utils.other import *
+from utils.parallel import *
+from utils.pipeline import *
+from utils.results import *
+from utils.simplification import *
+from utils.sections import *
+from utils.snapping import *
 
 # define the capacity of the smalles possible load unit, i.e., TEU
 MAX_TEU_CAPACITY_WEIGHT = 28.3  # tons
 MAX_TEU_CAPACITY_VOLUME = 33.1  # cubic meters
 MAX_TEU_CAPACITY_LOADING_LENGTH = 5.9  # meters
 MIN_UTILIZATION = 0.8  # minimum utilization of a load unit to be considered
-
-# STEP 0
-# create a map to visualize the data
-m = folium.Map(location=[50, 10], zoom_start=5)
-# add a base layer
-folium.TileLayer('openstreetmap').add_to(m)
-
-# STEP 1
-# read inputs excel to data frame and unify from_address, to_address, weight_in_tons, date
-df_input = pd.read_excel('inputs/shipments_2021.xlsx', sheet_name='Road_IMP', header=0, engine='openpyxl')
-
-df_input['from_address'] = df_input['Sender / Shipper Name'] + ', ' + df_input['Sender / Shipper City'] + ', ' + \
-                           df_input['Shipper Country']
-df_input['to_address'] = df_input['Consignee Name'] + ', ' + df_input['Consignee City'] + ', ' + \
-                         df_input['Consignee Country']
-df_input['weight_in_tons'] = df_input['Gross weight (kgs)'] / 1000
-df_input['date'] = pd.to_datetime(df_input['Shipment Date'])
-
-# STEP 2
-# create locations dataframe, geocode location and store in temp/locations.json - or add new locations
-print('Setting up locations')
-# check if locations.json exists and if so, read it to a dataframe. otherwise, create an empty dataframe
-df_locations = read_df_or_create_empty('temp/locations.json', ['location_id', 'address', 'geocoding_result'])
-print(f'Locations dataframe has {len(df_locations)} rows.')
-new_locations = 0
-
-# iterate over all rows in the input dataframe and check if the from_address and to_address already exist in the
-# locations dataframe
-# if not, geocode the address and add it to the locations dataframe
-# geocode locations using Google Maps Directions API - more accurate than openrouteservice
-for relation_index, relation in df_input.iterrows():
-    from_address = relation['from_address']
-    existing_from_address = df_locations[df_locations['address'] == from_address]
-
-    if not existing_from_address.empty:
-        from_location_id = existing_from_address.iloc[0]['location_id']
-        df_input.at[relation_index, 'from_location_id'] = from_location_id
-    else:
-        coordinates = google_geocode(from_address)
-        new_location_id = 1 if df_locations.empty else df_locations['location_id'].max() + 1
-        df_locations.loc[len(df_locations)] = [new_location_id, from_address, coordinates]
-        df_input.at[relation_index, 'from_location_id'] = new_location_id
-
-        new_locations += 1
-
-    to_address = relation['to_address']
-    existing_to_address = df_locations[df_locations['address'] == to_address]
-
-    if not existing_to_address.empty:
-        to_location_id = existing_to_address.iloc[0]['location_id']
-        df_input.at[relation_index, 'to_location_id'] = to_location_id
-    else:
-        coordinates = google_geocode(to_address)
-        new_location_id = 1 if df_locations.empty else df_locations['location_id'].max() + 1
-        df_locations.loc[len(df_locations)] = [new_location_id, to_address, coordinates]
-        df_input.at[relation_index, 'to_location_id'] = new_location_id
-
-        new_locations += 1
-
-print('New locations: ' + str(new_locations))
-
-# store the locations dataframe as a json file to prevent having to geocode the same address multiple times
-store_dataframe_as_json(df_locations, 'temp/locations.json')
-# make sure that the locations dataframe is always in the same format, encoding, ...
-df_locations = read_json_to_dataframe('temp/locations.json')
-if DEBUG:
-    df_locations.to_excel('temp/df_locations.xlsx', index=False)
-    df_input.to_excel('temp/df_input.xlsx', index=False)
-
-# convert google geocoding result to geojson format
-df_locations['geojson'] = df_locations['geocoding_result'].apply(
-    lambda x: {'type': 'Feature', 'properties': {'address': x[0]['formatted_address']},
-               'geometry': {"type": 'Point', "coordinates": [x[0]['geometry']['location']['lng'],
-                                                             x[0]['geometry']['location']['lat']]}})
-
-# add the locations to the map
-locations_layer = folium.GeoJson(df_locations.iloc[0]['geojson'], name="Locations",
-                                 style_function=style_locations)
-locations_layer.add_to(m)
-for location_index, location in df_locations.iterrows():
-    if location_index == 0:
-        continue
-    locations_layer.add_child(folium.GeoJson(df_locations.iloc[location_index]['geojson'], name="Locations",
-                                             style_function=style_locations))
-
-# STEP 3
-# create relations and shipments dataframe and store in temp folder as relations.json and shipments.json, respectively
-print('\n---------------------------------')
-print('Setting up relations and shipments')
-df_shipments = df_input[['date', 'from_location_id', 'to_location_id', 'weight_in_tons']]
-store_dataframe_as_json(df_shipments, 'temp/shipments.json')
-df_shipments = read_json_to_dataframe('temp/shipments.json')
-if DEBUG:
-    df_shipments.to_excel('temp/df_shipments.xlsx', index=False)
-
-# very similar logic to above, but now for the relations dataframe
-df_relations = read_df_or_create_empty('temp/relations.json', ['from_location_id', 'to_location_id', 'routeing_result'])
-print(f'Relations dataframe has {len(df_relations)} rows.')
-
-new_relations = 0
-for relation_index, relation in df_input.iterrows():
-    from_location_id = relation['from_location_id']
-    to_location_id = relation['to_location_id']
-
-    existing_address_pair = df_relations[
-        (df_relations['from_location_id'] == from_location_id) & (df_relations['to_location_id'] == to_location_id)
-        ]
-
-    if existing_address_pair.empty:
-        geocoding_result_from = \
-            df_locations.loc[df_locations['location_id'] == from_location_id, 'geocoding_result'].values[
-                0]
-        geocoding_result_to = \
-            df_locations.loc[df_locations['location_id'] == to_location_id, 'geocoding_result'].values[0]
-
-        coordinates_from = (
-            geocoding_result_from[0]['geometry']['location']['lng'],
-            geocoding_result_from[0]['geometry']['location']['lat'])
-        coordinates_to = (
-            geocoding_result_to[0]['geometry']['location']['lng'],
-            geocoding_result_to[0]['geometry']['location']['lat'])
-        if new_relations == 40:
-            # hold the script for 70 seconds to prevent exceeding the API limit
-            time.sleep(70)
-            print('Sleeping for 70 seconds to prevent exceeding the API limit')
-
-        coordinate_pair = (coordinates_from, coordinates_to)
-        routeing_result = ors_route(coordinate_pair)
-
-        df_relations.loc[len(df_relations)] = [from_location_id, to_location_id, routeing_result]
-        new_relations += 1
-
-print('New relations: ' + str(new_relations))
-
-store_dataframe_as_json(df_relations, 'temp/relations.json')
-df_relations = read_json_to_dataframe('temp/relations.json')
-
-if DEBUG:
-    df_relations.to_excel('temp/df_relations.xlsx', index=False)
-
-# add relations to the map
-relations_layer = folium.GeoJson(df_relations.iloc[0]['routeing_result'], name="Relations",
-                                 style_function=style_relations)
-relations_layer.add_to(m)
-for relation_index, relation in df_relations.iterrows():
-    if relation_index == 0:
-        continue
-    relations_layer.add_child(folium.GeoJson(relation['routeing_result'], name="Relations",
-                                             style_function=style_relations))
-
-# STEP 4
-# create intersection points
-print('\n---------------------------------')
-print('Create intersection points')
-# create a shapely geometry column for each relation
-df_relations['shapely_geometry'] = df_relations['routeing_result'].apply(
-    lambda x: shape(x['features'][0]['geometry']))
-
-# create intersection points and a dataframe to store already compared relations
-df_already_compared = read_df_or_create_empty('temp/already_compared.json', ['relation_id_1', 'relation_id_2'])
-print(f'Already compared dataframe has {len(df_already_compared)} rows.')
-df_no_point_or_line = read_df_or_create_empty('temp/no_point_or_line.json',
-                                              ['relation_id_1', 'relation_id_2', 'shapely_intersection'])
-print(f'No point or line dataframe has {len(df_no_point_or_line)} rows.')
-df_intersection_points = read_df_or_create_empty('temp/intersection_points.json', ['geometry'])
-print(f'Intersection points dataframe has {len(df_intersection_points)} rows.')
-
-number_of_relations = len(df_relations)
-
-outer_relations_to_do = number_of_relations
-inner_relations_time = [0]
-for relation_index, relation in df_relations.iterrows():
-    print(
-        f'{outer_relations_to_do} outer iterations left,estimated duration: {outer_relations_to_do * statistics.mean(inner_relations_time)}')
-
-    inner_start = time.time()
-    df_intersection_points = append_point(df_intersection_points, relation['shapely_geometry'].coords[0])
-    df_intersection_points = append_point(df_intersection_points, relation['shapely_geometry'].coords[-1])
-    for relation2_index, relation2 in df_relations.iterrows():
-        # if only integers are used, the pd.read_json function will eliminate the _ and convert the column to int64, which hinders comparison
-        relation_id_1 = 'r' + str(relation['from_location_id']) + '_r' + str(relation['to_location_id'])
-        relation_id_2 = 'r' + str(relation2['from_location_id']) + '_r' + str(
-            relation2['to_location_id'])
-
-        if relation_index == relation2_index:
-            continue
+# the utilization of a load unit is the one of its binding constraint, i.e., the greatest ratio of the shipped amount
+# to the capacity of weight, volume and loading length
+LOAD_UNIT_CAPACITIES = {'weight_in_tons': MAX_TEU_CAPACITY_WEIGHT,
+                        'volume_in_cubic_meters': MAX_TEU_CAPACITY_VOLUME,
+                        'loading_length_in_meters': MAX_TEU_CAPACITY_LOADING_LENGTH}
+
+# limits of the Google Maps geocoding requests
+GEOCODING_WORKERS = 8  # maximum number of concurrent requests
+GEOCODING_REQUESTS_PER_SECOND = 40  # Google Maps allows 50 requests per second
+
+# limits of the openrouteservice routeing requests
+ORS_BASE_URL = 'https://api.openrouteservice.org'  # e.g., a local openrouteservice instance
+ROUTEING_WORKERS = 4  # maximum number of requests in flight
+ROUTEING_REQUESTS_PER_MINUTE = 40  # directions quota of the free openrouteservice plan
+
+# cache of the geocoding and routeing results
+CACHE_PATH = 'temp/responses.sqlite'
+CACHE_TTL_DAYS = 365  # results older than this are requested again
+CACHE_MAX_ENTRIES = 1000000  # the least recently used results exceeding this are deleted
+
+# intersection points closer than this are considered the same point, in degrees (1e-5 degrees are about 1 m)
+SNAPPING_TOLERANCE = 1e-5
+
+# memory-mapped store of the route coordinates of all relations
+ROUTES_PATH = 'temp/routes'
+ROUTE_COORDINATE_DTYPE = np.float64  # np.float32 halves the size at the cost of about 1 m precision
+SIMPLIFIED_ROUTES_PATH = 'temp/routes_simplified'
+
+# results of STEP 4 and STEP 5, the results of the simplified routes are kept apart per tolerance, so they are never
+# mixed with the results of the original routes
+RESULTS_PATH = 'temp'
+SIMPLIFIED_RESULTS_PATH = 'temp/simplified_{tolerance:g}'
+
+# columns of the input files read in STEP 1, the other columns are not read
+INPUT_COLUMNS = ['Shipment Date', 'Sender / Shipper Name', 'Sender / Shipper City', 'Shipper Country', 'Consignee Name',
+                 'Consignee City', 'Consignee Country', 'Gross weight (kgs)', 'Volume (cbm)', 'Loading meters']
+
+# fingerprints of the inputs and outputs of the stages of the last run
+CHECKPOINTS_PATH = 'temp/checkpoints.json'
+
+# names of the stages, i.e., STEP 1 to STEP 6
+STAGES = ['read', 'geocode', 'route', 'intersect', 'sections', 'evaluate']
+
+
+def parse_arguments(argv: list = None):
+    """
+    Parse the command line arguments
+    :param argv: list of arguments, None for sys.argv
+    :return: argparse.Namespace
+    """
+    parser = argparse.ArgumentParser(
+        description='Find promising consolidation options for combined road-rail transport. The steps are run as '
+                    'named stages, a stage whose inputs and parameters did not change since its last run is skipped.')
+    parser.add_argument('--input', nargs='+', default=['inputs/shipments_2021.xlsx'],
+                        help='Excel, CSV or Parquet files with the shipments, or directories of them, read in chunks '
+                             '(default: inputs/shipments_2021.xlsx)')
+    parser.add_argument('--sheet', nargs='+', default=['Road_IMP'],
+                        help="sheets of the Excel files, '*' for all sheets (default: Road_IMP)")
+    parser.add_argument('--chunk-size', type=int, default=100000,
+                        help='number of input rows read at once in STEP 1 (default: 100000)')
+    parser.add_argument('--from-stage', choices=STAGES, default=None,
+                        help='first stage to run, the outputs of the previous stages are loaded (default: read)')
+    parser.add_argument('--to-stage', choices=STAGES, default=None,
+                        help='last stage to run (default: evaluate)')
+    parser.add_argument('--force', action='store_true',
+                        help='run the stages even if their inputs did not change since their last run')
+    parser.add_argument('--min-utilization', type=float, default=MIN_UTILIZATION,
+                        help=f'minimum utilization of a load unit to be considered (default: {MIN_UTILIZATION})')
+    parser.add_argument('--time-bucket', choices=TIME_BUCKETS, default='week',
+                        help='the shipments of a relation in the same day, week or month share load units, a bucket is '
+                             'counted if its load unit is utilized by more than --min-utilization (default: week)')
+    parser.add_argument('--consolidate-freight', action='store_true',
+                        help='sum the shipments of all relations covering a section combination per time bucket before '
+                             'checking the utilization, instead of summing the freight amounts of the relations')
+    parser.add_argument('--min-freight', type=float, default=100,
+                        help='minimum freight amount of the evaluated section combinations in TEU (default: 100)')
+    parser.add_argument('--min-distance', type=float, default=100,
+                        help='minimum distance of the evaluated section combinations in km (default: 100)')
+    parser.add_argument('--corridors', choices=['relations', 'graph'], default='relations',
+                        help='enumerate the section combinations of STEP 5 relation by relation, or as paths of a graph '
+                             'of the deduplicated sections covered by the relations traversing all of their sections, '
+                             'which does not support --incremental (default: relations)')
+    parser.add_argument('--push-down', action='store_true',
+                        help='only create the section combinations in STEP 5 whose freight amount and distance exceed '
+                             '--min-freight and --min-distance, skipping the others during the enumeration')
+    parser.add_argument('--top-k', type=int, default=None,
+                        help='only create the k best section combinations by --rank-by in STEP 5, implies --push-down '
+                             '(default: all)')
+    parser.add_argument('--rank-by', choices=list(RANKING_OBJECTIVES), default='freight_amount',
+                        help='objective of --top-k, freight_distance is the product of both (default: freight_amount)')
+    parser.add_argument('--plot', default='output/subsections_paretofront_small.svg',
+                        help='path of the evaluation plot (default: output/subsections_paretofront_small.svg)')
+    parser.add_argument('--map', default='temp/map.html', help='path of the map (default: temp/map.html)')
+    parser.add_argument('--metrics', default='output/metrics',
+                        help='path of the report of the timers and counters of the run without extension, written as '
+                             '.json and .csv (default: output/metrics)')
+    parser.add_argument('--profile', choices=['cprofile', 'sampling'], default=None,
+                        help='profile every stage that is run with cProfile or with a sampling profiler and write the '
+                             'profiles to output/profile_<stage>.prof or .folded (default: off)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes to intersect the relation pairs in STEP 4 (default: 1)')
+    parser.add_argument('--engine', choices=['shapely', 'edges', 'compare'], default='shapely',
+                        help='corridor engine of STEP 4: intersect the relation pairs with shapely, hash the shared '
+                             'edges of the routes, or run both and write a comparison report to '
+                             'temp/engine_comparison.json while continuing with the shapely results (default: shapely)')
+    parser.add_argument('--simplify', type=float, default=0,
+                        help='simplify the routes before STEP 4 with this tolerance in degrees, keeping shared '
+                             'segments identical, store the results in temp/simplified_<tolerance> and write a report '
+                             'compared to the last run without simplification to temp/simplification_report.json '
+                             '(default: 0, i.e., off)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only intersect new or changed relations in STEP 4, only split the relations whose route '
+                             'or intersection points changed in STEP 5 and update the freight of the affected section '
+                             'combinations, based on the relation state of the previous run in '
+                             'temp/relation_state.parquet')
+    args = parser.parse_args(argv)
+    if args.corridors == 'graph' and args.incremental:
+        parser.error('--corridors graph does not support --incremental')
+    return args
+
+
+def read_shipments(context: dict):
+    """
+    STEP 1
+    Read the input files in chunks and unify from_address, to_address, weight_in_tons, date and, if the input has them,
+    volume_in_cubic_meters and loading_length_in_meters. Only the needed columns are read and the addresses are
+    encoded as categoricals, so the input is never held in memory as a whole.
+    :param context: dict of the pipeline, see main
+    :return: None
+    """
+    args = context['args']
+    sheets = None if args.sheet == ['*'] else args.sheet
+    address_encoder = AddressEncoder()
+    # every chunk is appended to the stored input, only the categories of the addresses grow with the input
+    writer = ParquetChunkWriter('temp/input.parquet', INPUT_SCHEMA)
+    rows = 0
+    try:
+        for df_chunk in read_chunks(args.input, INPUT_COLUMNS, sheets=sheets, chunk_size=args.chunk_size):
+            df_chunk = pd.DataFrame({
+                'date': pd.to_datetime(df_chunk['Shipment Date']),
+                'from_address': join_address_parts([df_chunk['Sender / Shipper Name'],
+                                                    df_chunk['Sender / Shipper City'], df_chunk['Shipper Country']]),
+                'to_address': join_address_parts([df_chunk['Consignee Name'], df_chunk['Consignee City'],
+                                                  df_chunk['Consignee Country']]),
+                'weight_in_tons': df_chunk['Gross weight (kgs)'] / 1000,
+                # the volume and loading length only limit the load units if the input has them, NaN otherwise
+                'volume_in_cubic_meters': df_chunk['Volume (cbm)'],
+                'loading_length_in_meters': df_chunk['Loading meters']})
+            rows += len(df_chunk)
+            # shipments without a complete sender or consignee address cannot be geocoded
+            df_chunk = df_chunk.dropna(subset=['from_address', 'to_address'])
+            writer.write(address_encoder.decode(address_encoder.encode(df_chunk, ['from_address', 'to_address']),
+                                                ['from_address', 'to_address']))
+            print(f'{rows} rows read')
+    finally:
+        writer.close()
+    print(f'{writer.rows} of {rows} shipments read, {len(address_encoder.categories)} addresses.')
+    context['metrics'].count('read.rows', rows)
+    context['metrics'].count('read.rows_without_address', rows - writer.rows)
+
+    # the compact table of the shipments is read back, the input files are not held in memory
+    load_shipments(context)
+
+
+def load_shipments(context: dict):
+    """
+    Load the outputs of STEP 1
+    :param context: dict of the pipeline, see main
+    :return: None
+    """
+    context['df_input'] = read_stored_dataframe('temp/input', INPUT_SCHEMA)
+
+
+def geocode_locations(context: dict):
+    """
+    STEP 2
+    Create the locations DataFrame, geocode the new addresses and store the locations in temp/locations.json and the
+    shipments with their location ids in temp/shipments.parquet
+    :param context: dict of the pipeline, see main
+    :return: None
+    """
+    df_input = context['df_input']
+    response_cache = context['response_cache']
+    print('Setting up locations')
+    # check if locations.json exists and if so, read it to a dataframe. otherwise, create an empty dataframe
+    df_locations = read_df_or_create_empty('temp/locations.json', ['location_id', 'address', 'geocoding_result'])
+    print(f'Locations dataframe has {len(df_locations)} rows.')
+
+    # index the known addresses by their location id, so every address is looked up in O(1)
+    address_index = dict(zip(df_locations['address'], df_locations['location_id']))
+
+    # get the unique from_address and to_address values in the order of their first occurrence (row by row) and check
+    # if they already exist in the locations dataframe
+    # if not, geocode the addresses concurrently and add them to the locations dataframe
+    # geocode locations using Google Maps Directions API - more accurate than openrouteservice
+    unique_addresses = get_addresses_in_order(df_input['from_address'], df_input['to_address'])
+    missing_addresses = [address for address in unique_addresses if address not in address_index]
+    geocoding_results = geocode_addresses(missing_addresses, max_workers=GEOCODING_WORKERS,
+                                          requests_per_second=GEOCODING_REQUESTS_PER_SECOND, cache=response_cache)
+    response_cache.flush()
+
+    next_location_id = 1 if df_locations.empty else df_locations['location_id'].max() + 1
+    new_location_ids = range(next_location_id, next_location_id + len(missing_addresses))
+    address_index.update(zip(missing_addresses, new_location_ids))
+    if missing_addresses:
+        df_locations = pd.concat([df_locations, pd.DataFrame({'location_id': new_location_ids,
+                                                              'address': missing_addresses,
+                                                              'geocoding_result': [geocoding_results[address]
+                                                                                   for address in missing_addresses]})],
+                                 ignore_index=True)
+    new_locations = len(missing_addresses)
+
+    df_input = df_input.copy()
+    df_input['from_location_id'] = df_input['from_address'].map(address_index)
+    df_input['to_location_id'] = df_input['to_address'].map(address_index)
+
+    print('New locations: ' + str(new_locations))
+    context['metrics'].count('geocode.new_locations', new_locations)
+
+    # store the locations dataframe as a json file to prevent having to geocode the same address multiple times
+    store_dataframe_as_json(df_locations, 'temp/locations.json')
+    if DEBUG:
+        df_locations.to_excel('temp/df_locations.xlsx', index=False)
+        df_input.to_excel('temp/df_input.xlsx', index=False)
+
+    # the schema makes sure that the shipments dataframe is always in the same format, without re-reading the stored
+    # file
+    df_shipments = apply_schema(df_input, SHIPMENT_SCHEMA)
+    store_dataframe(df_shipments, 'temp/shipments', SHIPMENT_SCHEMA)
+    if DEBUG:
+        df_shipments.to_excel('temp/df_shipments.xlsx', index=False)
+
+    context['df_locations'] = df_locations
+    context['df_shipments'] = df_shipments
+
+
+def load_locations(context: dict):
+    """
+    Load the outputs of STEP 2
+    :param context: dict of the pipeline, see main
+    :return: None
+    """
+    context['df_locations'] = read_json_to_dataframe('temp/locations.json')
+    context['df_shipments'] = read_stored_dataframe('temp/shipments', SHIPMENT_SCHEMA)
+
+
+def route_relations(context: dict):
+    """
+    STEP 3
+    Create the relations of the shipments, route them and store their routes in a memory-mapped coordinate store,
+    optionally simplified
+    :param context: dict of the pipeline, see main
+    :return: None
+    """
+    args = context['args']
+    df_locations = context['df_locations']
+    df_shipments = context['df_shipments']
+    response_cache = context['response_cache']
+    print('\n---------------------------------')
+    print('Setting up relations and shipments')
+
+    # index the coordinates of the locations by their location id
+    location_coordinates = {
+        location_id: (geocoding_result[0]['geometry']['location']['lng'],
+                      geocoding_result[0]['geometry']['location']['lat'])
+        for location_id, geocoding_result in zip(df_locations['location_id'], df_locations['geocoding_result'])}
+
+    # the routes are kept in the response cache, i.e., temp/relations.json is only written for other tools and does not
+    # have to be parsed at startup. the routes of an existing temp/relations.json are imported into the cache once
+    if response_cache.count('route') == 0 and os.path.isfile('temp/relations.json'):
+        df_previous_relations = read_json_to_dataframe('temp/relations.json')
+        for from_location_id, to_location_id, routeing_result in zip(df_previous_relations['from_location_id'],
+                                                                     df_previous_relations['to_location_id'],
+                                                                     df_previous_relations['routeing_result']):
+            if from_location_id in location_coordinates and to_location_id in location_coordinates:
+                coordinate_pair = (location_coordinates[from_location_id], location_coordinates[to_location_id])
+                response_cache.set('route', route_key(coordinate_pair), routeing_result)
+        print(f'Imported {response_cache.count("route")} routes of temp/relations.json into the cache.')
+
+    # get the relations of the shipments in the order of their first occurrence
+    df_relations = df_shipments[['from_location_id', 'to_location_id']].drop_duplicates().reset_index(drop=True)
+    print(f'Relations dataframe has {len(df_relations)} rows.')
+
+    # get the routes of the relations from the cache or route them concurrently within the openrouteservice quota
+    coordinate_pairs = [(location_coordinates[from_location_id], location_coordinates[to_location_id])
+                        for from_location_id, to_location_id in
+                        zip(df_relations['from_location_id'], df_relations['to_location_id'])]
+    cache_misses = response_cache.misses
+    df_relations['routeing_result'] = route_coordinate_pairs(coordinate_pairs, max_workers=ROUTEING_WORKERS,
+                                                             requests_per_minute=ROUTEING_REQUESTS_PER_MINUTE,
+                                                             base_url=ORS_BASE_URL, cache=response_cache)
+    response_cache.flush()
+    new_relations = response_cache.misses - cache_misses
+
+    print('New relations: ' + str(new_relations))
+    context['metrics'].count('route.new_relations', new_relations)
+
+    store_dataframe_as_json(df_relations, 'temp/relations.json')
+
+    if DEBUG:
+        df_relations.to_excel('temp/df_relations.xlsx', index=False)
+
+    # keep only the coordinates, summary distance and bounding box of every route in a memory-mapped store, the full
+    # responses are not needed anymore and the worker processes of STEP 4 slice the routes from the store
+    route_store = CoordinateStore.from_routeing_results(df_relations['routeing_result'].tolist(), ROUTES_PATH,
+                                                        dtype=ROUTE_COORDINATE_DTYPE)
+    df_relations = df_relations.drop(columns='routeing_result')
+    store_dataframe(df_relations, 'temp/relations', RELATION_SCHEMA, json_export=False)
+    context['df_relations'] = df_relations
+    context['route_store'] = route_store
+
+    # optionally simplify the routes, so the intersections and splits of STEP 4 and STEP 5 have to handle fewer
+    # vertices
+    if args.simplify > 0:
+        print('\n---------------------------------')
+        print(f'Simplifying routes with a tolerance of {args.simplify}')
+        simplification_start = time.time()
+        simplified_route_store = simplify_routes(route_store, args.simplify, SNAPPING_TOLERANCE,
+                                                 SIMPLIFIED_ROUTES_PATH, dtype=ROUTE_COORDINATE_DTYPE)
+        simplification_report = get_simplification_report(route_store, simplified_route_store,
+                                                          time.time() - simplification_start)
+        print(f'Simplified routes from {simplification_report["vertices_before"]} to '
+              f'{simplification_report["vertices_after"]} vertices.')
+        context['route_store'] = simplified_route_store
+        context['simplification_report'] = simplification_report
+
+
+def load_relations(context: dict):
+    """
+    Load the outputs of STEP 3
+    :param context: dict of the pipeline, see main
+    :return: None
+    """
+    context['df_relations'] = read_stored_dataframe('temp/relations', RELATION_SCHEMA)
+    context['route_store'] = CoordinateStore.open(context['routes_path'])
+
+
+def create_intersection_points(context: dict):
+    """
+    STEP 4
+    Create the intersection points of the relations and get the intersection points on every relation
+    :param context: dict of the pipeline, see main
+    :return: None
+    """
+    args = context['args']
+    metrics = context['metrics']
+    results_path = context['results_path']
+    df_relations = context['df_relations']
+    route_store = context['route_store']
+    print('\n---------------------------------')
+    print('Create intersection points')
+    context['step_4_start'] = time.time()
+
+    # detect the relations that are new or whose route changed since the previous run
+    route_fingerprints = get_route_fingerprints(route_store)
+    df_previous_relation_state = read_stored_dataframe(os.path.join(results_path, 'relation_state'),
+                                                       RELATION_STATE_SCHEMA)
+    changed_routes = get_changed_relations(
+        df_relations[['from_location_id', 'to_location_id']].assign(route_fingerprint=route_fingerprints),
+        df_previous_relation_state, ['route_fingerprint'])
+    if args.incremental:
+        print(f'{len(changed_routes)} of {len(df_relations)} relations are new or have a changed route.')
+    # create the shapely geometry of each relation from the route store
+    relation_geometries = route_store.linestrings()
+
+    # intersection points closer than SNAPPING_TOLERANCE are snapped to one canonical point, the ids of the stored
+    # intersection points are kept
+    intersection_points = IntersectionPointIndex.from_dataframe(
+        read_stored_dataframe(os.path.join(results_path, 'intersection_points'), {'geometry': GEOMETRY}),
+        SNAPPING_TOLERANCE)
+    print(f'Intersection points index has {len(intersection_points)} points.')
+
+    shapely_start = time.time()
+    if args.engine != 'edges':
+        # intersect the relation pairs with shapely, the ledger of already compared relation pairs allows resuming
+        # the endpoints of the simplified routes differ from the ones of the original routes, so they get their own
+        # ledger
+        if args.simplify > 0:
+            already_compared = ComparisonLedger(os.path.join(results_path, 'already_compared.jsonl'))
         else:
-            # check if the relation pair has already been compared and if so, skip
-            existing_comparison = df_already_compared[
-                (df_already_compared['relation_id_1'] == relation_id_1) & (
-                        df_already_compared['relation_id_2'] == relation_id_2)
-                ]
-            if not existing_comparison.empty:
-                continue
-
-            # calculate intersection and add to the dataframe
-            intersection = relation['shapely_geometry'].intersection(relation2['shapely_geometry'])
-            df_already_compared = pd.concat([df_already_compared, pd.DataFrame([{'relation_id_1': relation_id_1, 'relation_id_2': relation_id_2}])], ignore_index=True)
-
-            # extract intersection points from the intersection and add to the intersection points dataframe
-            if not intersection.is_empty:
-                if isinstance(intersection, LineString):
-                    df_intersection_points = append_point(df_intersection_points, intersection.coords[0])
-                    df_intersection_points = append_point(df_intersection_points, intersection.coords[-1])
-                if isinstance(intersection, MultiLineString):
-                    # try to merge the lines to one line - works only for contiguous lines
-                    intersection = ops.linemerge(intersection)
-                    if isinstance(intersection, MultiLineString):
-                        # if the lines are not contiguous, add the start and end point of each line to the dataframe
-                        print(
-                            f'MultiLineString of {relation_id_1} and {relation_id_2} has {len(intersection.geoms)} lines')
-                        for linestring in intersection.geoms:
-                            df_intersection_points = append_point(df_intersection_points, linestring.coords[0])
-                            df_intersection_points = append_point(df_intersection_points, linestring.coords[-1])
-                    else:
-                        # if the lines are contiguous, add the start and end point of the line to the dataframe
-                        df_intersection_points = append_point(df_intersection_points, intersection.coords[0])
-                        df_intersection_points = append_point(df_intersection_points, intersection.coords[-1])
-                elif isinstance(intersection, GeometryCollection):
-                    # try to get all lines from the geometry collection and merge them to one line
-                    mls = MultiLineString(
-                        [geometry for geometry in intersection.geoms if isinstance(geometry, LineString)])
-                    intersection = ops.linemerge(mls)
-                    # if the lines are contiguous, add the start and end point of the line to the dataframe
-                    if isinstance(intersection, LineString):
-                        df_intersection_points = append_point(df_intersection_points, intersection.coords[0])
-                        df_intersection_points = append_point(df_intersection_points, intersection.coords[-1])
-                    elif isinstance(intersection, MultiLineString):
-                        # if the lines are not contiguous, add the start and end point of each line to the dataframe
-                        for geometry in intersection.geoms:
-                            if isinstance(geometry, LineString):
-                                df_intersection_points = append_point(df_intersection_points, geometry.coords[0])
-                                df_intersection_points = append_point(df_intersection_points, geometry.coords[-1])
-                    else:
-                        print(
-                            f'Error: A GeometryCollection Geometry of intersection of {relation_id_1} and {relation_id_2} is not a line or point, but a {type(geometry)}')
-                elif isinstance(intersection, Point):
+            already_compared = ComparisonLedger('temp/already_compared.jsonl',
+                                                legacy_path='temp/already_compared.json')
+        print(f'Already compared ledger has {len(already_compared)} relation pairs.')
+        df_no_point_or_line = read_df_or_create_empty('temp/no_point_or_line.json',
+                                                      ['relation_id_1', 'relation_id_2', 'shapely_intersection'])
+        print(f'No point or line dataframe has {len(df_no_point_or_line)} rows.')
+
+        number_of_relations = len(df_relations)
+
+        # only intersect relation pairs whose bounding boxes overlap, every unordered pair is intersected only once
+        with metrics.timer('intersect.candidate_pairs'):
+            candidate_relation_pairs, pruned_relation_pairs = get_candidate_relation_pairs(route_store.bounds)
+        metrics.count('intersect.candidate_pairs', sum(map(len, candidate_relation_pairs.values())))
+        metrics.count('intersect.pruned_pairs', pruned_relation_pairs)
+        print(f'{pruned_relation_pairs} of {number_of_relations * (number_of_relations - 1) // 2} relation pairs '
+              f'pruned by the bounding box pre-filter.')
+
+        # if only integers are used, the pd.read_json function will eliminate the _ and convert the column to int64,
+        # which hinders comparison
+        relation_ids = ('r' + df_relations['from_location_id'].astype(str) + '_r' +
+                        df_relations['to_location_id'].astype(str)).tolist()
+
+        # the stored endpoints of relations whose route changed are outdated, without a previous state they are kept
+        if args.incremental and not df_previous_relation_state.empty:
+            discarded_relation_pairs = already_compared.discard_relations(
+                {relation_ids[relation_index] for relation_index in changed_routes})
+            print(f'{discarded_relation_pairs} relation pairs with a changed route discarded from the ledger.')
+
+        def is_unchanged_pair(relation_index: int, relation2_index: int) -> bool:
+            # the intersection points of two unchanged relations are already contained in the stored intersection
+            # points
+            return args.incremental and relation_index not in changed_routes and relation2_index not in changed_routes
+
+        # intersect the relation pairs that have not been compared yet in a process pool and add them to the ledger,
+        # the loop below then only collects the endpoints from the ledger
+        if args.workers > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+            print('Parallel intersection requires the fork start method, which is not available, using 1 worker '
+                  'instead.')
+        elif args.workers > 1:
+            pending_relation_pairs = [(relation_index, relation2_index)
+                                      for relation_index, relation2_indices in candidate_relation_pairs.items()
+                                      for relation2_index in relation2_indices
+                                      if not is_unchanged_pair(relation_index, relation2_index) and
+                                      not already_compared.contains(relation_ids[relation_index],
+                                                                    relation_ids[relation2_index])]
+            print(f'Intersecting {len(pending_relation_pairs)} relation pairs with {args.workers} workers.')
+            with metrics.timer('intersect.parallel'):
+                for (relation_index, relation2_index), endpoints in intersect_relation_pairs_parallel(
+                        context['routes_path'], relation_ids, pending_relation_pairs, args.workers, metrics):
+                    already_compared.add(relation_ids[relation_index], relation_ids[relation2_index], endpoints)
+                already_compared.flush()
+            metrics.count('intersect.pairs_intersected_parallel', len(pending_relation_pairs))
+
+        for relation_index in range(number_of_relations):
+            metrics.progress('Intersecting relations', relation_index, number_of_relations)
+            relation_geometry = relation_geometries[relation_index]
+            intersection_points.snap(*relation_geometry.coords[0])
+            intersection_points.snap(*relation_geometry.coords[-1])
+            for relation2_index in candidate_relation_pairs[relation_index]:
+                if is_unchanged_pair(relation_index, relation2_index):
+                    metrics.count('intersect.pairs_skipped_unchanged')
                     continue
-                # if intersection is a point, the relations do not have a common section that can be consolidated
-                # so the point is not needed
-                #    df_intersection_points = df_intersection_points.append({'geometry': intersection},
-                #                                                           ignore_index=True)
+                relation_id_1 = relation_ids[relation_index]
+                relation_id_2 = relation_ids[relation2_index]
+
+                # check if the relation pair has already been compared (in either order) and if so, reuse the stored
+                # endpoints instead of intersecting again
+                if already_compared.contains(relation_id_1, relation_id_2):
+                    endpoints = already_compared.get_endpoints(relation_id_1, relation_id_2)
+                    metrics.count('intersect.pairs_from_ledger')
                 else:
-                    print(
-                        f'Error: intersection of {relation_id_1} and {relation_id_2} is not a line or point, but a {type(intersection)}')
-    inner_relations_time.append(time.time() - inner_start)
-    outer_relations_to_do -= 1
-
-df_intersection_points['geometry'] = df_intersection_points['geometry'].apply(
-    lambda x: json.dumps(shapely.geometry.mapping(x)) if isinstance(x, Point) else x)
-df_intersection_points = df_intersection_points.drop_duplicates('geometry')
-
-# store the created dataframes as json files
-store_dataframe_as_json(df_already_compared, 'temp/already_compared.json')
-# store_dataframe_as_json(df_no_point_or_line, 'temp/no_point_or_line.json')
-store_dataframe_as_json(df_intersection_points, 'temp/intersection_points.json')
-df_intersection_points = read_json_to_dataframe('temp/intersection_points.json')
-
-# add intersection points to the map
-intersection_points_layer = folium.GeoJson(df_intersection_points.iloc[0]['geometry'], name="Intersection Points",
-                                           marker=get_intersection_point_marker())
-intersection_points_layer.add_to(m)
-for ip_index, ip in df_intersection_points.iterrows():
-    if ip_index == 0:
-        continue
-    intersection_points_layer.add_child(folium.GeoJson(df_intersection_points.iloc[ip_index]['geometry'],
-                                                       marker=get_intersection_point_marker()))
-
-# convert the intersection points to shapely points
-df_intersection_points['geometry'] = df_intersection_points['geometry'].apply(
-    lambda x: shapely.geometry.shape(json.loads(x)))
-
-print(f'{len(df_intersection_points)} intersection points found.')
-
-# STEP 5
-# create sections by calculating all intersection-free sections
-print('\n---------------------------------')
-print('Setting up sections and contiguous section combinations')
-
-# create a dataframe to store the sections
-df_sections = read_df_or_create_empty('temp/sections.json',
-                                      ['from_intersection_point_index',
-                                       'to_intersection_point_index',
-                                       'geometry'])
-if not df_sections.empty:
-    df_sections['geometry'] = df_sections['geometry'].apply(
-        lambda x: shapely.geometry.shape(json.loads(x)))
-
-# create a dataframe to store the contiguous section combinations
-df_contiguous_section_combinations = read_df_or_create_empty('temp/contiguous_section_combinations.json',
-                                                             ['from_intersection_point_index',
-                                                              'to_intersection_point_index',
-                                                              'geometry', 'distance', 'freight_amount'])
-
-if not df_contiguous_section_combinations.empty:
-    df_contiguous_section_combinations['geometry'] = df_contiguous_section_combinations['geometry'].apply(
-        lambda x: shapely.geometry.shape(json.loads(x)))
-
-# iterate over relations
-for relation_index, relation in df_relations.iterrows():
-    # create a dataframe to store the intersection points of the current relation
-    df_intersection_points_on_relation = pd.DataFrame(
-        columns=['intersection_point_index', 'geometry'])
-
-    print(f'Calculating sections for relation {relation_index} of {len(df_relations)}')
-
-    # iterate over intersection points
-    for intersection_point_index, intersection_point in df_intersection_points.iterrows():
-        # check if intersection point lies on the relation
-        if not relation['shapely_geometry'].intersection(intersection_point['geometry']).is_empty:
-            # if the intersection point lies on the relation, add it to the dataframe
-            df_intersection_points_on_relation = pd.concat([df_intersection_points_on_relation, pd.DataFrame([{'intersection_point_index': intersection_point_index, 'geometry': intersection_point['geometry']}])], ignore_index=True)
-
-    # sort the intersection points by distance to the start of the relation
-    df_intersection_points_on_relation['distance_on_line'] = df_intersection_points_on_relation['geometry'].apply(
-        lambda x: relation['shapely_geometry'].project(x))
-    df_intersection_points_on_relation = df_intersection_points_on_relation.sort_values(by=['distance_on_line'])
-
-    # print error when no intersection points were found
-    if len(df_intersection_points_on_relation) == 0:
-        print(f'No intersection points found for relation {relation["from_location_id"]}_{relation["to_location_id"]}')
-        continue
-
-    remaining_linestring = relation['shapely_geometry']
-    df_sections_on_relation = pd.DataFrame(
-        columns=['from_intersection_point_index', 'to_intersection_point_index', 'geometry'])
-    # iterate over the intersection points of the relation
-    intersection_point_index = -1
-    for ipx, intersection_point in df_intersection_points_on_relation.iterrows():
-        intersection_point_index += 1
-        # if the current intersection point is the start of the relation, continue
-        if intersection_point['geometry'] == Point(relation['shapely_geometry'].coords[0]):
+                    # calculate intersection and add the start and end points of common sections to the dataframe
+                    with metrics.timer('intersect.pair_intersection'):
+                        endpoints = get_intersection_endpoints(relation_geometry,
+                                                               relation_geometries[relation2_index],
+                                                               relation_id_1, relation_id_2, metrics)
+                    already_compared.add(relation_id_1, relation_id_2, endpoints)
+                    metrics.count('intersect.pairs_intersected')
+                for coords in endpoints:
+                    intersection_points.snap(*coords)
+            # persist the compared pairs of this outer iteration, so an interrupted run can be resumed
+            already_compared.flush()
+        metrics.progress('Intersecting relations', number_of_relations, number_of_relations)
+        already_compared.close()
+    shapely_duration = time.time() - shapely_start
+
+    # get the intersection points from the shared edges of the routes in one pass over all vertices
+    if args.engine != 'shapely':
+        corridors_start = time.time()
+        corridor_point_coords, corridor_points_on_relations = get_shared_edge_corridors(route_store,
+                                                                                        SNAPPING_TOLERANCE)
+        corridors_duration = time.time() - corridors_start
+        print(f'{len(corridor_point_coords)} intersection points found from shared edges in '
+              f'{corridors_duration:.1f} s.')
+        metrics.set('intersect.corridor_points', len(corridor_point_coords))
+        if args.engine == 'edges':
+            corridor_point_ids = [intersection_points.snap(x, y) for x, y in corridor_point_coords.tolist()]
+            context['points_on_relations'] = map_points_on_relations(corridor_points_on_relations, corridor_point_ids)
+
+    df_intersection_points = intersection_points.to_dataframe()
+
+    # store the created dataframes as Parquet files for the next run and as JSON files for other tools, the shapely
+    # points are kept in memory
+    # store_dataframe_as_json(df_no_point_or_line, 'temp/no_point_or_line.json')
+    store_dataframe(df_intersection_points, os.path.join(results_path, 'intersection_points'),
+                    INTERSECTION_POINT_SCHEMA)
+
+    print(f'{len(df_intersection_points)} intersection points found.')
+    metrics.set('intersect.intersection_points', len(df_intersection_points))
+
+    context['route_fingerprints'] = route_fingerprints
+    context['df_previous_relation_state'] = df_previous_relation_state
+    context['relation_geometries'] = relation_geometries
+    context['df_intersection_points'] = df_intersection_points
+
+    # get the intersection points lying on every relation, the edges engine already knows them
+    projection_start = time.time()
+    with metrics.timer('intersect.points_on_relations'):
+        get_points_on_relations(context)
+    shapely_duration += time.time() - projection_start
+
+    # compare both engines on the same relations
+    if args.engine == 'compare':
+        intersection_point_coords = np.array([(point.x, point.y) for point in df_intersection_points['geometry']])
+        engine_comparison = compare_corridor_engines(
+            {'shapely': get_corridor_summary(intersection_point_coords, context['points_on_relations'],
+                                             SNAPPING_TOLERANCE, shapely_duration),
+             'edges': get_corridor_summary(corridor_point_coords, corridor_points_on_relations, SNAPPING_TOLERANCE,
+                                           corridors_duration)},
+            {'shapely': intersection_point_coords, 'edges': corridor_point_coords}, SNAPPING_TOLERANCE)
+        print(f'Corridor engine comparison: {engine_comparison}')
+        with open('temp/engine_comparison.json', 'w') as f:
+            json.dump(engine_comparison, f, indent=4)
+
+
+def get_points_on_relations(context: dict):
+    """
+    Get the intersection points lying on every relation within the snapping tolerance, ordered along the relation,
+    unless the edges engine already found them
+    :param context: dict of the pipeline, see main
+    :return: None
+    """
+    if 'points_on_relations' in context:
+        return
+    df_intersection_points = context['df_intersection_points']
+    # index the intersection points, so every relation only tests the intersection points within its bounding box
+    intersection_point_tree = STRtree(df_intersection_points['geometry'].tolist())
+    intersection_point_coords = np.array([(point.x, point.y) for point in df_intersection_points['geometry']])
+    context['points_on_relations'] = [
+        get_points_on_linestring(geometry, intersection_point_tree, intersection_point_coords, SNAPPING_TOLERANCE)
+        for geometry in context['relation_geometries']]
+
+
+def load_intersection_points(context: dict):
+    """
+    Load the outputs of STEP 4
+    :param context: dict of the pipeline, see main
+    :return: None
+    """
+    args = context['args']
+    results_path = context['results_path']
+    route_store = context['route_store']
+    context['step_4_start'] = time.time()
+    context['route_fingerprints'] = get_route_fingerprints(route_store)
+    context['df_previous_relation_state'] = read_stored_dataframe(os.path.join(results_path, 'relation_state'),
+                                                                  RELATION_STATE_SCHEMA)
+    context['relation_geometries'] = route_store.linestrings()
+    context['df_intersection_points'] = read_stored_dataframe(os.path.join(results_path, 'intersection_points'),
+                                                              INTERSECTION_POINT_SCHEMA)
+    # the intersection points of the edges engine are found again in one linear pass, they are all stored already
+    if args.engine == 'edges':
+        intersection_points = IntersectionPointIndex.from_dataframe(context['df_intersection_points'],
+                                                                    SNAPPING_TOLERANCE)
+        corridor_point_coords, corridor_points_on_relations = get_shared_edge_corridors(route_store,
+                                                                                        SNAPPING_TOLERANCE)
+        context['points_on_relations'] = map_points_on_relations(
+            corridor_points_on_relations, [intersection_points.snap(x, y) for x, y in corridor_point_coords.tolist()])
+    get_points_on_relations(context)
+
+
+def create_sections(context: dict):
+    """
+    STEP 5
+    Create the sections of every relation between its intersection points and all contiguous section combinations
+    :param context: dict of the pipeline, see main
+    :return: None
+    """
+    args = context['args']
+    metrics = context['metrics']
+    results_path = context['results_path']
+    df_relations = context['df_relations']
+    df_shipments = context['df_shipments']
+    route_store = context['route_store']
+    points_on_relations = context['points_on_relations']
+    df_previous_relation_state = context['df_previous_relation_state']
+    df_intersection_points = context['df_intersection_points']
+    print('\n---------------------------------')
+    print('Setting up sections and contiguous section combinations')
+
+    # create a store for the sections and add the sections of previous runs
+    section_store = ColumnStore.from_dataframe(read_stored_dataframe(os.path.join(results_path, 'sections'),
+                                                                     SECTION_SCHEMA),
+                                               SECTION_DTYPES, defaults=GEOMETRY_REFERENCE_DEFAULTS)
+
+    # create a store for the contiguous section combinations with a hash index on the intersection point pair and add
+    # the section combinations of previous runs. the corridors of the section graph are enumerated from scratch, since
+    # their freight amounts depend on their paths, not only on their intersection points
+    combination_store = ColumnStore.from_dataframe(
+        read_stored_dataframe(os.path.join(results_path, 'contiguous_section_combinations'), COMBINATION_SCHEMA)
+        if args.corridors == 'relations' else create_empty_dataframe(COMBINATION_SCHEMA), COMBINATION_DTYPES,
+        key_columns=['from_intersection_point_index', 'to_intersection_point_index'],
+        defaults=GEOMETRY_REFERENCE_DEFAULTS)
+    stored_combinations = len(combination_store)
+
+    intersection_point_coords = np.array([(point.x, point.y) for point in df_intersection_points['geometry']])
+
+    # an inverted index from every intersection point to the relations passing through it
+    relations_at_intersection_points = get_relations_at_points(points_on_relations)
+
+    # group the shipments by relation and time bucket once and calculate the freight amount of every relation
+    freight_matrix = FreightMatrix.from_shipments(df_shipments, df_relations, args.time_bucket)
+    relation_freight_amounts = freight_matrix.get_relation_freight(LOAD_UNIT_CAPACITIES,
+                                                                   args.min_utilization).tolist()
+
+    def get_freight_amount(covering_relations: set) -> float:
+        # the freight amount of a section combination, from the rows of the freight matrix of its covering relations
+        if args.consolidate_freight:
+            return freight_matrix.get_combined_freight(sorted(covering_relations), LOAD_UNIT_CAPACITIES,
+                                                       args.min_utilization)
+        return sum(relation_freight_amounts[rel_index] for rel_index in sorted(covering_relations))
+
+    # the state of every relation determines its sections and the freight amounts of its section combinations. in the
+    # incremental mode, only relations whose route or intersection points changed are split again, the sections of the
+    # other relations are kept from the previous run, and the freight amounts of the section combinations on relations
+    # whose state changed are updated
+    df_relation_state = get_relation_state(df_relations, context['route_fingerprints'], points_on_relations,
+                                           relation_freight_amounts)
+    if args.incremental:
+        split_relations = get_changed_relations(df_relation_state, df_previous_relation_state,
+                                                ['route_fingerprint', 'intersection_point_ids'])
+        affected_relations = get_changed_relations(df_relation_state, df_previous_relation_state,
+                                                   ['route_fingerprint', 'intersection_point_ids', 'freight_amount'])
+        # the consolidated freight amounts depend on the time buckets of the shipments, not only on the freight
+        # amounts of the relations, so all section combinations are updated
+        if args.consolidate_freight:
+            affected_relations = set(range(len(df_relations)))
+        print(f'{len(split_relations)} relations are split again, {len(affected_relations)} relations are affected.')
+        kept_section_keys = get_section_keys(points_on_relations,
+                                             [relation_index for relation_index in range(len(df_relations))
+                                              if relation_index not in split_relations])
+        df_section_keys = section_store.to_dataframe()
+        section_store.keep(np.array([key in kept_section_keys for key in zip(
+            df_section_keys['from_intersection_point_index'].tolist(),
+            df_section_keys['to_intersection_point_index'].tolist())], dtype=bool))
+
+    # the sections of every relation, used to materialize the geometries of the section combinations
+    relation_sections = {}
+    push_down = args.push_down or args.top_k is not None
+
+    # iterate over relations
+    for relation_index, relation in df_relations.iterrows():
+        metrics.progress('Splitting relations', relation_index, len(df_relations))
+        if args.incremental and relation_index not in split_relations:
+            metrics.count('sections.relations_unchanged')
             continue
+        print(f'Calculating sections for relation {relation_index} of {len(df_relations)}')
 
-        # if the current intersection point is the end of the relation, add the remaining linestring to the dataframe
-        if intersection_point['geometry'] == Point(relation['shapely_geometry'].coords[-1]):
-            if isinstance(remaining_linestring, LineString):
-                df_sections_on_relation = pd.concat([df_sections_on_relation, pd.DataFrame([{'from_intersection_point_index':
-                         df_intersection_points_on_relation.iloc[intersection_point_index - 1][
-                             'intersection_point_index'],
-                     'to_intersection_point_index': df_intersection_points_on_relation.iloc[intersection_point_index][
-                         'intersection_point_index'],
-                     'geometry': remaining_linestring}])], ignore_index=True)
-            else:
-                print(f'Error: remaining_linestring is not a LineString, but a {type(remaining_linestring)}')
-            continue
+        intersection_point_indices, intersection_point_distances = points_on_relations[relation_index]
 
-        # split the relation at the intersection point
-        splitted_linestring = shapely.ops.split(remaining_linestring, intersection_point['geometry'])
-        # if the split operation returns a GeometryCollection with two elements, the relation was split correctly
-        if isinstance(splitted_linestring, GeometryCollection) and len(splitted_linestring.geoms) == 2:
-            section = splitted_linestring.geoms[0]
-            if isinstance(section, LineString):
-                # add the section to the dataframe
-                df_sections_on_relation = pd.concat([df_sections_on_relation, pd.DataFrame([{'from_intersection_point_index':
-                         df_intersection_points_on_relation.iloc[intersection_point_index - 1][
-                             'intersection_point_index'],
-                     'to_intersection_point_index': df_intersection_points_on_relation.iloc[intersection_point_index][
-                         'intersection_point_index'],
-                     'geometry': section}])], ignore_index=True)
-                
-                remaining_linestring = splitted_linestring.geoms[1]
-            else:
-                print(
-                    f'Error: Splitting the relation {relation["from_location_id"]}_{relation["to_location_id"]} did not work correctly.')
-                print(f'Error: section is not a LineString, but a {type(section)}')
-        else:
-            print(
-                f'Error: Splitting the relation {relation["from_location_id"]}_{relation["to_location_id"]} did not work correctly.')
-            print(f'Error: Splitted linestring: {splitted_linestring}')
-
-    # if the intersection points were removed from the section during splitting, add them again
-    df_sections_on_relation['geometry'] = df_sections_on_relation.apply(
-        lambda row: get_section_with_first_intersection_point(row, df_intersection_points), axis=1)
-
-    df_sections_on_relation['geometry'] = df_sections_on_relation.apply(
-        lambda row: get_section_with_second_intersection_point(row, df_intersection_points), axis=1)
-
-    # create all possible contiguous section combinations
-    number_of_sections_on_relation = len(df_sections_on_relation)
-    print(
-        f'Calculating contiguous section combinations for relation {relation["from_location_id"]}_{relation["to_location_id"]}, {number_of_sections_on_relation} sections')
-    rel_dist = relation['routeing_result']['features'][0]['properties']['summary']['distance']
-    # for every section a on the relation, create one contiguous section combination for all following sections b,
-    # starting with section a and ending with section b
-    for i in range(number_of_sections_on_relation):
-        from_intersection_point_index = df_sections_on_relation.iloc[i]['from_intersection_point_index']
-        from_intersection_point_geom = df_intersection_points.iloc[from_intersection_point_index]['geometry']
-        section_combination = df_sections_on_relation.iloc[i]['geometry']
-
-        # check if intersection points are on the section - if not, append them to the section
-        to_intersection_point_index = df_sections_on_relation.iloc[i]['to_intersection_point_index']
-        to_intersection_point_geom = df_intersection_points.iloc[to_intersection_point_index]['geometry']
-
-        for j in range(i, number_of_sections_on_relation):
-            to_intersection_point_index = df_sections_on_relation.iloc[j]['to_intersection_point_index']
-            to_intersection_point_geom = df_intersection_points.iloc[to_intersection_point_index]['geometry']
-
-            if to_intersection_point_index == from_intersection_point_index:
-                continue
-
-            new_section = df_sections_on_relation.iloc[j]['geometry']
-            if i == j:
-                section_combination_temp = section_combination
-            else:
-                mls = MultiLineString([section_combination, new_section])
-                section_combination_temp = shapely.ops.linemerge(mls)
-
-            if not isinstance(section_combination_temp, LineString):
-                print('old section combination:')
-                print(section_combination.wkt)
-                print('new section to be added:')
-                print(df_sections_on_relation.iloc[j]['geometry'].wkt)
-                print('from ip:')
-                print(from_intersection_point_geom.wkt)
-                print('to ip:')
-                print(to_intersection_point_geom.wkt)
-                print('section_combination_temp:')
-                print(section_combination_temp.wkt)
-                print(
-                    f'Error: section_combination from {from_intersection_point_index} to {to_intersection_point_index} is not a LineString, but a {type(section_combination_temp)}')
-                continue
-
-            section_combination = section_combination_temp
+        # print error when no intersection points were found
+        if len(intersection_point_indices) == 0:
+            print(f'No intersection points found for relation '
+                  f'{relation["from_location_id"]}_{relation["to_location_id"]}')
+            metrics.count('sections.relations_without_intersection_points')
+            continue
 
-            to_intersection_point_geom = df_intersection_points_on_relation[
-                df_intersection_points_on_relation['intersection_point_index'] == to_intersection_point_index][
-                'geometry'].iloc[0]
+        # split the relation at all of its intersection points in a single pass, every section starts and ends exactly
+        # at its intersection points
+        route_coords = np.asarray(route_store.coordinates(relation_index), dtype=np.float64)
+        with metrics.timer('sections.split'):
+            sections = RelationSections(
+                split_linestring_at_points(route_coords, intersection_point_coords[intersection_point_indices],
+                                           intersection_point_distances),
+                intersection_point_indices, intersection_point_distances,
+                route_length=get_cumulative_distances(route_coords)[-1],
+                relation_distance=route_store.distances[relation_index])
+        relation_sections[relation_index] = sections
+        metrics.count('sections.relations_split')
+        metrics.count('sections.sections', len(sections))
+        # sections of zero length between intersection points at the same distance along the relation are omitted
+        metrics.count('sections.zero_length_skipped', len(intersection_point_indices) - 1 - len(sections))
+        for i in range(len(sections)):
+            section_store.append(from_intersection_point_index=sections.from_intersection_point_indices[i],
+                                 to_intersection_point_index=sections.to_intersection_point_indices[i],
+                                 relation_index=relation_index, start_offset=sections.start_offsets[i],
+                                 end_offset=sections.end_offsets[i], geometry=None)
+
+        # with the constraints pushed down or the section graph, the section combinations of all relations are created
+        # after the loop
+        if push_down or args.corridors == 'graph':
+            continue
 
-            # check if the intersection point pair already exists in the contiguous section combinations dataframe
-            if len(df_contiguous_section_combinations[(df_contiguous_section_combinations[
-                                                           'from_intersection_point_index'] == from_intersection_point_index) & (
-                                                              df_contiguous_section_combinations[
-                                                                  'to_intersection_point_index'] == to_intersection_point_index)]) > 0:
+        # create all possible contiguous section combinations
+        print(
+            f'Calculating contiguous section combinations for relation {relation["from_location_id"]}_{relation["to_location_id"]}, {len(sections)} sections')
+        # every combination is a slice of the relation between two intersection points, its distance is derived from
+        # the distances of the intersection points along the relation and its geometry is only materialized for the
+        # export
+        for from_intersection_point_index, to_intersection_point_index, start_offset, end_offset, distance in \
+                sections.combinations():
+            # check if the intersection point pair already exists in the contiguous section combinations
+            if combination_store.contains(from_intersection_point_index, to_intersection_point_index):
                 if DEBUG:
                     print('Contiguous section combination already exists, skipping...')
+                metrics.count('sections.combinations_existing')
                 continue
 
-            # get relations that contain the current section combination
-            # either check if both intersection points are contained in the relation linestring
-            # or check if the section combination linestring is contained in the relation linestring -> probably slower
-
-            # calculate the distance of the section combination by projecting the intersection points on the relation,
-            # i.e., calculate the relative distance of the intersection points on the relation and multiply it with the
-            # relations' distance in km
-            ip_from_loc = relation['shapely_geometry'].project(from_intersection_point_geom, normalized=True)
-            ip_to_loc = relation['shapely_geometry'].project(to_intersection_point_geom, normalized=True)
-            factor = ip_to_loc - ip_from_loc
-            distance = rel_dist * factor
-            if distance < 0 or distance > rel_dist:
-                print(
-                    f'Calculated distance: {distance} km, ip_from_loc: {ip_from_loc}, ip_to_loc: {ip_to_loc}, rel_dist: {rel_dist}, from_intersection_point_index: {from_intersection_point_index}, to_intersection_point_index: {to_intersection_point_index}')
-            # iterate over all relations and check if the current section combination is contained in the relation
-            # if yes, add the relations' shipments to the section combination
-            freight_amount = 0
-            for rel_index, rel in df_relations.iterrows():
-                from_ip_on_relation = rel['shapely_geometry'].intersection(from_intersection_point_geom)
-                to_ip_on_relation = rel['shapely_geometry'].intersection(to_intersection_point_geom)
-
-                if not from_ip_on_relation.is_empty and not to_ip_on_relation.is_empty and \
-                        isinstance(from_ip_on_relation, Point) and isinstance(to_ip_on_relation, Point):
-                    # rel is a relation that contains the current section combination
-                    # add the shipments of rel to the section combination
-
-                    df_shipments_on_relation = get_shipments_for_relation(df_shipments, rel['from_location_id'],
-                                                                          rel['to_location_id'])
-
-                    # modify this according to your needs, i.e., weight, volume, loading meters, or a mix
-                    # Purpose: ignore loading units that are not well utilized
-
-                    # group the weight of the shipments by the calendar week of the shipment date
-                    df_shipments_on_relation_per_week = \
-                        df_shipments_on_relation.groupby(df_shipments_on_relation['date'].dt.strftime('%U'))[
-                            'weight_in_tons'].sum().to_frame(name='weight_in_tons').reset_index()
-
-                    df_shipments_on_relation_per_week[
-                        'utilization'] = df_shipments_on_relation_per_week['weight_in_tons'] / MAX_TEU_CAPACITY_WEIGHT
-
-                    freight_amount += \
-                        df_shipments_on_relation_per_week[
-                            df_shipments_on_relation_per_week['utilization'] > MIN_UTILIZATION][
-                            'weight_in_tons'].sum()
-
-                    if DEBUG:
-                        print(
-                            f'Adding shipments of relation {rel["from_location_id"]}_{rel["to_location_id"]} to the section combination...')
-            df_contiguous_section_combinations = pd.concat([df_contiguous_section_combinations, pd.DataFrame([{
-                'from_intersection_point_index': from_intersection_point_index,
-                'to_intersection_point_index': to_intersection_point_index,
-                'geometry': section_combination,
-                'distance': distance,
-                'freight_amount': freight_amount}])], ignore_index=True)
-
-    # add the sections of the current relation to the dataframe containing all sections
-    df_sections = pd.concat([df_sections, df_sections_on_relation], ignore_index=True)
-
-df_sections['geometry'] = df_sections['geometry'].apply(
-    lambda x: json.dumps(shapely.geometry.mapping(x)) if isinstance(x, LineString) else x)
-df_sections = df_sections.drop_duplicates('geometry')
-
-df_contiguous_section_combinations['geometry'] = df_contiguous_section_combinations['geometry'].apply(
-    lambda x: json.dumps(shapely.geometry.mapping(x)) if isinstance(x, LineString) else x)
-
-# store the created dataframes as json files
-store_dataframe_as_json(df_sections, 'temp/sections.json')
-store_dataframe_as_json(df_contiguous_section_combinations, 'temp/contiguous_section_combinations.json')
-df_sections = read_json_to_dataframe('temp/sections.json')
-df_contiguous_section_combinations = read_json_to_dataframe('temp/contiguous_section_combinations.json')
-
-# add sections to the map
-sections_layer = folium.GeoJson(df_sections.iloc[0]['geometry'], name="Sections",
-                                style_function=style_sections)
-sections_layer.add_to(m)
-for section_index, section in df_sections.iterrows():
-    if section_index == 0:
-        continue
-    sections_layer.add_child(folium.GeoJson(section['geometry']))
-
-# convert the sections to shapely objects (LineStrings)
-df_sections['geometry'] = df_sections['geometry'].apply(lambda x: shapely.geometry.shape(json.loads(x)))
-
-print(f'{len(df_sections)} sections created.')
-print(f'{len(df_contiguous_section_combinations)} contiguous section combinations created.')
-
-# STEP 6
-# evaluate the results
-# print every contiguous section combination in a matplotlib scatter plot with the distance on the x-axis and the freight amount on the y-axis
-# include a pareto frontier
-# the pareto frontier is the set of contiguous section combinations that are not dominated by any other contiguous section combination
-
-evaluate_contiguous_sections(min_freight_amount=100,
-                             min_d=100,
-                             df_contiguous_sections=df_contiguous_section_combinations)
-
-# LAST STEP
-# add a layer control
-folium.LayerControl().add_to(m)
-# save the map as an html file
-m.save('temp/map.html')
+            # get the relations passing through both intersection points of the section combination from the
+            # inverted index and add their freight amounts to the section combination
+            covering_relations = get_relations_covering(relations_at_intersection_points,
+                                                        from_intersection_point_index, to_intersection_point_index)
+            freight_amount = get_freight_amount(covering_relations)
+            if DEBUG:
+                print(f'Adding shipments of relations {sorted(covering_relations)} to the section combination...')
+            combination_store.append(from_intersection_point_index=from_intersection_point_index,
+                                     to_intersection_point_index=to_intersection_point_index,
+                                     distance=distance, freight_amount=freight_amount, relation_index=relation_index,
+                                     start_offset=start_offset, end_offset=end_offset, geometry=None)
+            metrics.count('sections.combinations_created')
+    metrics.progress('Splitting relations', len(df_relations), len(df_relations))
+
+    # enumerate the corridors as paths of the graph of the deduplicated sections, every section is visited once per path
+    # instead of once per relation traversing it
+    if args.corridors == 'graph':
+        with metrics.timer('sections.graph'):
+            section_graph = SectionGraph(relation_sections)
+        print(f'Enumerating corridors in a graph of {len(section_graph.successors)} intersection points and '
+              f'{len(section_graph)} sections')
+        metrics.set('sections.graph_sections', len(section_graph))
+        with metrics.timer('sections.query'):
+            queried_combinations = section_graph.corridors(
+                get_freight_amount, min_distance=args.min_distance if push_down else None,
+                min_freight_amount=args.min_freight if push_down else None, exclude=combination_store.contains)
+        if args.top_k is not None:
+            score = RANKING_OBJECTIVES[args.rank_by]
+            queried_combinations = sorted(queried_combinations,
+                                          key=lambda combination: -score(*combination[5:]))[:args.top_k]
+    # only create the section combinations passing the thresholds of STEP 6, or the best top_k of them, the others are
+    # skipped during the enumeration without computing their freight amounts
+    elif push_down:
+        print(f'Querying contiguous section combinations with a freight amount above {args.min_freight} and a distance '
+              f'above {args.min_distance} km' + (f', top {args.top_k} by {args.rank_by}' if args.top_k else ''))
+        with metrics.timer('sections.query'):
+            queried_combinations = query_combinations(relation_sections, relations_at_intersection_points,
+                                                      get_freight_amount, min_distance=args.min_distance,
+                                                      min_freight_amount=args.min_freight, top_k=args.top_k,
+                                                      objective=args.rank_by, exclude=combination_store.contains)
+
+    if push_down or args.corridors == 'graph':
+        for from_intersection_point_index, to_intersection_point_index, relation_index, start_offset, end_offset, \
+                distance, freight_amount in queried_combinations:
+            combination_store.append(from_intersection_point_index=from_intersection_point_index,
+                                     to_intersection_point_index=to_intersection_point_index,
+                                     distance=distance, freight_amount=freight_amount, relation_index=relation_index,
+                                     start_offset=start_offset, end_offset=end_offset, geometry=None)
+        metrics.count('sections.combinations_created', len(queried_combinations))
+
+    # update the freight amounts of the section combinations between intersection points of affected relations. without
+    # the incremental mode, the freight amounts of the section combinations of previous runs are updated, since the
+    # shipments or the load unit parameters may have changed
+    if args.incremental or stored_combinations > 0:
+        df_combination_keys = combination_store.to_dataframe()[['from_intersection_point_index',
+                                                                 'to_intersection_point_index']]
+        if args.incremental:
+            affected_intersection_points = get_affected_intersection_points(df_relation_state,
+                                                                            df_previous_relation_state,
+                                                                            affected_relations)
+        else:
+            df_combination_keys = df_combination_keys.iloc[:stored_combinations]
+        updated_combinations = 0
+        for row, (from_intersection_point_index, to_intersection_point_index) in enumerate(
+                zip(df_combination_keys['from_intersection_point_index'].tolist(),
+                    df_combination_keys['to_intersection_point_index'].tolist())):
+            if not args.incremental or from_intersection_point_index in affected_intersection_points and \
+                    to_intersection_point_index in affected_intersection_points:
+                covering_relations = get_relations_covering(relations_at_intersection_points,
+                                                            from_intersection_point_index,
+                                                            to_intersection_point_index)
+                combination_store.update(row, freight_amount=get_freight_amount(covering_relations))
+                updated_combinations += 1
+        print(f'Freight amounts of {updated_combinations} contiguous section combinations updated.')
+        metrics.count('sections.combinations_updated', updated_combinations)
+
+    # store the state of the relations for the next incremental run
+    store_dataframe(df_relation_state, os.path.join(results_path, 'relation_state'), RELATION_STATE_SCHEMA,
+                    json_export=False)
+
+    # the runtime of STEP 4 and STEP 5 of every run, a run with simplified routes is compared to it
+    intersection_and_sections_duration = round(time.time() - context['step_4_start'], 3)
+    with open(os.path.join(results_path, 'duration.json'), 'w') as f:
+        json.dump({'intersection_and_sections_duration_seconds': intersection_and_sections_duration}, f, indent=4)
+
+    # convert the stores to dataframes and materialize the geometries of the new sections and section combinations for
+    # the export
+    df_sections = section_store.to_dataframe()
+    df_sections['geometry'] = materialize_geometries(df_sections, relation_sections)
+    df_sections = df_sections[['from_intersection_point_index', 'to_intersection_point_index', 'geometry']]
+
+    df_contiguous_section_combinations = combination_store.to_dataframe()
+    df_contiguous_section_combinations['geometry'] = materialize_geometries(df_contiguous_section_combinations,
+                                                                            relation_sections)
+    df_contiguous_section_combinations = df_contiguous_section_combinations[
+        ['from_intersection_point_index', 'to_intersection_point_index', 'geometry', 'distance', 'freight_amount']]
+
+    # report the accuracy and runtime of the simplified routes compared to the last run with the original routes
+    if 'simplification_report' in context:
+        report_simplification(context, df_contiguous_section_combinations, intersection_and_sections_duration)
+
+    # sections shared by several relations have identical geometries, compare them by their WKB
+    df_sections = df_sections[~df_sections['geometry'].apply(lambda x: x.wkb).duplicated()].reset_index(drop=True)
+
+    # store the created dataframes as Parquet files for the next run and as JSON files for other tools, the shapely
+    # geometries are kept in memory
+    store_dataframe(df_sections, os.path.join(results_path, 'sections'), SECTION_SCHEMA)
+    store_dataframe(df_contiguous_section_combinations, os.path.join(results_path, 'contiguous_section_combinations'),
+                    COMBINATION_SCHEMA)
+
+    print(f'{len(df_sections)} sections created.')
+    print(f'{len(df_contiguous_section_combinations)} contiguous section combinations created.')
+
+    context['df_sections'] = df_sections
+    context['df_contiguous_section_combinations'] = df_contiguous_section_combinations
+
+
+def report_simplification(context: dict, df_contiguous_section_combinations: pd.DataFrame,
+                          intersection_and_sections_duration: float):
+    """
+    Complete the simplification report with the runtime of STEP 4 and STEP 5 and the distances of the section
+    combinations compared to the last run without simplification, if there is one, and store it in
+    temp/simplification_report.json
+    :param context: dict of the pipeline, see main
+    :param df_contiguous_section_combinations: section combinations of the simplified routes
+    :param intersection_and_sections_duration: runtime of STEP 4 and STEP 5 in seconds
+    :return: None
+    """
+    simplification_report = context['simplification_report']
+    simplification_report['intersection_and_sections_duration_seconds'] = intersection_and_sections_duration
+    baseline_duration_path = os.path.join(RESULTS_PATH, 'duration.json')
+    if os.path.isfile(baseline_duration_path):
+        with open(baseline_duration_path) as f:
+            baseline_duration = json.load(f)['intersection_and_sections_duration_seconds']
+        simplification_report['baseline_intersection_and_sections_duration_seconds'] = baseline_duration
+        simplification_report['duration_delta_seconds'] = round(intersection_and_sections_duration -
+                                                                baseline_duration, 3)
+        simplification_report['speedup'] = round(baseline_duration / intersection_and_sections_duration, 3) \
+            if intersection_and_sections_duration > 0 else None
+        simplification_report.update(compare_section_combinations(
+            df_contiguous_section_combinations, context['df_intersection_points'],
+            read_stored_dataframe(os.path.join(RESULTS_PATH, 'contiguous_section_combinations'), COMBINATION_SCHEMA),
+            read_stored_dataframe(os.path.join(RESULTS_PATH, 'intersection_points'), INTERSECTION_POINT_SCHEMA),
+            context['args'].simplify + SNAPPING_TOLERANCE))
+    else:
+        print('No run without simplification found, run without --simplify first to compare the runtime and the '
+              'distances of the section combinations.')
+    print(f'Simplification report: {simplification_report}')
+    with open('temp/simplification_report.json', 'w') as f:
+        json.dump(simplification_report, f, indent=4)
+
+
+def load_sections(context: dict):
+    """
+    Load the outputs of STEP 5
+    :param context: dict of the pipeline, see main
+    :return: None
+    """
+    results_path = context['results_path']
+    context['df_sections'] = read_stored_dataframe(os.path.join(results_path, 'sections'), SECTION_SCHEMA)
+    context['df_contiguous_section_combinations'] = read_stored_dataframe(
+        os.path.join(results_path, 'contiguous_section_combinations'), COMBINATION_SCHEMA)
+
+
+def evaluate_sections(context: dict):
+    """
+    STEP 6
+    Evaluate the results
+    :param context: dict of the pipeline, see main
+    :return: None
+    """
+    args = context['args']
+    # print every contiguous section combination in a matplotlib scatter plot with the distance on the x-axis and the freight amount on the y-axis
+    # include a pareto frontier
+    # the pareto frontier is the set of contiguous section combinations that are not dominated by any other contiguous section combination
+
+    df_evaluated = evaluate_contiguous_sections(min_freight_amount=args.min_freight,
+                                                min_d=args.min_distance,
+                                                df_contiguous_sections=context['df_contiguous_section_combinations'],
+                                                filename=args.plot)
+    print(f'{df_evaluated["pareto_optimal"].sum()} of {len(df_evaluated)} evaluated contiguous section combinations '
+          f'are Pareto optimal.')
+    context['metrics'].set('evaluate.pareto_optimal_combinations', int(df_evaluated['pareto_optimal'].sum()))
+    context['df_evaluated'] = df_evaluated
+
+
+def add_map_layers(m: folium.Map, context: dict):
+    """
+    Add the locations, relations, intersection points and sections of the stages that were run or loaded to the map
+    :param m: folium map
+    :param context: dict of the pipeline, see main
+    :return: None
+    """
+    if 'df_locations' in context:
+        # convert google geocoding result to geojson format
+        add_geojson_layer(m, [{'type': 'Feature', 'properties': {'address': x[0]['formatted_address']},
+                               'geometry': {"type": 'Point', "coordinates": [x[0]['geometry']['location']['lng'],
+                                                                             x[0]['geometry']['location']['lat']]}}
+                              for x in context['df_locations']['geocoding_result']], "Locations",
+                          child_kwargs={'name': "Locations", 'style_function': style_locations},
+                          style_function=style_locations)
+    if 'route_store' in context:
+        add_geojson_layer(m, [mapping(geometry) for geometry in context['route_store'].linestrings()], "Relations",
+                          child_kwargs={'name': "Relations", 'style_function': style_relations},
+                          style_function=style_relations)
+    if 'df_intersection_points' in context:
+        add_geojson_layer(m, [mapping(geometry) for geometry in context['df_intersection_points']['geometry']],
+                          "Intersection Points", child_kwargs={'marker': get_intersection_point_marker()},
+                          marker=get_intersection_point_marker())
+    if 'df_sections' in context:
+        add_geojson_layer(m, [mapping(geometry) for geometry in context['df_sections']['geometry']], "Sections",
+                          style_function=style_sections)
+
+
+def main():
+    args = parse_arguments()
+
+    # STEP 0
+    # create a map to visualize the data
+    m = folium.Map(location=[50, 10], zoom_start=5)
+    # add a base layer
+    folium.TileLayer('openstreetmap').add_to(m)
+
+    # the stages exchange their results through the context, a stage that is not run loads its results from its
+    # outputs instead
+    context = {'args': args,
+               'metrics': Metrics(),
+               'routes_path': SIMPLIFIED_ROUTES_PATH if args.simplify > 0 else ROUTES_PATH,
+               'results_path': SIMPLIFIED_RESULTS_PATH.format(tolerance=args.simplify) if args.simplify > 0 else
+               RESULTS_PATH,
+               # geocoding and routeing results are cached, so that they are requested only once
+               'response_cache': ResponseCache(CACHE_PATH, ttl=CACHE_TTL_DAYS * 24 * 60 * 60,
+                                               max_entries=CACHE_MAX_ENTRIES)}
+    routes_outputs = [ROUTES_PATH] + ([SIMPLIFIED_ROUTES_PATH] if args.simplify > 0 else [])
+    results_path = context['results_path']
+    os.makedirs(results_path, exist_ok=True)
+    stages = [
+        Stage('read', lambda: read_shipments(context), lambda: load_shipments(context),
+              inputs=args.input, outputs=['temp/input.parquet'],
+              parameters={'sheet': args.sheet, 'schema': INPUT_SCHEMA, 'columns': INPUT_COLUMNS}),
+        Stage('geocode', lambda: geocode_locations(context), lambda: load_locations(context),
+              inputs=['temp/input.parquet'], outputs=['temp/locations.json', 'temp/shipments.parquet'],
+              parameters={'schema': list(SHIPMENT_SCHEMA)}),
+        Stage('route', lambda: route_relations(context), lambda: load_relations(context),
+              inputs=['temp/locations.json', 'temp/shipments.parquet'],
+              outputs=['temp/relations.parquet'] + routes_outputs,
+              parameters={'ors_base_url': ORS_BASE_URL, 'simplify': args.simplify,
+                          'snapping_tolerance': SNAPPING_TOLERANCE,
+                          'route_coordinate_dtype': np.dtype(ROUTE_COORDINATE_DTYPE).name}),
+        Stage('intersect', lambda: create_intersection_points(context), lambda: load_intersection_points(context),
+              inputs=['temp/relations.parquet', context['routes_path']],
+              outputs=[os.path.join(results_path, 'intersection_points.parquet')],
+              parameters={'engine': args.engine, 'snapping_tolerance': SNAPPING_TOLERANCE}),
+        Stage('sections', lambda: create_sections(context), lambda: load_sections(context),
+              inputs=[os.path.join(results_path, 'intersection_points.parquet'), 'temp/relations.parquet',
+                      context['routes_path'], 'temp/shipments.parquet'],
+              outputs=[os.path.join(results_path, 'sections.parquet'),
+                       os.path.join(results_path, 'contiguous_section_combinations.parquet'),
+                       os.path.join(results_path, 'relation_state.parquet')],
+              parameters={'load_unit_capacities': LOAD_UNIT_CAPACITIES, 'min_utilization': args.min_utilization,
+                          'time_bucket': args.time_bucket, 'consolidate_freight': args.consolidate_freight,
+                          'corridors': args.corridors,
+                          'push_down': {'min_freight_amount': args.min_freight, 'min_distance': args.min_distance,
+                                        'top_k': args.top_k, 'rank_by': args.rank_by}
+                          if args.push_down or args.top_k is not None else None}),
+        Stage('evaluate', lambda: evaluate_sections(context), lambda: None,
+              inputs=[os.path.join(results_path, 'contiguous_section_combinations.parquet')], outputs=[args.plot],
+              parameters={'min_freight_amount': args.min_freight, 'min_distance': args.min_distance}),
+    ]
+    run_stages(stages, Checkpoints(CHECKPOINTS_PATH), from_stage=args.from_stage, to_stage=args.to_stage,
+               force=args.force, metrics=context['metrics'], profiler=args.profile)
+
+    # LAST STEP
+    # evict expired and least recently used results from the cache
+    context['metrics'].set('cache.hits', context['response_cache'].hits)
+    context['metrics'].set('cache.misses', context['response_cache'].misses)
+    context['response_cache'].close()
+    # add the layers and a layer control
+    add_map_layers(m, context)
+    folium.LayerControl().add_to(m)
+    # save the map as an html file
+    m.save(args.map)
+    # write the timers and counters of the run
+    context['metrics'].write(args.metrics)
+    print(f'Metrics written to {args.metrics}.json and {args.metrics}.csv')
+
+
+if __name__ == '__main__':
+    main()
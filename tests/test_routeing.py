@@ -0,0 +1,83 @@
+import http.server
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from utils import spatial
+from utils.cache import ResponseCache, route_key
+
+COORDINATE_PAIR = ((8.68, 49.41), (8.69, 49.42))
+ROUTE = {'type': 'FeatureCollection', 'features': []}
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Stand-in of the openrouteservice directions endpoint, answers the requests with the statuses of the server in turn
+    """
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests += 1
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = json.dumps(ROUTE if status == 200 else {'error': status}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RouteCoordinatePairsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.statuses = []
+        self.server.requests = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def route(self, **kwargs):
+        return spatial.route_coordinate_pairs([COORDINATE_PAIR], max_workers=1, requests_per_minute=6000,
+                                              base_url=self.base_url, backoff=0.01, **kwargs)
+
+    def test_rate_limit_is_retried(self):
+        self.server.statuses = [429]
+        self.assertEqual(self.route(), [ROUTE])
+        self.assertEqual(self.server.requests, 2)
+
+    def test_server_error_is_retried_once_per_attempt(self):
+        # the client must not retry 503 on its own, i.e., every retry is one request
+        self.server.statuses = [503, 503, 503]
+        with self.assertRaises(spatial.openrouteservice.exceptions.HTTPError):
+            self.route(max_retries=1)
+        self.assertEqual(self.server.requests, 2)
+
+    def test_retries_are_exhausted(self):
+        self.server.statuses = [429, 429, 429]
+        with self.assertRaises(spatial.openrouteservice.exceptions.ApiError):
+            self.route(max_retries=1)
+        self.assertEqual(self.server.requests, 2)
+
+    def test_cached_routes_need_no_client(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(os.path.join(directory, 'cache.sqlite'))
+            cache.set('route', route_key(COORDINATE_PAIR, profile='driving-hgv'), ROUTE)
+            # the public API needs an API key, creating its client without one fails
+            with mock.patch.object(spatial, 'ORS_API_KEY', None):
+                results = spatial.route_coordinate_pairs([COORDINATE_PAIR], cache=cache)
+            cache.close()
+        self.assertEqual(results, [ROUTE])
+
+
+if __name__ == '__main__':
+    unittest.main()
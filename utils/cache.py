@@ -0,0 +1,148 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+
+def normalize_address(address: str) -> str:
+    """
+    Normalize an address to be used as cache key, i.e., lower case and single spaces
+    :param address: address as given in the input data
+    :return: normalized address
+    """
+    return ' '.join(str(address).lower().split())
+
+
+def route_key(coords: tuple, profile: str = 'driving-hgv') -> str:
+    """
+    Get the cache key of a route between two coordinates
+    :param coords: a tuple containing two tuples of coordinates ((from_lng, from_lat), (to_lng, to_lat))
+    :param profile: openrouteservice profile of the route
+    :return: cache key, e.g., 'driving-hgv:16.372100,48.208200;11.576100,48.137100'
+    """
+    (from_lng, from_lat), (to_lng, to_lat) = coords
+    return f'{profile}:{from_lng:.6f},{from_lat:.6f};{to_lng:.6f},{to_lat:.6f}'
+
+
+class ResponseCache:
+    """
+    Persistent key-value cache for API responses, e.g., geocoding and routeing results, stored in a SQLite database.
+    Values are stored as compressed JSON. Entries expire after ttl seconds, and the least recently used entries are
+    evicted if the cache holds more than max_entries entries. The cache can be shared by several threads. The access
+    times of the hits are kept in memory and written in one transaction by flush, e.g., once per stage.
+    """
+
+    def __init__(self, path: str, ttl: float = None, max_entries: int = None):
+        """
+        :param path: path to the SQLite database file, e.g., temp/responses.sqlite
+        :param ttl: time to live of an entry in seconds, None for no expiry
+        :param max_entries: maximum number of entries, None for no limit
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # access time of every (namespace, key) hit since the last flush
+        self.pending_accesses = {}
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                                'namespace TEXT NOT NULL, '
+                                'key TEXT NOT NULL, '
+                                'value BLOB NOT NULL, '
+                                'created_at REAL NOT NULL, '
+                                'accessed_at REAL NOT NULL, '
+                                'PRIMARY KEY (namespace, key))')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self.connection.commit()
+
+    def get(self, namespace: str, key: str):
+        """
+        Get a cached value
+        :param namespace: namespace of the key, e.g., 'geocode' or 'route'
+        :param key: key of the value, e.g., a normalized address
+        :return: the cached value or None if the key is not cached or expired
+        """
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute('SELECT value, created_at FROM responses WHERE namespace = ? AND key = ?',
+                                          (namespace, key)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.pending_accesses[(namespace, key)] = now
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, namespace: str, key: str, value):
+        """
+        Store a value in the cache, replacing an existing value of the key
+        :param namespace: namespace of the key, e.g., 'geocode' or 'route'
+        :param key: key of the value, e.g., a normalized address
+        :param value: JSON serializable value
+        :return: None
+        """
+        now = time.time()
+        blob = zlib.compress(json.dumps(value).encode())
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                                    (namespace, key, blob, now, now))
+            self.pending_accesses.pop((namespace, key), None)
+            self.connection.commit()
+
+    def flush(self):
+        """
+        Write the access times of the hits since the last flush in one transaction
+        :return: None
+        """
+        with self.lock:
+            if not self.pending_accesses:
+                return
+            self.connection.executemany('UPDATE responses SET accessed_at = ? WHERE namespace = ? AND key = ?',
+                                        [(accessed_at, namespace, key) for (namespace, key), accessed_at in
+                                         self.pending_accesses.items()])
+            self.connection.commit()
+            self.pending_accesses = {}
+
+    def count(self, namespace: str = None) -> int:
+        """
+        Get the number of cached entries
+        :param namespace: only count the entries of this namespace
+        :return: number of entries
+        """
+        with self.lock:
+            if namespace is None:
+                return self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            return self.connection.execute('SELECT COUNT(*) FROM responses WHERE namespace = ?',
+                                           (namespace,)).fetchone()[0]
+
+    def evict(self) -> int:
+        """
+        Delete the expired entries and the least recently used entries exceeding max_entries
+        :return: number of deleted entries
+        """
+        # the least recently used entries are determined by the access times of all hits
+        self.flush()
+        deleted = 0
+        with self.lock:
+            if self.ttl is not None:
+                deleted += self.connection.execute('DELETE FROM responses WHERE created_at < ?',
+                                                   (time.time() - self.ttl,)).rowcount
+            if self.max_entries is not None:
+                deleted += self.connection.execute(
+                    'DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY accessed_at DESC '
+                    'LIMIT -1 OFFSET ?)', (self.max_entries,)).rowcount
+            self.connection.commit()
+        return deleted
+
+    def close(self):
+        """
+        Write the pending access times, evict expired and exceeding entries and close the database
+        :return: None
+        """
+        self.evict()
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,115 @@
+import os
+
+import numpy as np
+from shapely.geometry import LineString
+
+# files of a coordinate store, every file is a NumPy array that can be memory-mapped
+VERTICES_FILE = 'vertices.npy'
+OFFSETS_FILE = 'offsets.npy'
+DISTANCES_FILE = 'distances.npy'
+BOUNDS_FILE = 'bounds.npy'
+
+
+class CoordinateStore:
+    """
+    Compact store of the routes of all relations. The vertices of all routes are kept in one contiguous array of shape
+    (n, 2), the vertices of route i are vertices[offsets[i]:offsets[i + 1]]. Next to the vertices, the summary distance
+    and the bounding box of every route are kept. The arrays are stored in a directory and memory-mapped, so several
+    processes can slice the routes without copying them, and shapely geometries are only created on demand.
+    """
+
+    def __init__(self, vertices: np.ndarray, offsets: np.ndarray, distances: np.ndarray, bounds: np.ndarray):
+        """
+        :param vertices: array of shape (n, 2), the vertices of all routes
+        :param offsets: array of shape (m + 1,), the offset of the first vertex of every route and the total number of
+            vertices
+        :param distances: array of shape (m,), the summary distance of every route
+        :param bounds: array of shape (m, 4), the bounding box (min_x, min_y, max_x, max_y) of every route
+        """
+        self.vertices = vertices
+        self.offsets = offsets
+        self.distances = distances
+        self.bounds = bounds
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def coordinates(self, index: int) -> np.ndarray:
+        """
+        Get the vertices of a route without copying them
+        :param index: index of the route
+        :return: array of shape (k, 2)
+        """
+        return self.vertices[self.offsets[index]:self.offsets[index + 1]]
+
+    def linestring(self, index: int) -> LineString:
+        """
+        Create the shapely LineString of a route
+        :param index: index of the route
+        :return: LineString
+        """
+        return LineString(np.asarray(self.coordinates(index), dtype=np.float64))
+
+    def linestrings(self) -> list:
+        """
+        Create the shapely LineStrings of all routes
+        :return: list of LineStrings
+        """
+        return [self.linestring(index) for index in range(len(self))]
+
+    @classmethod
+    def open(cls, path: str):
+        """
+        Open a coordinate store created by from_routeing_results, the arrays are memory-mapped read-only
+        :param path: directory of the store
+        :return: CoordinateStore
+        """
+        return cls(*(np.load(os.path.join(path, filename), mmap_mode='r')
+                     for filename in [VERTICES_FILE, OFFSETS_FILE, DISTANCES_FILE, BOUNDS_FILE]))
+
+    @classmethod
+    def from_coordinates(cls, coordinates: list, distances, path: str, dtype=np.float64):
+        """
+        Create a coordinate store from the coordinates of every route. The vertices are written directly into the
+        memory-mapped file, i.e., the routes are never concatenated in memory.
+        :param coordinates: list of arrays or lists of shape (n, 2) or (n, 3), the vertices of every route
+        :param distances: summary distance of every route
+        :param path: directory of the store, created if it does not exist
+        :param dtype: dtype of the vertices, np.float32 halves the size at the cost of about 1 m precision
+        :return: the opened CoordinateStore
+        """
+        os.makedirs(path, exist_ok=True)
+        offsets = np.zeros(len(coordinates) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(route_coordinates) for route_coordinates in coordinates])
+        bounds = np.empty((len(coordinates), 4), dtype=np.float64)
+
+        vertices = np.lib.format.open_memmap(os.path.join(path, VERTICES_FILE), mode='w+', dtype=dtype,
+                                             shape=(int(offsets[-1]), 2))
+        for i, route_coordinates in enumerate(coordinates):
+            # only use x and y, in case the route has elevation
+            route_coordinates = np.asarray(route_coordinates, dtype=np.float64)[:, :2]
+            vertices[offsets[i]:offsets[i + 1]] = route_coordinates
+            # the bounding box of the stored vertices, i.e., after they are converted to dtype
+            stored_coordinates = np.asarray(vertices[offsets[i]:offsets[i + 1]], dtype=np.float64)
+            bounds[i] = (*stored_coordinates.min(axis=0), *stored_coordinates.max(axis=0))
+        vertices.flush()
+        del vertices
+
+        np.save(os.path.join(path, OFFSETS_FILE), offsets)
+        np.save(os.path.join(path, DISTANCES_FILE), np.asarray(distances, dtype=np.float64))
+        np.save(os.path.join(path, BOUNDS_FILE), bounds)
+        return cls.open(path)
+
+    @classmethod
+    def from_routeing_results(cls, routeing_results: list, path: str, dtype=np.float64):
+        """
+        Create a coordinate store from openrouteservice directions responses
+        :param routeing_results: list of GeoJSON responses of the openrouteservice directions API
+        :param path: directory of the store, created if it does not exist
+        :param dtype: dtype of the vertices, see from_coordinates
+        :return: the opened CoordinateStore
+        """
+        features = [routeing_result['features'][0] for routeing_result in routeing_results]
+        return cls.from_coordinates([feature['geometry']['coordinates'] for feature in features],
+                                    [feature['properties']['summary']['distance'] for feature in features], path,
+                                    dtype=dtype)
@@ -0,0 +1,167 @@
+import numpy as np
+
+from utils.coordinates import CoordinateStore
+from utils.geometry import get_cumulative_distances
+
+
+def get_vertex_keys(coords: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Snap vertices to a grid with the cell size tolerance, so vertices of different routes on the same road get the
+    same key
+    :param coords: array of shape (n, 2)
+    :param tolerance: cell size of the grid, in the units of the coordinates
+    :return: int64 array of shape (n, 2)
+    """
+    return np.round(np.asarray(coords, dtype=np.float64) / tolerance).astype(np.int64)
+
+
+def get_edge_key(vertex_1: tuple, vertex_2: tuple) -> tuple:
+    """
+    Get the key of an undirected edge, i.e., both directions of a road have the same key
+    :param vertex_1: key of the first vertex, see get_vertex_keys
+    :param vertex_2: key of the second vertex
+    :return: tuple of the two vertex keys
+    """
+    return (vertex_1, vertex_2) if vertex_1 <= vertex_2 else (vertex_2, vertex_1)
+
+
+def get_relations_per_edge(vertex_keys: list) -> dict:
+    """
+    Hash the edges of all routes
+    :param vertex_keys: list of vertex key arrays, one per relation, see get_vertex_keys
+    :return: dict mapping each edge key to the set of indices of the relations using the edge
+    """
+    relations_per_edge = {}
+    for relation_index, keys in enumerate(vertex_keys):
+        vertices = list(map(tuple, keys.tolist()))
+        for vertex_1, vertex_2 in zip(vertices[:-1], vertices[1:]):
+            if vertex_1 != vertex_2:
+                relations_per_edge.setdefault(get_edge_key(vertex_1, vertex_2), set()).add(relation_index)
+    return relations_per_edge
+
+
+def get_run_boundaries(vertices: list, relations_per_edge: dict) -> list:
+    """
+    Get the positions along a route where a maximal run of edges used by the same relations starts or ends, i.e., where
+    the set of relations of the edges changes, including the start and end of the route
+    :param vertices: list of vertex keys of the route, see get_vertex_keys
+    :param relations_per_edge: dict mapping each edge key to the set of relations using it, see get_relations_per_edge
+    :return: sorted list of vertex positions
+    """
+    boundaries = []
+    relations_before = None
+    for i, vertex in enumerate(vertices):
+        if i + 1 == len(vertices):
+            relations_after = None
+        elif vertex == vertices[i + 1]:
+            # a zero-length edge does not change the relation set
+            relations_after = relations_before
+        else:
+            relations_after = relations_per_edge[get_edge_key(vertex, vertices[i + 1])]
+        if relations_before is None or relations_after is None or relations_before != relations_after:
+            boundaries.append(i)
+        relations_before = relations_after
+    return boundaries
+
+
+def get_shared_edge_corridors(route_store: CoordinateStore, tolerance: float) -> tuple:
+    """
+    Get the intersection points of all relations from their shared edges instead of intersecting every relation pair.
+    Routes on the same road share identical consecutive vertices, so the edges of all routes are hashed to the
+    relations using them. Along every route, an intersection point is wherever the set of relations of the edges
+    changes, i.e., where a maximal run of edges shared by the same relations starts or ends, and at the start and end
+    of the route. Unlike the shapely intersection, routes that only cross each other do not get an intersection point.
+    :param route_store: CoordinateStore of the routes
+    :param tolerance: vertices closer than this get the same key, in the units of the coordinates
+    :return: tuple of (array of shape (k, 2) of the intersection point coordinates, list of (intersection_point_indices,
+        distances_along) tuples, one per relation, as returned by get_points_on_linestring)
+    """
+    vertex_keys = [get_vertex_keys(route_store.coordinates(relation_index), tolerance)
+                   for relation_index in range(len(route_store))]
+    relations_per_edge = get_relations_per_edge(vertex_keys)
+
+    # find the vertices where the relation set of the edges changes
+    point_indices = {}
+    point_coords = []
+    for relation_index, keys in enumerate(vertex_keys):
+        vertices = list(map(tuple, keys.tolist()))
+        coords = route_store.coordinates(relation_index)
+        for i in get_run_boundaries(vertices, relations_per_edge):
+            if vertices[i] not in point_indices:
+                point_indices[vertices[i]] = len(point_coords)
+                point_coords.append((float(coords[i][0]), float(coords[i][1])))
+
+    # get the intersection points on every relation, including the points found on other relations
+    points_on_relations = []
+    for relation_index, keys in enumerate(vertex_keys):
+        cumulative_distances = get_cumulative_distances(
+            np.asarray(route_store.coordinates(relation_index), dtype=np.float64))
+        indices = []
+        distances = []
+        passed = set()
+        for i, vertex in enumerate(map(tuple, keys.tolist())):
+            point_index = point_indices.get(vertex)
+            # keep the first passage if a relation passes through a point several times
+            if point_index is not None and point_index not in passed:
+                passed.add(point_index)
+                indices.append(point_index)
+                distances.append(cumulative_distances[i])
+        points_on_relations.append((np.array(indices, dtype=np.int64), np.array(distances, dtype=np.float64)))
+
+    return np.array(point_coords, dtype=np.float64).reshape(-1, 2), points_on_relations
+
+
+def map_points_on_relations(points_on_relations: list, point_ids: list) -> list:
+    """
+    Map the intersection point indices of points_on_relations to other ids, e.g., the ids of snapped intersection
+    points. If several points are mapped to the same id, the first passage is kept.
+    :param points_on_relations: list of (intersection_point_indices, distances_along) tuples, one per relation
+    :param point_ids: list of the new id of every intersection point index
+    :return: list of (intersection_point_ids, distances_along) tuples, one per relation
+    """
+    mapped = []
+    for indices, distances in points_on_relations:
+        ids = np.array([point_ids[index] for index in indices.tolist()], dtype=np.int64)
+        _, first = np.unique(ids, return_index=True)
+        first = np.sort(first)
+        mapped.append((ids[first], distances[first]))
+    return mapped
+
+
+def get_corridor_summary(point_coords: np.ndarray, points_on_relations: list, tolerance: float,
+                         duration: float) -> dict:
+    """
+    Summarize the intersection points and sections found by a corridor engine
+    :param point_coords: array of shape (k, 2), the coordinates of the intersection points
+    :param points_on_relations: list of (intersection_point_indices, distances_along) tuples, one per relation
+    :param tolerance: points closer than this are considered the same point
+    :param duration: runtime of the engine in seconds
+    :return: dict
+    """
+    point_keys = [tuple(key) for key in get_vertex_keys(point_coords.reshape(-1, 2), tolerance).tolist()]
+    sections = set()
+    for indices, _ in points_on_relations:
+        for from_index, to_index in zip(indices[:-1].tolist(), indices[1:].tolist()):
+            sections.add(frozenset((point_keys[from_index], point_keys[to_index])))
+    return {'intersection_points': len(set(point_keys)),
+            'relations_with_intersection_points': sum(len(indices) > 0 for indices, _ in points_on_relations),
+            'sections': len(sections),
+            'duration_seconds': round(duration, 3)}
+
+
+def compare_corridor_engines(summaries: dict, point_coords: dict, tolerance: float) -> dict:
+    """
+    Compare the results of the corridor engines on the same inputs
+    :param summaries: dict mapping each engine name to its summary, see get_corridor_summary
+    :param point_coords: dict mapping each engine name to its intersection point coordinates, array of shape (k, 2)
+    :param tolerance: points closer than this are considered the same point
+    :return: dict with the summary of every engine and the number of intersection points found by all or only one
+        engine
+    """
+    point_keys = {engine: set(map(tuple, get_vertex_keys(coords.reshape(-1, 2), tolerance).tolist()))
+                  for engine, coords in point_coords.items()}
+    common = set.intersection(*point_keys.values()) if point_keys else set()
+    report = {'engines': summaries, 'common_intersection_points': len(common)}
+    for engine, keys in point_keys.items():
+        report[f'intersection_points_only_{engine}'] = len(keys - common)
+    return report
@@ -1,5 +1,23 @@
+import json
+
+import numpy as np
 import pandas as pd
 import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+from shapely import wkb
+from shapely.geometry import mapping, shape
+
+# dtype of geometry columns in a schema, stored as WKB in Parquet files and as GeoJSON strings in JSON files
+GEOMETRY = 'geometry'
+
+# Arrow types of the dtypes of a schema, categorical columns are stored as dictionaries of strings
+ARROW_TYPES = {'datetime64[ns]': pa.timestamp('ns'),
+               'int64': pa.int64(),
+               'float64': pa.float64(),
+               'object': pa.string(),
+               'category': pa.dictionary(pa.int32(), pa.string()),
+               GEOMETRY: pa.binary()}
 
 
 def store_dataframe_as_json(dataframe: pd.DataFrame, filename: str):
@@ -41,3 +59,283 @@ def read_df_or_create_empty(path: str, columns: list):
             return df
     else:
         return pd.DataFrame(columns=columns)
+
+
+def _to_geometry(value):
+    """
+    Convert a stored geometry, i.e., WKB bytes or a GeoJSON string, to a shapely geometry
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return wkb.loads(bytes(value))
+    if isinstance(value, str):
+        return shape(json.loads(value))
+    return value
+
+
+def _to_wkb(value):
+    """
+    Convert a shapely geometry or a GeoJSON string to WKB bytes
+    """
+    if value is None or isinstance(value, (bytes, bytearray)):
+        return value
+    return _to_geometry(value).wkb
+
+
+def _to_geojson(value):
+    """
+    Convert a shapely geometry to a GeoJSON string
+    """
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(mapping(_to_geometry(value)))
+
+
+def _map_to_object_array(function, values) -> np.ndarray:
+    """
+    Apply a function to every value and return an object array, so that pandas does not try to unpack geometries
+    """
+    array = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = function(value)
+    return array
+
+
+def apply_schema(dataframe: pd.DataFrame, schema: dict) -> pd.DataFrame:
+    """
+    Select the columns of a schema in its order and cast them to their dtypes, so that a DataFrame always has the same
+    columns and dtypes, no matter if it was created, read from Parquet or read from JSON. Geometry columns are
+    converted to shapely geometries.
+    :param dataframe: DataFrame containing at least the columns of the schema
+    :param schema: dict mapping each column name to its dtype, e.g., 'int64', 'float64', 'datetime64[ns]' or GEOMETRY
+    :return: DataFrame
+    """
+    dataframe = dataframe[list(schema)].copy()
+    for column, dtype in schema.items():
+        if dtype == GEOMETRY:
+            dataframe[column] = _map_to_object_array(_to_geometry, dataframe[column].tolist())
+        else:
+            dataframe[column] = dataframe[column].astype(dtype)
+    return dataframe
+
+
+def create_empty_dataframe(schema: dict) -> pd.DataFrame:
+    """
+    Create an empty DataFrame with the columns and dtypes of a schema
+    :param schema: dict mapping each column name to its dtype
+    :return: DataFrame
+    """
+    return pd.DataFrame({column: pd.Series(dtype=object if dtype == GEOMETRY else dtype)
+                         for column, dtype in schema.items()})
+
+
+def store_dataframe_as_parquet(dataframe: pd.DataFrame, filename: str, schema: dict):
+    """
+    Store a pandas DataFrame as a Parquet file, geometry columns are stored as WKB.
+    :param dataframe: DataFrame to be stored
+    :param filename: name of the Parquet file to be created
+    :param schema: dict mapping each column name to its dtype, see apply_schema
+    :return: None
+    """
+    dataframe = dataframe[list(schema)].copy()
+    for column, dtype in schema.items():
+        if dtype == GEOMETRY:
+            dataframe[column] = _map_to_object_array(_to_wkb, dataframe[column].tolist())
+        else:
+            dataframe[column] = dataframe[column].astype(dtype)
+    dataframe.to_parquet(filename, engine='pyarrow', index=False)
+
+
+class ParquetChunkWriter:
+    """
+    Writer of a Parquet file chunk by chunk, every chunk is one row group, so a table does not have to be held in memory
+    as a whole to be stored. The categories of categorical columns may grow from chunk to chunk.
+    """
+
+    def __init__(self, filename: str, schema: dict):
+        """
+        :param filename: name of the Parquet file to be created
+        :param schema: dict mapping each column name to its dtype, see apply_schema and ARROW_TYPES
+        """
+        self.schema = schema
+        self.arrow_schema = pa.schema([(column, ARROW_TYPES[dtype]) for column, dtype in schema.items()])
+        self.writer = pq.ParquetWriter(filename, self.arrow_schema)
+        self.rows = 0
+
+    def write(self, dataframe: pd.DataFrame):
+        """
+        Append a chunk, geometry columns are stored as WKB
+        :param dataframe: DataFrame containing at least the columns of the schema
+        :return: None
+        """
+        dataframe = dataframe[list(self.schema)].copy()
+        for column, dtype in self.schema.items():
+            if dtype == GEOMETRY:
+                dataframe[column] = _map_to_object_array(_to_wkb, dataframe[column].tolist())
+            else:
+                dataframe[column] = dataframe[column].astype(dtype)
+        self.writer.write_table(pa.Table.from_pandas(dataframe, schema=self.arrow_schema, preserve_index=False))
+        self.rows += len(dataframe)
+
+    def close(self):
+        """
+        Finish the Parquet file
+        :return: None
+        """
+        self.writer.close()
+
+
+def read_parquet_to_dataframe(filename: str, schema: dict) -> pd.DataFrame:
+    """
+    Read a Parquet file into a pandas DataFrame, geometry columns are converted to shapely geometries.
+    :param filename: The name of the Parquet file to be read.
+    :param schema: dict mapping each column name to its dtype, see apply_schema
+    :return: The DataFrame created from the Parquet file.
+    """
+    return apply_schema(pd.read_parquet(filename, engine='pyarrow'), schema)
+
+
+def store_dataframe(dataframe: pd.DataFrame, path: str, schema: dict, json_export: bool = True):
+    """
+    Store a pandas DataFrame as a Parquet file, which is read by the next run, and as a JSON file for other tools,
+    e.g., visualize_relations.py. Geometry columns are stored as GeoJSON strings in the JSON file.
+    :param dataframe: DataFrame to be stored
+    :param path: path of the files without extension, e.g., temp/intersection_points
+    :param schema: dict mapping each column name to its dtype, see apply_schema
+    :param json_export: whether to store the JSON file as well
+    :return: None
+    """
+    store_dataframe_as_parquet(dataframe, path + '.parquet', schema)
+    if json_export:
+        dataframe = dataframe[list(schema)].copy()
+        for column, dtype in schema.items():
+            if dtype == GEOMETRY:
+                dataframe[column] = _map_to_object_array(_to_geojson, dataframe[column].tolist())
+        store_dataframe_as_json(dataframe, path + '.json')
+
+
+def read_stored_dataframe(path: str, schema: dict) -> pd.DataFrame:
+    """
+    Read a DataFrame stored by store_dataframe. The Parquet file is preferred, a JSON file of a previous version is read
+    otherwise. If neither exists, an empty DataFrame with the schema is created.
+    :param path: path of the files without extension, e.g., temp/intersection_points
+    :param schema: dict mapping each column name to its dtype, see apply_schema
+    :return: dataframe
+    """
+    if os.path.isfile(path + '.parquet'):
+        return read_parquet_to_dataframe(path + '.parquet', schema)
+    df = read_df_or_create_empty(path + '.json', list(schema))
+    if df.empty:
+        return create_empty_dataframe(schema)
+    return apply_schema(df, schema)
+
+
+class ComparisonLedger:
+    """
+    Append-only ledger of relation pairs that have already been intersected, together with the endpoints of their
+    common sections. The pairs are kept in a dict in memory, i.e., membership checks and appends are O(1), and every
+    new pair is appended as one JSON line to the ledger file, so the file never has to be rewritten. Pairs are
+    unordered, i.e., (A, B) and (B, A) are the same pair.
+    """
+
+    def __init__(self, path: str, legacy_path: str = None):
+        """
+        Load the ledger file once and open it for appending.
+        :param path: path to the JSON lines ledger file, e.g., temp/already_compared.jsonl
+        :param legacy_path: path to a JSON file as written by store_dataframe_as_json with the columns relation_id_1
+            and relation_id_2, which is migrated into the ledger file if the ledger file does not exist yet. Its
+            endpoints are unknown, i.e., they have to be contained in the stored intersection points.
+        """
+        self.path = path
+        self.endpoints = {}
+
+        if not os.path.isfile(path) and legacy_path is not None and os.path.isfile(legacy_path):
+            df_legacy = read_json_to_dataframe(legacy_path)
+            if not df_legacy.empty:
+                for relation_id_1, relation_id_2 in zip(df_legacy['relation_id_1'], df_legacy['relation_id_2']):
+                    self.endpoints[self._key(relation_id_1, relation_id_2)] = []
+            with open(path, 'w') as file:
+                for key, endpoints in self.endpoints.items():
+                    file.write(json.dumps([*key, endpoints]) + '\n')
+        elif os.path.isfile(path):
+            with open(path) as file:
+                for line in file:
+                    try:
+                        relation_id_1, relation_id_2, endpoints = json.loads(line)
+                    except ValueError:
+                        # skip a partially written last line, e.g., if a previous run was interrupted
+                        continue
+                    self.endpoints[self._key(relation_id_1, relation_id_2)] = [tuple(c) for c in endpoints]
+
+        self._file = open(path, 'a')
+
+    @staticmethod
+    def _key(relation_id_1: str, relation_id_2: str) -> tuple:
+        return (relation_id_1, relation_id_2) if relation_id_1 <= relation_id_2 else (relation_id_2, relation_id_1)
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def contains(self, relation_id_1: str, relation_id_2: str) -> bool:
+        """
+        Check if the relation pair has already been compared (in either order)
+        :param relation_id_1: id of the first relation
+        :param relation_id_2: id of the second relation
+        :return: True if the pair is in the ledger
+        """
+        return self._key(relation_id_1, relation_id_2) in self.endpoints
+
+    def get_endpoints(self, relation_id_1: str, relation_id_2: str) -> list:
+        """
+        Get the stored endpoints of the common sections of an already compared relation pair
+        :param relation_id_1: id of the first relation
+        :param relation_id_2: id of the second relation
+        :return: list of coordinate tuples
+        """
+        return self.endpoints[self._key(relation_id_1, relation_id_2)]
+
+    def add(self, relation_id_1: str, relation_id_2: str, endpoints: list):
+        """
+        Add a relation pair to the ledger and append it to the ledger file
+        :param relation_id_1: id of the first relation
+        :param relation_id_2: id of the second relation
+        :param endpoints: list of coordinate tuples, i.e., the start and end points of the common sections
+        :return: None
+        """
+        key = self._key(relation_id_1, relation_id_2)
+        if key in self.endpoints:
+            return
+        self.endpoints[key] = [tuple(c) for c in endpoints]
+        self._file.write(json.dumps([*key, self.endpoints[key]]) + '\n')
+
+    def discard_relations(self, relation_ids: set):
+        """
+        Remove all pairs containing one of the relations, e.g., relations whose route has changed, and rewrite the
+        ledger file without them
+        :param relation_ids: set of relation ids
+        :return: number of removed pairs
+        """
+        keys = [key for key in self.endpoints if key[0] in relation_ids or key[1] in relation_ids]
+        if not keys:
+            return 0
+        for key in keys:
+            del self.endpoints[key]
+        self._file.close()
+        with open(self.path, 'w') as file:
+            for key, endpoints in self.endpoints.items():
+                file.write(json.dumps([*key, endpoints]) + '\n')
+        self._file = open(self.path, 'a')
+        return len(keys)
+
+    def flush(self):
+        """
+        Flush the appended pairs to disk, e.g., after every outer iteration
+        :return: None
+        """
+        self._file.flush()
+
+    def close(self):
+        """
+        Flush and close the ledger file
+        :return: None
+        """
+        self._file.close()
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+# time buckets of the freight matrix, the shipments of a relation in the same bucket share load units
+TIME_BUCKETS = ['day', 'week', 'month']
+
+# measures of the shipments, i.e., columns of the shipments DataFrame, a load unit is limited by each of them
+MEASURES = ['weight_in_tons', 'volume_in_cubic_meters', 'loading_length_in_meters']
+
+
+def get_time_buckets(dates: pd.Series, bucket: str = 'week') -> np.ndarray:
+    """
+    Get the time bucket of every date without converting the dates to strings
+    :param dates: Series of datetimes
+    :param bucket: 'day', 'week' for the calendar week starting on Sunday, like strftime('%U'), or 'month'
+    :return: int64 array, e.g., 202107 for the week 7 of 2021
+    """
+    if bucket == 'day':
+        return dates.dt.normalize().to_numpy().astype('datetime64[D]').astype(np.int64)
+    if bucket == 'week':
+        # the days before the first Sunday of the year are in week 0
+        days_since_sunday = (dates.dt.dayofweek.to_numpy() + 1) % 7
+        week = (dates.dt.dayofyear.to_numpy() - 1 + 7 - days_since_sunday) // 7
+        return dates.dt.year.to_numpy().astype(np.int64) * 100 + week
+    if bucket == 'month':
+        return dates.dt.year.to_numpy().astype(np.int64) * 100 + dates.dt.month.to_numpy()
+    raise ValueError(f'Unknown time bucket {bucket}, expected one of {TIME_BUCKETS}')
+
+
+class FreightMatrix:
+    """
+    Sparse relation x time bucket matrix of the shipped amounts of every measure, e.g., the weight of the shipments of a
+    relation in a week. The non-zero cells are stored row by row like a CSR matrix, so the freight of any set of
+    relations is computed from their rows without grouping the shipments again.
+    """
+
+    def __init__(self, offsets: np.ndarray, buckets: np.ndarray, amounts: dict):
+        """
+        :param offsets: array of shape (m + 1,), the offset of the first cell of every relation and the number of cells
+        :param buckets: int64 array of the time bucket of every cell, see get_time_buckets
+        :param amounts: dict mapping every measure to a float64 array of the amount of every cell
+        """
+        self.offsets = offsets
+        self.buckets = buckets
+        self.amounts = amounts
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @classmethod
+    def from_shipments(cls, df_shipments: pd.DataFrame, df_relations: pd.DataFrame, bucket: str = 'week'):
+        """
+        Group the shipments by relation and time bucket in one pass
+        :param df_shipments: DataFrame with the columns date, from_location_id, to_location_id and the measures, missing
+            measures or missing values are 0
+        :param df_relations: DataFrame with the columns from_location_id and to_location_id, the rows of the matrix are
+            the rows of df_relations
+        :param bucket: time bucket, see get_time_buckets
+        :return: FreightMatrix
+        """
+        relation_index = pd.Series(np.arange(len(df_relations)), index=pd.MultiIndex.from_arrays(
+            [df_relations['from_location_id'], df_relations['to_location_id']]))
+        relations = relation_index.reindex(pd.MultiIndex.from_arrays(
+            [df_shipments['from_location_id'], df_shipments['to_location_id']])).to_numpy()
+        known = ~np.isnan(relations)
+        df_cells = pd.DataFrame({'relation': relations[known].astype(np.int64),
+                                 'bucket': get_time_buckets(df_shipments['date'], bucket)[known]})
+        for measure in MEASURES:
+            if measure in df_shipments:
+                df_cells[measure] = df_shipments[measure].to_numpy(dtype=np.float64)[known]
+            else:
+                df_cells[measure] = 0.0
+        df_cells = df_cells.fillna(0.0).groupby(['relation', 'bucket'], sort=True).sum()
+        cell_relations = df_cells.index.get_level_values('relation').to_numpy()
+        offsets = np.searchsorted(cell_relations, np.arange(len(df_relations) + 1))
+        return cls(offsets, df_cells.index.get_level_values('bucket').to_numpy(),
+                   {measure: df_cells[measure].to_numpy() for measure in MEASURES})
+
+    def get_utilization(self, capacities: dict, amounts: dict = None) -> np.ndarray:
+        """
+        Get the utilization of a load unit by the binding constraint, i.e., the greatest ratio of an amount to the
+        capacity of its measure
+        :param capacities: dict mapping measures to the capacity of a load unit, e.g., {'weight_in_tons': 28.3},
+            measures without a capacity are not limiting
+        :param amounts: dict mapping the measures to the amounts to use instead of the amounts of the cells, e.g., the
+            summed amounts of several relations
+        :return: float64 array of the utilization of every cell
+        """
+        amounts = amounts if amounts is not None else self.amounts
+        return np.max([amounts[measure] / capacity for measure, capacity in capacities.items()], axis=0)
+
+    def get_relation_freight(self, capacities: dict, min_utilization: float) -> np.ndarray:
+        """
+        Get the freight amount of every relation, i.e., the weight of its shipments in the time buckets in which a load
+        unit would be utilized by more than min_utilization
+        :param capacities: dict mapping measures to the capacity of a load unit, see get_utilization
+        :param min_utilization: minimum utilization of a load unit to be considered, e.g., MIN_UTILIZATION
+        :return: float64 array, one freight amount in tons per relation
+        """
+        utilized = self.get_utilization(capacities) > min_utilization
+        cell_relations = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+        df_freight = pd.Series(self.amounts['weight_in_tons'][utilized]).groupby(cell_relations[utilized]).sum()
+        relation_freight = np.zeros(len(self))
+        relation_freight[df_freight.index.to_numpy()] = df_freight.to_numpy()
+        return relation_freight
+
+    def get_combined_freight(self, relation_indices, capacities: dict, min_utilization: float) -> float:
+        """
+        Get the freight amount of several relations whose shipments share load units, e.g., the relations covering a
+        section combination. The rows of the relations are summed per time bucket before the utilization is checked.
+        :param relation_indices: indices of the relations
+        :param capacities: dict mapping measures to the capacity of a load unit, see get_utilization
+        :param min_utilization: minimum utilization of a load unit to be considered
+        :return: freight amount in tons
+        """
+        cells = np.concatenate([np.arange(self.offsets[relation_index], self.offsets[relation_index + 1])
+                                for relation_index in relation_indices] + [np.empty(0, dtype=np.int64)])
+        if len(cells) == 0:
+            return 0.0
+        buckets, inverse = np.unique(self.buckets[cells], return_inverse=True)
+        amounts = {measure: np.bincount(inverse, weights=values[cells], minlength=len(buckets))
+                   for measure, values in self.amounts.items()}
+        utilization = self.get_utilization(capacities, amounts=amounts)
+        return float(amounts['weight_in_tons'][utilization > min_utilization].sum())
@@ -0,0 +1,131 @@
+import numpy as np
+from shapely.geometry import LineString, box
+from shapely.strtree import STRtree
+
+
+def get_cumulative_distances(coords: np.ndarray) -> np.ndarray:
+    """
+    Get the distance of every vertex of a linestring from its start, in the units of the coordinates
+    :param coords: array of shape (n, 2), i.e., the vertices of the linestring
+    :return: array of shape (n,), starting with 0 and ending with the length of the linestring
+    """
+    segment_lengths = np.hypot(*np.diff(coords, axis=0).T)
+    return np.concatenate(([0.0], np.cumsum(segment_lengths)))
+
+
+def query_tree(tree: STRtree, geometry) -> list:
+    """
+    Get the indices of the geometries in an STRtree whose bounding boxes intersect the bounding box of a geometry
+    :param tree: STRtree created from a list of geometries
+    :param geometry: shapely geometry to query
+    :return: list of indices into the list the tree was created from
+    """
+    # shapely < 2 returns the indices via query_items, shapely >= 2 via query
+    query = getattr(tree, 'query_items', tree.query)
+    return [int(i) for i in query(geometry)]
+
+
+def project_points_on_linestring(coords: np.ndarray, cumulative_distances: np.ndarray, points: np.ndarray,
+                                 chunk_size: int = 4000000) -> tuple:
+    """
+    Get the distance along a linestring of the projection of every point, i.e., the linear reference of the point, and
+    the distance of every point to the linestring. Points that are vertices of the linestring are looked up in a hash
+    of the vertices, the other points are projected on all segments at once with NumPy.
+    :param coords: array of shape (n, 2), i.e., the vertices of the linestring
+    :param cumulative_distances: array of shape (n,), see get_cumulative_distances
+    :param points: array of shape (k, 2)
+    :param chunk_size: maximum number of point-segment combinations projected at once, limits the memory usage
+    :return: tuple of two arrays of shape (k,), the distance of every point along the linestring and to the linestring
+    """
+    vertex_index = {}
+    for i, vertex in enumerate(map(tuple, coords)):
+        vertex_index.setdefault(vertex, i)
+    vertex_positions = np.array([vertex_index.get(tuple(point), -1) for point in points], dtype=np.int64)
+
+    distances_along = np.zeros(len(points))
+    distances_to = np.zeros(len(points))
+    is_vertex = vertex_positions >= 0
+    distances_along[is_vertex] = cumulative_distances[vertex_positions[is_vertex]]
+
+    other_points = np.flatnonzero(~is_vertex)
+    if len(other_points) == 0:
+        return distances_along, distances_to
+    if len(coords) == 1:
+        distances_to[other_points] = np.hypot(*(points[other_points] - coords[0]).T)
+        return distances_along, distances_to
+
+    starts = coords[:-1]
+    segments = np.diff(coords, axis=0)
+    squared_lengths = np.einsum('ij,ij->i', segments, segments)
+    # zero-length segments are projected on their start
+    safe_squared_lengths = np.where(squared_lengths == 0, np.inf, squared_lengths)
+
+    rows_per_chunk = max(1, chunk_size // len(segments))
+    for chunk_start in range(0, len(other_points), rows_per_chunk):
+        chunk = other_points[chunk_start:chunk_start + rows_per_chunk]
+        offsets = points[chunk][:, None, :] - starts[None, :, :]
+        t = np.clip(np.einsum('kij,ij->ki', offsets, segments) / safe_squared_lengths, 0, 1)
+        residuals = offsets - t[:, :, None] * segments[None, :, :]
+        squared_distances = np.einsum('kij,kij->ki', residuals, residuals)
+        nearest = np.argmin(squared_distances, axis=1)
+        rows = np.arange(len(chunk))
+        distances_to[chunk] = np.sqrt(squared_distances[rows, nearest])
+        distances_along[chunk] = cumulative_distances[nearest] + t[rows, nearest] * np.sqrt(squared_lengths[nearest])
+    return distances_along, distances_to
+
+
+def get_points_on_linestring(linestring: LineString, point_tree: STRtree, point_coords: np.ndarray,
+                             tolerance: float) -> tuple:
+    """
+    Get the points lying on a linestring within a tolerance, ordered along the linestring. Only the points within the
+    bounding box of the linestring are tested, which are queried from an STRtree.
+    :param linestring: shapely LineString, e.g., the route of a relation
+    :param point_tree: STRtree created from the points, e.g., the intersection points
+    :param point_coords: array of shape (k, 2), the coordinates of the points in the order of the tree
+    :param tolerance: maximum distance of a point to the linestring
+    :return: tuple of two arrays, the indices of the points on the linestring and their distance along the linestring,
+        both ordered by the distance along the linestring
+    """
+    min_x, min_y, max_x, max_y = linestring.bounds
+    candidates = np.array(sorted(query_tree(point_tree, box(min_x - tolerance, min_y - tolerance,
+                                                           max_x + tolerance, max_y + tolerance))), dtype=np.int64)
+    if len(candidates) == 0:
+        return candidates, np.zeros(0)
+
+    coords = np.asarray(linestring.coords)
+    distances_along, distances_to = project_points_on_linestring(coords, get_cumulative_distances(coords),
+                                                                 point_coords[candidates])
+    on_linestring = distances_to <= tolerance
+    order = np.argsort(distances_along[on_linestring], kind='stable')
+    return candidates[on_linestring][order], distances_along[on_linestring][order]
+
+
+def split_linestring_at_points(coords: np.ndarray, points: np.ndarray, distances: np.ndarray = None) -> list:
+    """
+    Split a linestring at several points in a single pass. The points are projected on the linestring once and sorted
+    by their distance along it, every section then consists of the start point, the vertices in between and the end
+    point, i.e., the points are inserted exactly as the endpoints of the sections.
+    :param coords: array of shape (n, 2), i.e., the vertices of the linestring
+    :param points: array of shape (k, 2), the points to split at, e.g., intersection points on the linestring
+    :param distances: array of shape (k,), the distances of the points along the linestring if already known, e.g.,
+        from get_points_on_linestring
+    :return: list of (from_point_position, to_point_position, section_coords) tuples in the order along the
+        linestring, where the positions refer to the rows of points. Sections of zero length are omitted.
+    """
+    cumulative_distances = get_cumulative_distances(coords)
+    if distances is None:
+        distances, _ = project_points_on_linestring(coords, cumulative_distances, points)
+    order = np.argsort(distances, kind='stable')
+
+    sections = []
+    for from_position, to_position in zip(order[:-1], order[1:]):
+        from_distance, to_distance = distances[from_position], distances[to_position]
+        if to_distance <= from_distance:
+            continue
+        # vertices strictly between the two points
+        first_vertex = np.searchsorted(cumulative_distances, from_distance, side='right')
+        last_vertex = np.searchsorted(cumulative_distances, to_distance, side='left')
+        section_coords = np.concatenate(
+            (points[from_position][None, :], coords[first_vertex:last_vertex], points[to_position][None, :]))
+        sections.append((int(from_position), int(to_position), section_coords))
+    return sections
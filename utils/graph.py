@@ -0,0 +1,91 @@
+class SectionGraph:
+    """
+    Directed graph of the sections of all relations, the nodes are the intersection points and the edges are the
+    deduplicated sections. Every edge keeps the relations traversing it and the position of the section along each of
+    them, so a section shared by many relations is one edge, and the corridors, i.e., paths of consecutive sections, are
+    enumerated once instead of once per relation. The graph is stored as dicts of successors, no graph library is used.
+    """
+
+    def __init__(self, relation_sections: dict):
+        """
+        :param relation_sections: dict mapping the relation index to its RelationSections
+        """
+        self.relation_sections = relation_sections
+        # successors[from_intersection_point_index][to_intersection_point_index] maps the index of every relation
+        # traversing the section to the position of the section along the relation
+        self.successors = {}
+        for relation_index in sorted(relation_sections):
+            sections = relation_sections[relation_index]
+            for position, (from_intersection_point_index, to_intersection_point_index) in enumerate(
+                    zip(sections.from_intersection_point_indices, sections.to_intersection_point_indices)):
+                # keep the first traversal if a relation traverses a section several times
+                self.successors.setdefault(from_intersection_point_index, {}).setdefault(
+                    to_intersection_point_index, {}).setdefault(relation_index, position)
+
+    def __len__(self):
+        return sum(len(successors) for successors in self.successors.values())
+
+    def corridors(self, get_freight_amount, min_distance: float = None, min_freight_amount: float = None,
+                  exclude=None) -> list:
+        """
+        Enumerate the corridors as simple paths of the graph with a depth-first search from every intersection point.
+        The relations covering a corridor are the relations traversing all of its sections, so they can only become
+        fewer as the path is extended, and so can the freight amount. A path is not extended once no relation covers
+        it or its freight amount is not greater than min_freight_amount. Of several paths between the same
+        intersection points, the one with the greatest freight amount is kept.
+        :param get_freight_amount: function returning the freight amount of a set of relations, it must not decrease if
+            relations are added
+        :param min_distance: minimum distance of the corridors, exclusive, None for all
+        :param min_freight_amount: minimum freight amount of the corridors, exclusive, None for all
+        :param exclude: function returning True for intersection point pairs that already exist, e.g.,
+            ColumnStore.contains, None to exclude none
+        :return: list of (from_intersection_point_index, to_intersection_point_index, relation_index, start_offset,
+            end_offset, distance, freight_amount) tuples, the relation with the smallest index covering the corridor
+            defines its offsets and distance
+        """
+        # many paths are covered by the same relations, their freight amount is only computed once
+        freight_amounts = {}
+
+        def get_cached_freight_amount(relations: frozenset) -> float:
+            if relations not in freight_amounts:
+                freight_amounts[relations] = get_freight_amount(relations)
+            return freight_amounts[relations]
+
+        corridors = {}
+        for start in sorted(self.successors):
+            # every entry of the stack is a path, given by its last intersection point, its intersection points, the
+            # relations traversing it and their positions at its first section
+            stack = [(start, {start}, None, None)]
+            while stack:
+                node, path_nodes, relations, first_positions = stack.pop()
+                for successor, edge_relations in sorted(self.successors.get(node, {}).items(), reverse=True):
+                    if successor in path_nodes:
+                        continue
+                    if relations is None:
+                        covering_relations = frozenset(edge_relations)
+                        positions = edge_relations
+                    else:
+                        covering_relations = relations.intersection(edge_relations)
+                        positions = first_positions
+                    if not covering_relations:
+                        continue
+                    freight_amount = get_cached_freight_amount(covering_relations)
+                    if min_freight_amount is not None and freight_amount <= min_freight_amount:
+                        continue
+                    stack.append((successor, path_nodes | {successor}, covering_relations, positions))
+
+                    key = (start, successor)
+                    if key in corridors and corridors[key][6] >= freight_amount or \
+                            exclude is not None and exclude(*key):
+                        continue
+                    relation_index = min(covering_relations)
+                    sections = self.relation_sections[relation_index]
+                    i, j = positions[relation_index], edge_relations[relation_index]
+                    if j < i:
+                        continue
+                    distance = sections.to_distances[j] - sections.from_distances[i]
+                    if min_distance is not None and distance <= min_distance:
+                        continue
+                    corridors[key] = (start, successor, relation_index, sections.start_offsets[i],
+                                      sections.end_offsets[j], distance, freight_amount)
+        return list(corridors.values())
@@ -0,0 +1,93 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from utils.coordinates import CoordinateStore
+
+
+def get_route_fingerprints(route_store: CoordinateStore) -> list:
+    """
+    Get a fingerprint of the route of every relation, i.e., a hash of its vertices, to detect changed routes
+    :param route_store: CoordinateStore of the routes
+    :return: list of hex digests, one per relation
+    """
+    return [hashlib.sha1(np.ascontiguousarray(route_store.coordinates(relation_index), dtype=np.float64).tobytes())
+            .hexdigest() for relation_index in range(len(route_store))]
+
+
+def encode_intersection_point_ids(intersection_point_indices: np.ndarray) -> str:
+    """
+    Encode the intersection points on a relation, ordered along the relation, as a string
+    :param intersection_point_indices: array of intersection point indices
+    :return: string, e.g., '3 17 5'
+    """
+    return ' '.join(map(str, intersection_point_indices.tolist()))
+
+
+def get_relation_state(df_relations: pd.DataFrame, route_fingerprints: list, points_on_relations: list,
+                       freight_amounts: list) -> pd.DataFrame:
+    """
+    Get the state of every relation, which determines its sections and the freight of its section combinations
+    :param df_relations: DataFrame with the columns from_location_id and to_location_id
+    :param route_fingerprints: fingerprint of the route of every relation, see get_route_fingerprints
+    :param points_on_relations: list of (intersection_point_indices, distances_along) tuples, one per relation
+    :param freight_amounts: freight amount of every relation
+    :return: DataFrame with the columns of RELATION_STATE_SCHEMA
+    """
+    return pd.DataFrame({'from_location_id': df_relations['from_location_id'].to_numpy(),
+                         'to_location_id': df_relations['to_location_id'].to_numpy(),
+                         'route_fingerprint': route_fingerprints,
+                         'intersection_point_ids': [encode_intersection_point_ids(intersection_point_indices)
+                                                    for intersection_point_indices, _ in points_on_relations],
+                         'freight_amount': np.asarray(freight_amounts, dtype=np.float64)})
+
+
+def get_changed_relations(df_state: pd.DataFrame, df_previous_state: pd.DataFrame, columns: list) -> set:
+    """
+    Get the relations that are new or whose state has changed since the previous run
+    :param df_state: state of the current relations, see get_relation_state
+    :param df_previous_state: stored state of the previous run
+    :param columns: compared state columns, e.g., ['route_fingerprint']
+    :return: set of relation indices, i.e., row numbers of df_state
+    """
+    previous = {(from_location_id, to_location_id): values for from_location_id, to_location_id, *values in
+                zip(df_previous_state['from_location_id'], df_previous_state['to_location_id'],
+                    *(df_previous_state[column] for column in columns))}
+    return {relation_index for relation_index, (from_location_id, to_location_id, *values) in enumerate(
+        zip(df_state['from_location_id'], df_state['to_location_id'], *(df_state[column] for column in columns)))
+            if previous.get((from_location_id, to_location_id)) != values}
+
+
+def get_section_keys(points_on_relations: list, relation_indices) -> set:
+    """
+    Get the sections of relations as pairs of consecutive intersection points
+    :param points_on_relations: list of (intersection_point_indices, distances_along) tuples, one per relation
+    :param relation_indices: indices of the relations
+    :return: set of (from_intersection_point_index, to_intersection_point_index) tuples
+    """
+    section_keys = set()
+    for relation_index in relation_indices:
+        intersection_point_indices = points_on_relations[relation_index][0].tolist()
+        section_keys.update(zip(intersection_point_indices[:-1], intersection_point_indices[1:]))
+    return section_keys
+
+
+def get_affected_intersection_points(df_state: pd.DataFrame, df_previous_state: pd.DataFrame,
+                                     relation_indices: set) -> set:
+    """
+    Get the intersection points on affected relations, before and after the change, i.e., the section combinations
+    between two of these points may have a different freight amount
+    :param df_state: state of the current relations, see get_relation_state
+    :param df_previous_state: stored state of the previous run
+    :param relation_indices: indices of the affected relations
+    :return: set of intersection point indices
+    """
+    relation_keys = {(df_state['from_location_id'].iloc[relation_index],
+                      df_state['to_location_id'].iloc[relation_index]) for relation_index in relation_indices}
+    point_ids = [df_state['intersection_point_ids'].iloc[relation_index] for relation_index in relation_indices]
+    point_ids += [intersection_point_ids for from_location_id, to_location_id, intersection_point_ids in
+                  zip(df_previous_state['from_location_id'], df_previous_state['to_location_id'],
+                      df_previous_state['intersection_point_ids'])
+                  if (from_location_id, to_location_id) in relation_keys]
+    return {int(point_id) for intersection_point_ids in point_ids for point_id in intersection_point_ids.split()}
@@ -0,0 +1,159 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+
+# file extensions of the inputs that can be streamed
+INPUT_EXTENSIONS = ['.xlsx', '.xlsm', '.csv', '.parquet']
+
+
+def get_input_files(paths: list) -> list:
+    """
+    Get the input files of a list of files and directories, a directory contributes its files with a supported
+    extension in alphabetical order, e.g., a folder of CSV exports
+    :param paths: list of paths of files or directories
+    :return: list of paths of files
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, filename) for filename in sorted(os.listdir(path))
+                         if os.path.splitext(filename)[1].lower() in INPUT_EXTENSIONS)
+        else:
+            files.append(path)
+    return files
+
+
+def read_excel_chunks(path: str, columns: list, sheets: list = None, chunk_size: int = 100000):
+    """
+    Read the sheets of an Excel file row by row in read-only mode, i.e., without loading the whole workbook, and yield
+    chunks of the given columns. The first row of every sheet is its header.
+    :param path: path of the Excel file
+    :param columns: names of the columns to read, columns missing in a sheet are not read
+    :param sheets: names of the sheets, None for all sheets
+    :param chunk_size: maximum number of rows of a chunk
+    :return: generator of DataFrames
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in sheets if sheets is not None else workbook.sheetnames:
+            rows = workbook[sheet].iter_rows(values_only=True)
+            header = next(rows, ())
+            positions = {column: position for position, column in enumerate(header) if column in columns}
+            chunk = []
+            for row in rows:
+                # skip the empty rows at the end of a sheet
+                if all(value is None for value in row):
+                    continue
+                chunk.append([row[position] if position < len(row) else None for position in positions.values()])
+                if len(chunk) == chunk_size:
+                    yield pd.DataFrame(chunk, columns=list(positions))
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame(chunk, columns=list(positions))
+    finally:
+        workbook.close()
+
+
+def read_chunks(paths: list, columns: list, sheets: list = None, chunk_size: int = 100000):
+    """
+    Stream Excel, CSV and Parquet files in chunks and only read the given columns, so the memory does not depend on the
+    size of the inputs
+    :param paths: list of paths of files or directories, see get_input_files
+    :param columns: names of the columns to read, columns missing in a file are filled with NaN
+    :param sheets: names of the sheets of the Excel files, None for all sheets
+    :param chunk_size: maximum number of rows of a chunk
+    :return: generator of DataFrames with the given columns
+    """
+    for path in get_input_files(paths):
+        extension = os.path.splitext(path)[1].lower()
+        if extension in ('.xlsx', '.xlsm'):
+            chunks = read_excel_chunks(path, columns, sheets=sheets, chunk_size=chunk_size)
+        elif extension == '.csv':
+            chunks = pd.read_csv(path, usecols=lambda column: column in columns, chunksize=chunk_size)
+        elif extension == '.parquet':
+            parquet_file = pq.ParquetFile(path)
+            parquet_columns = [column for column in columns if column in parquet_file.schema_arrow.names]
+            chunks = (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=chunk_size,
+                                                                               columns=parquet_columns))
+        else:
+            raise ValueError(f'Unknown input format of {path}, expected one of {INPUT_EXTENSIONS}')
+        for chunk in chunks:
+            yield chunk.reindex(columns=columns)
+
+
+def join_address_parts(parts: list) -> pd.Series:
+    """
+    Join the parts of an address, e.g., name, city and country, with ', ' after removing leading, trailing and repeated
+    whitespace from every part. Addresses with a missing part are missing.
+    :param parts: list of Series of the same length
+    :return: Series of strings
+    """
+    normalized_parts = []
+    for part in parts:
+        # a part that is missing in a whole chunk is read as float, the string dtype keeps the missing values missing
+        part = part.astype('string')
+        normalized_parts.append(part.str.strip().str.replace(r'\s+', ' ', regex=True))
+    return normalized_parts[0].str.cat(normalized_parts[1:], sep=', ')
+
+
+class AddressEncoder:
+    """
+    Encoding of addresses as integer codes shared by all chunks of an input, i.e., every address is only kept once in
+    memory. The codes are assigned in the order of the first occurrence of the addresses row by row, so the categories
+    are in the same order as the addresses of the input.
+    """
+
+    def __init__(self):
+        self.categories = []
+        self.codes = {}
+
+    def encode(self, df: pd.DataFrame, columns: list) -> pd.DataFrame:
+        """
+        Replace the addresses of a chunk by their codes
+        :param df: chunk with the address columns
+        :param columns: names of the address columns, e.g., ['from_address', 'to_address']
+        :return: copy of df with int32 codes, -1 for missing addresses
+        """
+        # interleave the columns to keep the order of the addresses row by row
+        local_codes, uniques = pd.factorize(df[columns].to_numpy(dtype=object).ravel())
+        for address in uniques:
+            if address not in self.codes:
+                self.codes[address] = len(self.categories)
+                self.categories.append(address)
+        global_codes = np.append(np.array([self.codes[address] for address in uniques], dtype=np.int32), -1)
+        df = df.copy()
+        codes = global_codes[local_codes].reshape(len(df), len(columns))
+        for position, column in enumerate(columns):
+            df[column] = codes[:, position]
+        return df
+
+    def decode(self, df: pd.DataFrame, columns: list) -> pd.DataFrame:
+        """
+        Convert the codes to categoricals of the addresses, all address columns share the same categories
+        :param df: DataFrame with the codes of the address columns, e.g., the concatenated chunks
+        :param columns: names of the address columns
+        :return: df with categorical address columns
+        """
+        for column in columns:
+            df[column] = pd.Categorical.from_codes(df[column].to_numpy(), categories=self.categories)
+        return df
+
+
+def get_addresses_in_order(from_addresses: pd.Series, to_addresses: pd.Series) -> list:
+    """
+    Get the unique addresses in the order of their first occurrence row by row, without converting categoricals to
+    strings
+    :param from_addresses: Series of the from addresses, categorical or strings
+    :param to_addresses: Series of the to addresses, categorical or strings
+    :return: list of addresses, missing addresses are omitted
+    """
+    from_addresses = from_addresses.astype('category')
+    to_addresses = to_addresses.astype('category')
+    categories = from_addresses.cat.categories.append(to_addresses.cat.categories).unique()
+    codes = np.column_stack([pd.Categorical(from_addresses, categories=categories).codes,
+                             pd.Categorical(to_addresses, categories=categories).codes]).ravel()
+    unique_codes = pd.unique(codes)
+    return categories[unique_codes[unique_codes >= 0]].tolist()
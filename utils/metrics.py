@@ -0,0 +1,199 @@
+import contextlib
+import cProfile
+import csv
+import json
+import os
+import signal
+import time
+
+
+class Metrics:
+    """
+    Timers and counters of a run, e.g., the duration of every stage and hot loop and the number of intersected relation
+    pairs. The metrics are collected in memory and written as a JSON and CSV report at the end of the run.
+    """
+
+    def __init__(self, progress_interval: float = 1.0):
+        """
+        :param progress_interval: minimum number of seconds between two progress messages of a loop, see progress
+        """
+        self.timers = {}
+        self.counters = {}
+        self.progress_interval = progress_interval
+        self.progress_started = {}
+        self.progress_printed = {}
+
+    @contextlib.contextmanager
+    def timer(self, name: str):
+        """
+        Measure the wall time of a block, the durations and calls of all blocks with the same name are summed up
+        :param name: name of the timer, e.g., 'intersect.pairs'
+        :return: context manager
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timer = self.timers.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            timer['seconds'] += time.perf_counter() - start
+            timer['calls'] += 1
+
+    def count(self, name: str, value: int = 1):
+        """
+        Increase a counter
+        :param name: name of the counter, e.g., 'intersect.pairs_intersected'
+        :param value: increment
+        :return: None
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name: str, value):
+        """
+        Set a counter to a value, e.g., the cache hits of a run
+        :param name: name of the counter
+        :param value: value of the counter
+        :return: None
+        """
+        self.counters[name] = value
+
+    def merge(self, counters: dict):
+        """
+        Add the counters of another Metrics, e.g., of a worker process
+        :param counters: dict mapping the counter names to their increments
+        :return: None
+        """
+        for name, value in counters.items():
+            self.count(name, value)
+
+    def progress(self, name: str, done: int, total: int):
+        """
+        Print the progress of a loop and the estimated remaining duration based on the mean duration of the iterations
+        so far, at most once per progress_interval
+        :param name: name of the loop, e.g., 'intersect'
+        :param done: number of finished iterations
+        :param total: total number of iterations
+        :return: None
+        """
+        now = time.perf_counter()
+        started = self.progress_started.setdefault(name, now)
+        if done == 0 or done < total and now - self.progress_printed.get(name, started) < self.progress_interval:
+            return
+        self.progress_printed[name] = now
+        remaining = (now - started) / done * (total - done)
+        print(f'{name}: {done} of {total} done, estimated remaining duration: {remaining:.1f} s')
+
+    def to_rows(self) -> list:
+        """
+        Get the timers and counters as rows of the report
+        :return: list of dicts with the keys name, type, value and calls
+        """
+        rows = [{'name': name, 'type': 'timer', 'value': round(timer['seconds'], 6), 'calls': timer['calls']}
+                for name, timer in sorted(self.timers.items())]
+        rows += [{'name': name, 'type': 'counter', 'value': value, 'calls': None}
+                 for name, value in sorted(self.counters.items())]
+        return rows
+
+    def write(self, path: str):
+        """
+        Write the report as a JSON and a CSV file
+        :param path: path of the report without extension, e.g., output/metrics
+        :return: None
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.json', 'w') as f:
+            json.dump({'timers': {name: {'seconds': round(timer['seconds'], 6), 'calls': timer['calls']}
+                                  for name, timer in sorted(self.timers.items())},
+                       'counters': dict(sorted(self.counters.items()))}, f, indent=4)
+        with open(path + '.csv', 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['name', 'type', 'value', 'calls'])
+            writer.writeheader()
+            writer.writerows(self.to_rows())
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling the call stack of the main thread every interval seconds of CPU time via SIGPROF, so
+    the overhead does not depend on the number of function calls. The samples are written in the collapsed stack format
+    of flame graph tools, e.g., flamegraph.pl or speedscope. Only available on POSIX systems.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        """
+        :param interval: CPU time between two samples in seconds
+        """
+        self.interval = interval
+        self.samples = {}
+
+    def sample(self, signum, frame):
+        """
+        Record the call stack of the interrupted frame, called by the signal handler
+        :param signum: signal number
+        :param frame: interrupted frame
+        :return: None
+        """
+        stack = []
+        while frame is not None:
+            stack.append(f'{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+        key = ';'.join(reversed(stack))
+        self.samples[key] = self.samples.get(key, 0) + 1
+
+    def start(self):
+        """
+        Start sampling
+        :return: None
+        """
+        signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        """
+        Stop sampling
+        :return: None
+        """
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def write(self, filename: str):
+        """
+        Write the samples in the collapsed stack format, one line per call stack with its number of samples
+        :param filename: path of the file, e.g., output/profile_intersect.folded
+        :return: None
+        """
+        with open(filename, 'w') as f:
+            for stack, samples in sorted(self.samples.items(), key=lambda item: -item[1]):
+                f.write(f'{stack} {samples}\n')
+
+
+@contextlib.contextmanager
+def profile(name: str, profiler: str = None, directory: str = 'output'):
+    """
+    Profile a block, e.g., a stage, if a profiler is selected
+    :param name: name of the block, used in the file name of the profile
+    :param profiler: 'cprofile' to write a cProfile profile to <directory>/profile_<name>.prof, 'sampling' to write the
+        samples of a SamplingProfiler to <directory>/profile_<name>.folded, or None to not profile
+    :param directory: directory of the profile
+    :return: context manager
+    """
+    if profiler is None:
+        yield
+        return
+    os.makedirs(directory, exist_ok=True)
+    if profiler == 'cprofile':
+        deterministic_profiler = cProfile.Profile()
+        deterministic_profiler.enable()
+        try:
+            yield
+        finally:
+            deterministic_profiler.disable()
+            deterministic_profiler.dump_stats(os.path.join(directory, f'profile_{name}.prof'))
+    elif profiler == 'sampling':
+        sampling_profiler = SamplingProfiler()
+        sampling_profiler.start()
+        try:
+            yield
+        finally:
+            sampling_profiler.stop()
+            sampling_profiler.write(os.path.join(directory, f'profile_{name}.folded'))
+    else:
+        raise ValueError(f'Unknown profiler {profiler}')
@@ -2,6 +2,8 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
+from utils.pareto import add_pareto_columns
+
 DEBUG = False
 
 
@@ -10,7 +12,19 @@ def debug(message):
         print(message)
 
 
-def evaluate_contiguous_sections(min_freight_amount, min_d, df_contiguous_sections):
+def evaluate_contiguous_sections(min_freight_amount, min_d, df_contiguous_sections,
+                                 filename='output/subsections_paretofront_small.svg', objectives=None):
+    """
+    Plot the contiguous section combinations having a freight amount greater than min_freight_amount and a distance
+    greater than min_d and their Pareto frontier
+    :param min_freight_amount: minimum freight amount of the plotted section combinations
+    :param min_d: minimum distance of the plotted section combinations
+    :param df_contiguous_sections: DataFrame of the contiguous section combinations
+    :param filename: path of the plot
+    :param objectives: dict mapping every objective column to 'max' or 'min', default distance and freight_amount
+        are maximized, see add_pareto_columns
+    :return: DataFrame of the plotted section combinations with the columns pareto_rank and pareto_optimal
+    """
     df_notnull = df_contiguous_sections[df_contiguous_sections["freight_amount"] > min_freight_amount]
     df_notnull = df_notnull[df_notnull["distance"] > min_d]
     df_notnull.reset_index(drop=True, inplace=True)
@@ -18,8 +32,9 @@ def evaluate_contiguous_sections(min_freight_amount, min_d, df_contiguous_sectio
     xs = df_notnull["distance"]
     ys = df_notnull["freight_amount"]
 
-    # Get the indices of points in the Pareto front
-    # pareto_front = get_pareto_front(xs, ys, data)
+    # Get the dominance rank of every section combination, rank 0 is the Pareto front
+    df_notnull = add_pareto_columns(df_notnull, objectives or {'distance': 'max', 'freight_amount': 'max'})
+    df_pareto = df_notnull[df_notnull['pareto_optimal']].sort_values('distance')
 
     # pf_X = [pair[0] for pair in pareto_front]
     # pf_Y = [pair[1] for pair in pareto_front]
@@ -36,6 +51,8 @@ def evaluate_contiguous_sections(min_freight_amount, min_d, df_contiguous_sectio
 
     ax.scatter(xs, ys, marker='.', label='Section comb.')
     # ax.plot(pf_X, pf_Y, color='r', label='Pareto Frontier')
+    ax.plot(df_pareto['distance'], df_pareto['freight_amount'], color='r', marker='o', markerfacecolor='none',
+            label='Pareto Frontier')
 
     # ax.scatter(df_pareto["x"], df_pareto["y"], facecolors='none', edgecolors='r', marker='o', label='Best comb.')
 
@@ -55,7 +72,9 @@ def evaluate_contiguous_sections(min_freight_amount, min_d, df_contiguous_sectio
     ax.set_title("Section combinations having $f>f_{min}$ and $d>d_{min}$")
     fig.tight_layout()
     # plt.show()
-    plt.savefig('output/subsections_paretofront_small.svg')
+    plt.savefig(filename)
+    plt.close(fig)
+    return df_notnull
 
 
 def get_pareto_front(Xs, Ys, data, maxX=True, maxY=True):
@@ -0,0 +1,80 @@
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.coordinates import CoordinateStore
+from utils.metrics import Metrics
+from utils.spatial import get_intersection_endpoints
+
+# memory-mapped routes, their geometries created so far and the relation ids of the worker process, set once per
+# worker by init_intersection_worker
+_worker_routes = None
+_worker_geometries = None
+_worker_relation_ids = None
+
+
+def init_intersection_worker(routes_path: str, relation_ids: list):
+    """
+    Initialize a worker process with the memory-mapped routes of all relations, so the routes are neither copied nor
+    pickled to the workers
+    :param routes_path: directory of the CoordinateStore of the routes
+    :param relation_ids: list of relation ids, only used for logging
+    :return: None
+    """
+    global _worker_routes, _worker_geometries, _worker_relation_ids
+    _worker_routes = CoordinateStore.open(routes_path)
+    _worker_geometries = {}
+    _worker_relation_ids = relation_ids
+
+
+def get_worker_geometry(relation_index: int):
+    """
+    Get the shapely geometry of a route in a worker process, it is created on first use
+    :param relation_index: index of the relation
+    :return: LineString
+    """
+    if relation_index not in _worker_geometries:
+        _worker_geometries[relation_index] = _worker_routes.linestring(relation_index)
+    return _worker_geometries[relation_index]
+
+
+def intersect_relation_pair_block(block: list) -> tuple:
+    """
+    Intersect a block of relation pairs in a worker process
+    :param block: list of (relation_index_1, relation_index_2) tuples
+    :return: tuple of (list of endpoint lists, one for every pair in the block and in the same order, dict of the
+        counters of the block, see Metrics)
+    """
+    metrics = Metrics()
+    return [get_intersection_endpoints(get_worker_geometry(i), get_worker_geometry(j),
+                                       _worker_relation_ids[i], _worker_relation_ids[j], metrics)
+            for i, j in block], metrics.counters
+
+
+def intersect_relation_pairs_parallel(routes_path: str, relation_ids: list, pairs: list, workers: int,
+                                      metrics: Metrics = None):
+    """
+    Intersect relation pairs in a process pool. The pairs are split into blocks, and the results are yielded in the
+    order of the given pairs, i.e., the result is deterministic and equals the serial computation.
+    :param routes_path: directory of the CoordinateStore of the routes, see CoordinateStore.from_routeing_results
+    :param relation_ids: list of relation ids, only used for logging
+    :param pairs: list of (relation_index_1, relation_index_2) tuples to be intersected
+    :param workers: number of worker processes
+    :param metrics: Metrics receiving the counters of the workers, None to discard them
+    :return: generator of ((relation_index_1, relation_index_2), endpoints) tuples
+    """
+    if not pairs:
+        return
+    # use several blocks per worker to balance the load, since the duration of an intersection varies a lot
+    block_size = max(1, math.ceil(len(pairs) / (workers * 8)))
+    blocks = [pairs[i:i + block_size] for i in range(0, len(pairs), block_size)]
+
+    # fork the workers, so that the main script is not executed again in every worker process
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                             initializer=init_intersection_worker,
+                             initargs=(routes_path, relation_ids)) as executor:
+        for block, (block_endpoints, block_counters) in zip(blocks, executor.map(intersect_relation_pair_block,
+                                                                                 blocks)):
+            if metrics is not None:
+                metrics.merge(block_counters)
+            yield from zip(block, block_endpoints)
@@ -0,0 +1,134 @@
+import bisect
+
+import numpy as np
+import pandas as pd
+
+
+def get_pareto_mask_2d(values: np.ndarray) -> np.ndarray:
+    """
+    Get the non-dominated rows of two objectives to be maximized in O(n log n). The rows are sorted by the first
+    objective, a row is dominated if a row with a greater first objective has at least the same second objective, or a
+    row with the same first objective has a greater second objective. Identical rows do not dominate each other.
+    :param values: array of shape (n, 2)
+    :return: boolean array of shape (n,), True for the non-dominated rows
+    """
+    x, y = values[:, 0], values[:, 1]
+    order = np.lexsort((-y, -x))
+    sorted_x, sorted_y = x[order], y[order]
+    # the rows with the same first objective form a group, sorted by the second objective in descending order
+    group_start = np.searchsorted(-sorted_x, -sorted_x, side='left')
+    best_y_before = np.maximum.accumulate(sorted_y)
+    best_y_of_greater_x = np.where(group_start > 0, best_y_before[np.maximum(group_start - 1, 0)], -np.inf)
+    dominated = (best_y_of_greater_x >= sorted_y) | (sorted_y[group_start] > sorted_y)
+    mask = np.empty(len(values), dtype=bool)
+    mask[order] = ~dominated
+    return mask
+
+
+def get_pareto_ranks_2d(values: np.ndarray) -> np.ndarray:
+    """
+    Get the dominance rank of every row of two objectives to be maximized in O(n log n), i.e., 0 for the non-dominated
+    rows, 1 for the rows only dominated by rows of rank 0, and so on. The rows are visited in the order of the first
+    objective, every rank keeps the greatest second objective of its rows so far, which decreases with the rank, so the
+    rank of a row is found by a binary search.
+    :param values: array of shape (n, 2)
+    :return: int64 array of shape (n,)
+    """
+    # identical rows get the same rank
+    unique_values, inverse = np.unique(values, axis=0, return_inverse=True)
+    order = np.lexsort((-unique_values[:, 1], -unique_values[:, 0]))
+    # negated greatest second objective of every rank, in ascending order
+    negated_best_y = []
+    unique_ranks = np.empty(len(unique_values), dtype=np.int64)
+    for index, y in zip(order.tolist(), unique_values[order, 1].tolist()):
+        rank = bisect.bisect_right(negated_best_y, -y)
+        if rank == len(negated_best_y):
+            negated_best_y.append(-y)
+        else:
+            negated_best_y[rank] = -y
+        unique_ranks[index] = rank
+    return unique_ranks[np.asarray(inverse).reshape(-1)]
+
+
+def get_pareto_mask(values: np.ndarray, block_size: int = 1024) -> np.ndarray:
+    """
+    Get the non-dominated rows of any number of objectives to be maximized with a block-nested-loop over the rows sorted
+    by the sum of their objectives. A row can only be dominated by a row with a greater sum, so every block of rows is
+    compared with the non-dominated rows found so far and with itself, vectorized with NumPy.
+    :param values: array of shape (n, k)
+    :param block_size: number of rows compared at once, limits the memory of the comparison
+    :return: boolean array of shape (n,), True for the non-dominated rows
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.shape[1] == 2:
+        return get_pareto_mask_2d(values)
+    order = np.argsort(-values.sum(axis=1), kind='stable')
+    window = np.empty((0, values.shape[1]))
+    mask = np.zeros(len(values), dtype=bool)
+    for start in range(0, len(values), block_size):
+        block_indices = order[start:start + block_size]
+        for window_start in range(0, len(window), block_size):
+            block_indices = block_indices[~dominates(window[window_start:window_start + block_size],
+                                                     values[block_indices])]
+        # dominance is transitive, so a row dominated by a dominated row of the block is dominated by the window
+        block = values[block_indices]
+        block_indices = block_indices[~dominates(block, block)]
+        mask[block_indices] = True
+        window = np.concatenate([window, values[block_indices]])
+    return mask
+
+
+def dominates(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Check which rows of b are dominated by any row of a, all objectives are maximized
+    :param a: array of shape (m, k)
+    :param b: array of shape (n, k)
+    :return: boolean array of shape (n,)
+    """
+    greater_equal = a[:, None, :] >= b[None, :, :]
+    greater = a[:, None, :] > b[None, :, :]
+    return np.any(np.all(greater_equal, axis=2) & np.any(greater, axis=2), axis=0)
+
+
+def get_pareto_ranks(values: np.ndarray, max_rank: int = None) -> np.ndarray:
+    """
+    Get the dominance rank of every row of any number of objectives to be maximized, i.e., 0 for the non-dominated
+    rows, 1 for the rows that are non-dominated once the rows of rank 0 are removed, and so on
+    :param values: array of shape (n, k)
+    :param max_rank: rows of a greater rank get this rank, which limits the number of peeled fronts of three or more
+        objectives, None for no limit
+    :return: int64 array of shape (n,)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.shape[1] == 2:
+        ranks = get_pareto_ranks_2d(values)
+        return ranks if max_rank is None else np.minimum(ranks, max_rank)
+    ranks = np.full(len(values), -1, dtype=np.int64)
+    remaining = np.arange(len(values))
+    rank = 0
+    while len(remaining) > 0:
+        if max_rank is not None and rank == max_rank:
+            ranks[remaining] = max_rank
+            break
+        front = get_pareto_mask(values[remaining])
+        ranks[remaining[front]] = rank
+        remaining = remaining[~front]
+        rank += 1
+    return ranks
+
+
+def add_pareto_columns(df: pd.DataFrame, objectives: dict, max_rank: int = None) -> pd.DataFrame:
+    """
+    Add the dominance rank and whether a row is non-dominated as the columns pareto_rank and pareto_optimal
+    :param df: DataFrame with the objective columns, e.g., the contiguous section combinations
+    :param objectives: dict mapping every objective column to 'max' or 'min', e.g., {'distance': 'max',
+        'freight_amount': 'max'}
+    :param max_rank: see get_pareto_ranks
+    :return: copy of df with the additional columns
+    """
+    values = np.column_stack([df[column].to_numpy(dtype=np.float64) * (1 if direction == 'max' else -1)
+                              for column, direction in objectives.items()]).reshape(len(df), len(objectives))
+    df = df.copy()
+    df['pareto_rank'] = get_pareto_ranks(values, max_rank) if len(df) else np.empty(0, dtype=np.int64)
+    df['pareto_optimal'] = df['pareto_rank'] == 0
+    return df
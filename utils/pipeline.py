@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+
+from utils.metrics import Metrics, profile
+
+
+def get_file_fingerprint(path: str):
+    """
+    Get a fingerprint of the content of a file or of all files in a directory
+    :param path: path of the file or directory
+    :return: hex digest, or None if the path does not exist
+    """
+    if os.path.isdir(path):
+        digest = hashlib.sha1()
+        for filename in sorted(os.listdir(path)):
+            digest.update(filename.encode())
+            digest.update(str(get_file_fingerprint(os.path.join(path, filename))).encode())
+        return digest.hexdigest()
+    if not os.path.isfile(path):
+        return None
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Stage:
+    """
+    Named stage of the pipeline with declared input and output files. The fingerprint of a stage is a hash of its
+    parameters and of the content of its input files, i.e., a stage whose fingerprint equals the one of its last
+    checkpoint produces the same outputs and does not have to be run again.
+    """
+
+    def __init__(self, name: str, run, load, inputs: list, outputs: list, parameters: dict = None):
+        """
+        :param name: name of the stage, e.g., intersect
+        :param run: function without arguments computing the outputs of the stage
+        :param load: function without arguments loading the outputs of the stage instead of computing them
+        :param inputs: paths of the files or directories the stage reads, e.g., the outputs of previous stages
+        :param outputs: paths of the files or directories the stage writes
+        :param parameters: JSON serializable parameters of the stage, e.g., thresholds
+        """
+        self.name = name
+        self.run = run
+        self.load = load
+        self.inputs = inputs
+        self.outputs = outputs
+        self.parameters = parameters or {}
+
+    def get_fingerprint(self) -> str:
+        """
+        Get the fingerprint of the parameters and the input files of the stage
+        :return: hex digest
+        """
+        content = {'parameters': self.parameters,
+                   'inputs': {path: get_file_fingerprint(path) for path in self.inputs}}
+        return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class Checkpoints:
+    """
+    Fingerprints of the inputs and outputs of every stage of the last run, stored as a JSON file
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: path of the JSON file, e.g., temp/checkpoints.json
+        """
+        self.path = path
+        self.checkpoints = {}
+        if os.path.isfile(path):
+            with open(path) as file:
+                self.checkpoints = json.load(file)
+
+    def is_current(self, stage: Stage, fingerprint: str) -> bool:
+        """
+        Check if a stage has already been run with the same inputs and its outputs have not been changed since
+        :param stage: stage to check
+        :param fingerprint: current fingerprint of the stage, see Stage.get_fingerprint
+        :return: True if the stage does not have to be run again
+        """
+        checkpoint = self.checkpoints.get(stage.name)
+        if checkpoint is None or checkpoint['fingerprint'] != fingerprint:
+            return False
+        return all(path in checkpoint['outputs'] and checkpoint['outputs'][path] == get_file_fingerprint(path)
+                   for path in stage.outputs)
+
+    def set(self, stage: Stage, fingerprint: str):
+        """
+        Record the fingerprint of a stage that has been run and the fingerprints of its outputs
+        :param stage: stage that has been run
+        :param fingerprint: fingerprint of the stage before it was run
+        :return: None
+        """
+        self.checkpoints[stage.name] = {'fingerprint': fingerprint,
+                                        'outputs': {path: get_file_fingerprint(path) for path in stage.outputs}}
+        # write to a temporary file first, so an interrupted write does not corrupt the checkpoints
+        with open(self.path + '.tmp', 'w') as file:
+            json.dump(self.checkpoints, file, indent=4)
+        os.replace(self.path + '.tmp', self.path)
+
+
+def run_stages(stages: list, checkpoints: Checkpoints, from_stage: str = None, to_stage: str = None,
+               force: bool = False, metrics: Metrics = None, profiler: str = None):
+    """
+    Run the stages from from_stage to to_stage in order. Stages before from_stage are loaded from their outputs, stages
+    whose fingerprint matches their last checkpoint are loaded as well unless force is set, and stages after to_stage
+    are neither run nor loaded.
+    :param stages: list of stages in the order of their dependencies
+    :param checkpoints: checkpoints of the last run
+    :param from_stage: name of the first stage to run, None for the first stage
+    :param to_stage: name of the last stage to run, None for the last stage
+    :param force: run the stages even if their fingerprint matches their last checkpoint
+    :param metrics: Metrics receiving the duration of running or loading every stage, None to not measure
+    :param profiler: profiler of the stages that are run, see utils.metrics.profile
+    :return: list of the names of the stages that were run
+    """
+    metrics = metrics or Metrics()
+    names = [stage.name for stage in stages]
+    first = names.index(from_stage) if from_stage is not None else 0
+    last = names.index(to_stage) if to_stage is not None else len(stages) - 1
+    if first > last:
+        raise ValueError(f'Stage {from_stage} comes after stage {to_stage}')
+
+    run = []
+    for stage in stages[:last + 1]:
+        if names.index(stage.name) < first:
+            missing = [path for path in stage.outputs if not os.path.exists(path)]
+            if missing:
+                raise FileNotFoundError(f'Stage {stage.name} has not been run yet, its outputs {missing} are missing')
+            print(f'Loading the outputs of stage {stage.name}')
+            with metrics.timer(f'stage.{stage.name}.load'):
+                stage.load()
+            continue
+
+        fingerprint = stage.get_fingerprint()
+        if not force and checkpoints.is_current(stage, fingerprint):
+            print(f'Stage {stage.name} is unchanged since its last checkpoint, loading its outputs')
+            with metrics.timer(f'stage.{stage.name}.load'):
+                stage.load()
+            metrics.count('stages.skipped')
+            continue
+
+        with metrics.timer(f'stage.{stage.name}.run'), profile(stage.name, profiler):
+            stage.run()
+        checkpoints.set(stage, fingerprint)
+        metrics.count('stages.run')
+        run.append(stage.name)
+    return run
@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+
+from utils.files import GEOMETRY
+
+# schemas of the stored intermediate results, every stored file has exactly these columns and dtypes
+INPUT_SCHEMA = {'date': 'datetime64[ns]',
+                'from_address': 'category',
+                'to_address': 'category',
+                'weight_in_tons': 'float64',
+                'volume_in_cubic_meters': 'float64',
+                'loading_length_in_meters': 'float64'}
+SHIPMENT_SCHEMA = {'date': 'datetime64[ns]',
+                   'from_location_id': 'int64',
+                   'to_location_id': 'int64',
+                   'weight_in_tons': 'float64',
+                   'volume_in_cubic_meters': 'float64',
+                   'loading_length_in_meters': 'float64'}
+RELATION_SCHEMA = {'from_location_id': 'int64',
+                   'to_location_id': 'int64'}
+INTERSECTION_POINT_SCHEMA = {'intersection_point_id': 'int64',
+                             'geometry': GEOMETRY}
+SECTION_SCHEMA = {'from_intersection_point_index': 'int64',
+                  'to_intersection_point_index': 'int64',
+                  'geometry': GEOMETRY}
+COMBINATION_SCHEMA = {'from_intersection_point_index': 'int64',
+                      'to_intersection_point_index': 'int64',
+                      'geometry': GEOMETRY,
+                      'distance': 'float64',
+                      'freight_amount': 'float64'}
+RELATION_STATE_SCHEMA = {'from_location_id': 'int64',
+                         'to_location_id': 'int64',
+                         'route_fingerprint': 'object',
+                         'intersection_point_ids': 'object',
+                         'freight_amount': 'float64'}
+
+# columns of the stores of the sections and contiguous section combinations, the geometry of a new row is referenced by
+# the index of its relation and its vertex offsets, rows of previous runs keep their stored geometry and have -1
+SECTION_DTYPES = {'from_intersection_point_index': np.int64,
+                  'to_intersection_point_index': np.int64,
+                  'relation_index': np.int64,
+                  'start_offset': np.int64,
+                  'end_offset': np.int64,
+                  'geometry': object}
+COMBINATION_DTYPES = {'from_intersection_point_index': np.int64,
+                      'to_intersection_point_index': np.int64,
+                      'distance': np.float64,
+                      'freight_amount': np.float64,
+                      'relation_index': np.int64,
+                      'start_offset': np.int64,
+                      'end_offset': np.int64,
+                      'geometry': object}
+GEOMETRY_REFERENCE_DEFAULTS = {'relation_index': -1, 'start_offset': -1, 'end_offset': -1}
+
+
+class ColumnStore:
+    """
+    Columnar store for result rows, e.g., sections or section combinations. Every column is a typed NumPy array that
+    is grown by doubling its capacity, so appending a row is amortized O(1) instead of copying a DataFrame. An
+    optional hash index on key columns allows O(1) duplicate checks. The rows are converted to a DataFrame once.
+    """
+
+    def __init__(self, dtypes: dict, key_columns: list = None, capacity: int = 1024):
+        """
+        :param dtypes: dict mapping each column name to its NumPy dtype, e.g., np.int64, np.float64 or object
+        :param key_columns: columns of the hash index, None for no index
+        :param capacity: initial number of rows
+        """
+        self.dtypes = dtypes
+        self.key_columns = key_columns
+        # maps the key of every row to its row number
+        self.keys = {}
+        self.length = 0
+        self.columns = {column: np.empty(capacity, dtype=dtype) for column, dtype in dtypes.items()}
+
+    def __len__(self):
+        return self.length
+
+    def contains(self, *key) -> bool:
+        """
+        Check if a row with the key exists
+        :param key: values of the key columns
+        :return: True if a row with the key exists
+        """
+        return key in self.keys
+
+    def update(self, row: int, **values):
+        """
+        Update the values of a row, the key columns must not be updated
+        :param row: row number
+        :param values: new value of every updated column
+        :return: None
+        """
+        for column, value in values.items():
+            self.columns[column][row] = value
+
+    def keep(self, mask: np.ndarray):
+        """
+        Keep only the rows selected by a mask, e.g., to remove outdated rows of previous runs
+        :param mask: boolean array with one value per row
+        :return: None
+        """
+        for column, values in self.columns.items():
+            kept = values[:self.length][mask]
+            values[:len(kept)] = kept
+        self.length = int(np.count_nonzero(mask))
+        if self.key_columns is not None:
+            self.keys = {tuple(self.columns[column][row].item() for column in self.key_columns): row
+                         for row in range(self.length)}
+
+    def append(self, **row) -> bool:
+        """
+        Append a row, unless a row with the same key exists
+        :param row: value of every column
+        :return: True if the row was appended, False if a row with the same key exists
+        """
+        if self.key_columns is not None:
+            key = tuple(row[column] for column in self.key_columns)
+            if key in self.keys:
+                return False
+            self.keys[key] = self.length
+
+        if self.length == len(next(iter(self.columns.values()))):
+            for column, values in self.columns.items():
+                grown = np.empty(max(1, 2 * len(values)), dtype=values.dtype)
+                grown[:self.length] = values[:self.length]
+                self.columns[column] = grown
+        for column, values in self.columns.items():
+            values[self.length] = row[column]
+        self.length += 1
+        return True
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Convert the rows to a DataFrame
+        :return: DataFrame with one column per store column
+        """
+        return pd.DataFrame({column: values[:self.length] for column, values in self.columns.items()})
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, dtypes: dict, key_columns: list = None, defaults: dict = None):
+        """
+        Create a store from the rows of a DataFrame, e.g., the results of a previous run
+        :param df: DataFrame containing (a subset of) the columns
+        :param dtypes: dict mapping each column name to its NumPy dtype
+        :param key_columns: columns of the hash index, None for no index
+        :param defaults: values of the columns missing in the DataFrame
+        :return: ColumnStore
+        """
+        store = cls(dtypes, key_columns, capacity=max(1024, 2 * len(df)))
+        defaults = defaults or {}
+        for row in df.to_dict('records'):
+            store.append(**{column: row.get(column, defaults.get(column)) for column in dtypes})
+        return store
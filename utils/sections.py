@@ -0,0 +1,226 @@
+import heapq
+
+import numpy as np
+import pandas as pd
+from shapely.geometry import LineString
+
+# objectives to rank section combinations by, every objective is maximized
+RANKING_OBJECTIVES = {'freight_amount': lambda distance, freight_amount: freight_amount,
+                      'distance': lambda distance, freight_amount: distance,
+                      'freight_distance': lambda distance, freight_amount: distance * freight_amount}
+
+
+def get_relations_at_points(points_on_relations: list) -> dict:
+    """
+    Get an inverted index from every intersection point to the relations passing through it
+    :param points_on_relations: list of (intersection_point_indices, distances_along) tuples, one per relation, as
+        returned by get_points_on_linestring
+    :return: dict mapping each intersection point index to a dict mapping the index of every relation passing through
+        the point to the distance of the point along the relation
+    """
+    relations_at_points = {}
+    for relation_index, (intersection_point_indices, distances_along) in enumerate(points_on_relations):
+        for intersection_point_index, distance_along in zip(intersection_point_indices.tolist(),
+                                                            distances_along.tolist()):
+            # keep the first passage if a relation passes through a point several times
+            relations_at_points.setdefault(intersection_point_index, {}).setdefault(relation_index, distance_along)
+    return relations_at_points
+
+
+def get_relations_covering(relations_at_points: dict, from_intersection_point_index: int,
+                           to_intersection_point_index: int) -> set:
+    """
+    Get the relations passing through both intersection points of a section combination
+    :param relations_at_points: inverted index, see get_relations_at_points
+    :param from_intersection_point_index: index of the first intersection point
+    :param to_intersection_point_index: index of the second intersection point
+    :return: set of relation indices
+    """
+    return relations_at_points.get(from_intersection_point_index, {}).keys() & \
+        relations_at_points.get(to_intersection_point_index, {}).keys()
+
+
+class RelationSections:
+    """
+    Sections of a relation, stored as vertex offsets into one coordinate array of the relation with its intersection
+    points inserted. A contiguous section combination from section i to section j is a slice of this array, i.e., its
+    geometry is only materialized when it is needed, and its distance is derived from the distances of its
+    intersection points along the relation.
+    """
+
+    def __init__(self, sections: list, intersection_point_indices, intersection_point_distances, route_length: float,
+                 relation_distance: float):
+        """
+        :param sections: list of (from_point_position, to_point_position, section_coords) tuples ordered along the
+            relation, as returned by split_linestring_at_points
+        :param intersection_point_indices: indices of the intersection points on the relation, the positions of the
+            sections refer to them
+        :param intersection_point_distances: distances of the intersection points along the relation, in the units of
+            the coordinates
+        :param route_length: length of the route of the relation, in the units of the coordinates
+        :param relation_distance: distance of the relation in km, e.g., from the routeing result
+        """
+        self.from_intersection_point_indices = [int(intersection_point_indices[from_position])
+                                                for from_position, _, _ in sections]
+        self.to_intersection_point_indices = [int(intersection_point_indices[to_position])
+                                              for _, to_position, _ in sections]
+        # distances along the relation in km, i.e., scaled from the units of the coordinates
+        scale = relation_distance / route_length if route_length > 0 else 0
+        self.from_distances = [float(intersection_point_distances[from_position]) * scale
+                               for from_position, _, _ in sections]
+        self.to_distances = [float(intersection_point_distances[to_position]) * scale
+                             for _, to_position, _ in sections]
+
+        # join the sections to one coordinate array, a section starts at the offset where the previous section ends
+        self.start_offsets = []
+        self.end_offsets = []
+        coords = []
+        for _, _, section_coords in sections:
+            section_coords = section_coords.tolist()
+            if coords and coords[-1] == section_coords[0]:
+                self.start_offsets.append(len(coords) - 1)
+                coords.extend(section_coords[1:])
+            else:
+                self.start_offsets.append(len(coords))
+                coords.extend(section_coords)
+            self.end_offsets.append(len(coords) - 1)
+        self.coords = coords
+
+    def __len__(self):
+        return len(self.start_offsets)
+
+    def geometry(self, start_offset: int, end_offset: int) -> LineString:
+        """
+        Materialize the geometry of a slice of the relation, e.g., of a section or section combination
+        :param start_offset: vertex offset of the first vertex
+        :param end_offset: vertex offset of the last vertex
+        :return: shapely LineString
+        """
+        return LineString(self.coords[start_offset:end_offset + 1])
+
+    def combinations(self):
+        """
+        Get all contiguous section combinations of the relation, i.e., for every section i one combination for all
+        following sections j, starting with section i and ending with section j. Combinations ending at their start
+        point are omitted.
+        :return: generator of (from_intersection_point_index, to_intersection_point_index, start_offset, end_offset,
+            distance) tuples, where the distance is in km
+        """
+        for i in range(len(self)):
+            from_intersection_point_index = self.from_intersection_point_indices[i]
+            for j in range(i, len(self)):
+                to_intersection_point_index = self.to_intersection_point_indices[j]
+                if to_intersection_point_index == from_intersection_point_index:
+                    continue
+                yield (from_intersection_point_index, to_intersection_point_index, self.start_offsets[i],
+                       self.end_offsets[j], self.to_distances[j] - self.from_distances[i])
+
+
+def query_combinations(relation_sections: dict, relations_at_points: dict, get_freight_amount, min_distance: float = 0,
+                       min_freight_amount: float = 0, top_k: int = None, objective: str = 'freight_amount',
+                       exclude=None) -> list:
+    """
+    Get the contiguous section combinations with a distance greater than min_distance and a freight amount greater than
+    min_freight_amount, optionally only the top_k best by an objective, without creating the other combinations. Like
+    in STEP 5, a combination between two intersection points belongs to the first relation creating it.
+    The constraints are pushed into the enumeration: the freight amount of a combination is at most the freight amount
+    of all relations passing through its start or end point, since freight never increases with fewer relations, so
+    start points and end points with too little freight are skipped as a whole. The distance grows with every
+    following section, so the end points closer than min_distance are skipped by a binary search. With top_k, the best
+    combinations are kept in a heap, and start and end points whose bound does not beat the k-th best are skipped.
+    :param relation_sections: dict mapping the relation index to its RelationSections
+    :param relations_at_points: inverted index, see get_relations_at_points
+    :param get_freight_amount: function returning the freight amount of a set of relations, it must not decrease if
+        relations are added
+    :param min_distance: minimum distance of the combinations, exclusive
+    :param min_freight_amount: minimum freight amount of the combinations, exclusive
+    :param top_k: number of combinations to keep, None for all
+    :param objective: objective of top_k, see RANKING_OBJECTIVES
+    :param exclude: function returning True for intersection point pairs that already exist, e.g.,
+        ColumnStore.contains, None to exclude none
+    :return: list of (from_intersection_point_index, to_intersection_point_index, relation_index, start_offset,
+        end_offset, distance, freight_amount) tuples, ordered by the objective if top_k is given, otherwise along the
+        relations
+    """
+    score = RANKING_OBJECTIVES[objective]
+    # the score of a combination skipped for its distance depends on the relation, so its intersection point pair is
+    # marked as taken, a later relation must not create it either
+    distance_dependent = objective != 'freight_amount'
+    freight_bounds = {}
+
+    def get_freight_bound(intersection_point_index: int) -> float:
+        if intersection_point_index not in freight_bounds:
+            freight_bounds[intersection_point_index] = get_freight_amount(
+                set(relations_at_points.get(intersection_point_index, {})))
+        return freight_bounds[intersection_point_index]
+
+    taken = set()
+    combinations = []
+    heap = []
+    for relation_index in sorted(relation_sections):
+        sections = relation_sections[relation_index]
+        to_distances = np.array(sections.to_distances)
+        for i in range(len(sections)):
+            from_intersection_point_index = sections.from_intersection_point_indices[i]
+            from_bound = get_freight_bound(from_intersection_point_index)
+            if from_bound <= min_freight_amount:
+                continue
+            # the first following section reaching beyond min_distance
+            first = max(i, int(np.searchsorted(to_distances - sections.from_distances[i], min_distance,
+                                               side='right')))
+            keys = [(from_intersection_point_index, sections.to_intersection_point_indices[j])
+                    for j in range(i, len(sections))]
+            if top_k is not None and len(heap) == top_k and \
+                    score(to_distances[-1] - sections.from_distances[i], from_bound) <= heap[0][0]:
+                if distance_dependent:
+                    taken.update(keys)
+                continue
+            for j in range(i, len(sections)):
+                key = keys[j - i]
+                if key[0] == key[1] or key in taken or (exclude is not None and exclude(*key)):
+                    continue
+                if j < first:
+                    taken.add(key)
+                    continue
+                distance = sections.to_distances[j] - sections.from_distances[i]
+                bound = min(from_bound, get_freight_bound(key[1]))
+                if bound <= min_freight_amount:
+                    continue
+                if top_k is not None and len(heap) == top_k and score(distance, bound) <= heap[0][0]:
+                    if distance_dependent:
+                        taken.add(key)
+                    continue
+                taken.add(key)
+                freight_amount = get_freight_amount(get_relations_covering(relations_at_points, *key))
+                if freight_amount <= min_freight_amount:
+                    continue
+                combination = (key[0], key[1], relation_index, sections.start_offsets[i], sections.end_offsets[j],
+                               distance, freight_amount)
+                if top_k is None:
+                    combinations.append(combination)
+                elif len(heap) < top_k:
+                    heapq.heappush(heap, (score(distance, freight_amount), len(taken), combination))
+                else:
+                    heapq.heappushpop(heap, (score(distance, freight_amount), len(taken), combination))
+    if top_k is None:
+        return combinations
+    return [combination for _, _, combination in sorted(heap, key=lambda entry: (-entry[0], entry[1]))]
+
+
+def materialize_geometries(df: pd.DataFrame, relation_sections: dict) -> np.ndarray:
+    """
+    Get the geometry of every row of a section or section combination DataFrame. Rows referencing a relation by
+    relation_index, start_offset and end_offset are materialized from the sections of the relation, the other rows
+    keep their geometry.
+    :param df: DataFrame with the columns relation_index, start_offset, end_offset and geometry
+    :param relation_sections: dict mapping the relation index to its RelationSections
+    :return: object array of geometries
+    """
+    geometries = np.empty(len(df), dtype=object)
+    for row, (relation_index, start_offset, end_offset, geometry) in enumerate(
+            zip(df['relation_index'], df['start_offset'], df['end_offset'], df['geometry'])):
+        if relation_index < 0:
+            geometries[row] = geometry
+        else:
+            geometries[row] = relation_sections[relation_index].geometry(start_offset, end_offset)
+    return geometries
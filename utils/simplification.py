@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+from shapely.geometry import LineString
+
+from utils.coordinates import CoordinateStore
+from utils.corridors import get_edge_key, get_relations_per_edge, get_run_boundaries, get_vertex_keys
+from utils.geometry import get_cumulative_distances
+from utils.snapping import IntersectionPointIndex
+
+
+def simplify_run(coords: np.ndarray, keys: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Simplify a run of edges with the Douglas-Peucker algorithm, keeping its first and last vertex. The run is simplified
+    in a canonical direction, so the runs of routes passing in opposite directions are simplified identically.
+    :param coords: array of shape (n, 2), the vertices of the run
+    :param keys: array of shape (n, 2), the vertex keys of the run, see get_vertex_keys
+    :param tolerance: maximum distance of the removed vertices to the simplified run, in the units of the coordinates
+    :return: array of shape (m, 2) with m <= n
+    """
+    if len(coords) < 3:
+        return coords
+    reverse = tuple(keys[-1]) < tuple(keys[0])
+    if reverse:
+        coords = coords[::-1]
+    simplified = np.asarray(LineString(coords).simplify(tolerance, preserve_topology=False).coords)
+    return simplified[::-1] if reverse else simplified
+
+
+def simplify_routes(route_store: CoordinateStore, tolerance: float, snapping_tolerance: float, path: str,
+                    dtype=np.float64) -> CoordinateStore:
+    """
+    Simplify the routes of all relations while keeping their shared segments identical. Every route is split into
+    maximal runs of edges used by the same relations, see get_run_boundaries, the vertices at the boundaries of the
+    runs and the vertices where other relations cross a run are kept, and every run is simplified on its own. Since
+    the relations sharing a run have the same vertices along it, they get the same simplified vertices, i.e., two
+    routes on the same motorway stay identical.
+    :param route_store: CoordinateStore of the routes
+    :param tolerance: maximum distance of the removed vertices to the simplified route, in the units of the coordinates
+    :param snapping_tolerance: vertices closer than this are considered the same vertex
+    :param path: directory of the CoordinateStore of the simplified routes
+    :param dtype: dtype of the vertices, see CoordinateStore.from_coordinates
+    :return: CoordinateStore of the simplified routes, with the summary distances of the original routes
+    """
+    vertex_keys = [get_vertex_keys(route_store.coordinates(relation_index), snapping_tolerance)
+                   for relation_index in range(len(route_store))]
+    relations_per_edge = get_relations_per_edge(vertex_keys)
+    relations_per_vertex = {}
+    for relation_index, keys in enumerate(vertex_keys):
+        for vertex in map(tuple, keys.tolist()):
+            relations_per_vertex.setdefault(vertex, set()).add(relation_index)
+
+    simplified_coordinates = []
+    for relation_index, keys in enumerate(vertex_keys):
+        coords = np.asarray(route_store.coordinates(relation_index), dtype=np.float64)
+        vertices = list(map(tuple, keys.tolist()))
+        boundaries = set(get_run_boundaries(vertices, relations_per_edge))
+        # keep the vertices used by more relations than the run, e.g., where another relation crosses
+        for i in range(1, len(vertices) - 1):
+            if vertices[i] != vertices[i + 1] and len(relations_per_vertex[vertices[i]]) > \
+                    len(relations_per_edge[get_edge_key(vertices[i], vertices[i + 1])]):
+                boundaries.add(i)
+        boundaries = sorted(boundaries)
+        runs = [simplify_run(coords[start:end + 1], keys[start:end + 1], tolerance)
+                for start, end in zip(boundaries[:-1], boundaries[1:])]
+        # consecutive runs share their boundary vertex
+        simplified_coordinates.append(np.concatenate([runs[0]] + [run[1:] for run in runs[1:]]) if runs else coords)
+    return CoordinateStore.from_coordinates(simplified_coordinates, route_store.distances, path, dtype=dtype)
+
+
+def get_simplification_report(route_store: CoordinateStore, simplified_store: CoordinateStore,
+                              duration: float) -> dict:
+    """
+    Compare the simplified routes with the original routes
+    :param route_store: CoordinateStore of the original routes
+    :param simplified_store: CoordinateStore of the simplified routes
+    :param duration: runtime of the simplification in seconds
+    :return: dict with the number of vertices before and after the simplification and the relative error of the route
+        lengths
+    """
+    length_errors = []
+    for relation_index in range(len(route_store)):
+        length = get_cumulative_distances(np.asarray(route_store.coordinates(relation_index), np.float64))[-1]
+        simplified_length = get_cumulative_distances(
+            np.asarray(simplified_store.coordinates(relation_index), np.float64))[-1]
+        length_errors.append(abs(1 - simplified_length / length) if length > 0 else 0.0)
+    vertices_before = len(route_store.vertices)
+    vertices_after = len(simplified_store.vertices)
+    return {'vertices_before': vertices_before,
+            'vertices_after': vertices_after,
+            'vertex_reduction': round(1 - vertices_after / vertices_before, 4) if vertices_before else 0.0,
+            'mean_relative_length_error': float(np.mean(length_errors)) if length_errors else 0.0,
+            'max_relative_length_error': float(np.max(length_errors)) if length_errors else 0.0,
+            'duration_seconds': round(duration, 3)}
+
+
+def compare_section_combinations(df_combinations: pd.DataFrame, df_intersection_points: pd.DataFrame,
+                                 df_baseline_combinations: pd.DataFrame,
+                                 df_baseline_intersection_points: pd.DataFrame, tolerance: float) -> dict:
+    """
+    Compare the distances of the section combinations of the simplified routes with the ones of the original routes.
+    A section combination is matched by its intersection points, which may move by up to the tolerance of the
+    simplification.
+    :param df_combinations: section combinations of the simplified routes
+    :param df_intersection_points: intersection points of the simplified routes, the index of a point is its row
+    :param df_baseline_combinations: section combinations of the original routes
+    :param df_baseline_intersection_points: intersection points of the original routes
+    :param tolerance: maximum distance of matched intersection points, in the units of the coordinates
+    :return: dict with the number of matched and unmatched section combinations and the absolute and relative
+        differences of their distances
+    """
+    baseline_points = IntersectionPointIndex.from_dataframe(df_baseline_intersection_points, tolerance)
+    baseline_distances = dict(zip(zip(df_baseline_combinations['from_intersection_point_index'].tolist(),
+                                      df_baseline_combinations['to_intersection_point_index'].tolist()),
+                                  df_baseline_combinations['distance'].tolist()))
+    baseline_point_ids = [baseline_points.nearest(point.x, point.y) for point in df_intersection_points['geometry']]
+    deltas = []
+    relative_deltas = []
+    for from_intersection_point_index, to_intersection_point_index, distance in zip(
+            df_combinations['from_intersection_point_index'].tolist(),
+            df_combinations['to_intersection_point_index'].tolist(), df_combinations['distance'].tolist()):
+        key = (baseline_point_ids[from_intersection_point_index], baseline_point_ids[to_intersection_point_index])
+        if key not in baseline_distances:
+            continue
+        deltas.append(abs(distance - baseline_distances[key]))
+        relative_deltas.append(deltas[-1] / baseline_distances[key] if baseline_distances[key] > 0 else 0.0)
+    return {'matched_combinations': len(deltas),
+            'unmatched_combinations': len(df_combinations) - len(deltas),
+            'mean_absolute_distance_delta_km': float(np.mean(deltas)) if deltas else None,
+            'max_absolute_distance_delta_km': float(np.max(deltas)) if deltas else None,
+            'mean_relative_distance_delta': float(np.mean(relative_deltas)) if relative_deltas else None,
+            'max_relative_distance_delta': float(np.max(relative_deltas)) if relative_deltas else None}
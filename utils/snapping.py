@@ -0,0 +1,89 @@
+import json
+import math
+
+import pandas as pd
+from shapely.geometry import Point, shape
+
+
+class IntersectionPointIndex:
+    """
+    Canonical intersection points with stable ids. Points closer than the tolerance are snapped to the same canonical
+    point, i.e., floating-point noise of the intersections does not produce near-duplicate points. The points are
+    hashed into a grid with a cell size of the tolerance, so the nearest canonical point is found by checking the 3x3
+    neighboring cells only.
+    """
+
+    def __init__(self, tolerance: float):
+        """
+        :param tolerance: maximum distance of a point to its canonical point, in the units of the coordinates
+        """
+        self.tolerance = tolerance
+        self.coords = []
+        self.cells = {}
+
+    def __len__(self):
+        return len(self.coords)
+
+    def _cell(self, x: float, y: float) -> tuple:
+        return math.floor(x / self.tolerance), math.floor(y / self.tolerance)
+
+    def nearest(self, x: float, y: float):
+        """
+        Get the id of the nearest canonical point within the tolerance
+        :param x: x coordinate, i.e., longitude
+        :param y: y coordinate, i.e., latitude
+        :return: id of the canonical point or None if there is no canonical point within the tolerance
+        """
+        cell_x, cell_y = self._cell(x, y)
+        nearest_id = None
+        nearest_distance = self.tolerance
+        for neighbor_x in (cell_x - 1, cell_x, cell_x + 1):
+            for neighbor_y in (cell_y - 1, cell_y, cell_y + 1):
+                for point_id in self.cells.get((neighbor_x, neighbor_y), ()):
+                    point_x, point_y = self.coords[point_id]
+                    distance = math.hypot(point_x - x, point_y - y)
+                    if distance <= nearest_distance:
+                        nearest_id, nearest_distance = point_id, distance
+        return nearest_id
+
+    def snap(self, x: float, y: float) -> int:
+        """
+        Snap a point to the nearest canonical point within the tolerance or add it as a new canonical point
+        :param x: x coordinate, i.e., longitude
+        :param y: y coordinate, i.e., latitude
+        :return: id of the canonical point
+        """
+        point_id = self.nearest(x, y)
+        if point_id is None:
+            point_id = len(self.coords)
+            self.coords.append((x, y))
+            self.cells.setdefault(self._cell(x, y), []).append(point_id)
+        return point_id
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Get the canonical points as a DataFrame, the index equals the id of the point
+        :return: DataFrame with the columns intersection_point_id and geometry (shapely Point)
+        """
+        return pd.DataFrame({'intersection_point_id': range(len(self.coords)),
+                             'geometry': [Point(coords) for coords in self.coords]})
+
+    @classmethod
+    def from_dataframe(cls, df_intersection_points: pd.DataFrame, tolerance: float):
+        """
+        Create the index from stored intersection points, keeping their ids. The ids are the row positions if the
+        DataFrame does not have an intersection_point_id column.
+        :param df_intersection_points: DataFrame with a geometry column of shapely Points or GeoJSON strings
+        :param tolerance: maximum distance of a point to its canonical point
+        :return: IntersectionPointIndex
+        """
+        index = cls(tolerance)
+        if 'intersection_point_id' in df_intersection_points.columns:
+            df_intersection_points = df_intersection_points.sort_values('intersection_point_id')
+        for geometry in df_intersection_points['geometry']:
+            point = shape(json.loads(geometry)) if isinstance(geometry, str) else geometry
+            # keep the ids, even if stored points are closer than the tolerance
+            point_id = len(index.coords)
+            index.coords.append((point.x, point.y))
+            index.cells.setdefault(index._cell(point.x, point.y), []).append(point_id)
+        return index
@@ -1,34 +1,144 @@
+import functools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import folium
 import googlemaps
+import numpy as np
 import openrouteservice
 import pandas as pd
+import requests
 
-from shapely.geometry import MultiLineString, GeometryCollection, Point, LineString, mapping
-from utils.api_keys import *
+from shapely.geometry import MultiLineString, GeometryCollection, Point, LineString, box, mapping
+from shapely.strtree import STRtree
+try:
+    from utils.api_keys import *
+except ImportError:
+    # the keys are only needed to geocode new addresses and route new relations, e.g., not to run benchmark.py
+    GOOGLE_API_KEY = None
+    ORS_API_KEY = None
+from utils.cache import ResponseCache, normalize_address, route_key
+from utils.geometry import query_tree
+from utils.metrics import Metrics
+from utils.throttling import TokenBucket
 from shapely import ops
 
 
-def google_geocode(address: str):
+@functools.lru_cache(maxsize=None)
+def get_google_client():
+    """
+    Get the Google Maps client, which is created once and shared by all geocoding requests
+    :return: googlemaps.Client
+    """
+    return googlemaps.Client(key=GOOGLE_API_KEY)
+
+
+def google_geocode(address: str, cache: ResponseCache = None, rate_limiter: TokenBucket = None):
     """
     Geocode an address using Google Maps API
     :param address: address to be geocoded
     :type address: str
+    :param cache: response cache, the address is only geocoded if its normalized address is not cached
+    :param rate_limiter: token bucket to be acquired before a request is sent
     :return: result from Google Maps API
     """
-    gmaps = googlemaps.Client(key=GOOGLE_API_KEY)
+    key = normalize_address(address)
+    if cache is not None:
+        geocode_result = cache.get('geocode', key)
+        if geocode_result is not None:
+            return geocode_result
+
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    gmaps = get_google_client()
     print(f'Geocoding {address}')
     geocode_result = gmaps.geocode(address)
+
+    if cache is not None:
+        cache.set('geocode', key, geocode_result)
     return geocode_result
 
 
-def ors_route(coords: tuple) -> dict:
+def geocode_addresses(addresses: list, max_workers: int = 8, requests_per_second: float = 40,
+                      cache: ResponseCache = None) -> dict:
+    """
+    Geocode several addresses concurrently using Google Maps API. The number of concurrent requests is bounded by
+    max_workers and the request rate by a token bucket, i.e., the Google Maps quota is not exceeded.
+    :param addresses: list of unique addresses to be geocoded
+    :param max_workers: maximum number of concurrent requests
+    :param requests_per_second: maximum number of requests per second
+    :param cache: response cache, only addresses which are not cached are geocoded
+    :return: dict mapping each address to its result from Google Maps API
+    """
+    rate_limiter = TokenBucket(rate=requests_per_second, capacity=max_workers)
+
+    def geocode(address):
+        return google_geocode(address, cache, rate_limiter)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(addresses, executor.map(geocode, addresses)))
+
+
+# HTTP status codes of openrouteservice responses that are retried, i.e., rate limit exceeded and server errors
+ORS_RETRIABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# base url of the public openrouteservice API, which needs an API key
+DEFAULT_ORS_BASE_URL = 'https://api.openrouteservice.org'
+
+# openrouteservice clients of the routeing threads, see get_ors_client
+_ors_clients = threading.local()
+
+
+def raise_retriable_status(response: requests.Response, *args, **kwargs):
+    """
+    Response hook of the openrouteservice client, raises the server errors the client would otherwise retry on its own
+    :param response: response of the openrouteservice API
+    :return: None
+    """
+    if response.status_code in ORS_RETRIABLE_STATUSES and response.status_code != 429:
+        raise openrouteservice.exceptions.HTTPError(response.status_code)
+
+
+def get_ors_client(base_url: str = DEFAULT_ORS_BASE_URL) -> openrouteservice.Client:
+    """
+    Get the openrouteservice client of the current thread. The client is created once per thread and base url and is
+    reused for all following requests, i.e., its HTTP session and connections are reused as well.
+    :param base_url: base url of the openrouteservice API, e.g., a local openrouteservice instance or stand-in server
+    :return: openrouteservice.Client
+    """
+    clients = getattr(_ors_clients, 'clients', None)
+    if clients is None:
+        clients = _ors_clients.clients = {}
+    if base_url not in clients:
+        # rate limits and server errors are retried by ors_route_with_retries, so the client must not retry on its own
+        clients[base_url] = openrouteservice.Client(key=ORS_API_KEY, base_url=base_url, retry_over_query_limit=False,
+                                                    requests_kwargs={'hooks': {'response': raise_retriable_status}})
+    return clients[base_url]
+
+
+def ors_route(coords: tuple, client: openrouteservice.Client = None, cache: ResponseCache = None,
+              rate_limiter: TokenBucket = None, base_url: str = DEFAULT_ORS_BASE_URL) -> dict:
     """
     Get route between origin and destination coordinates OpenRouteService API
     :param coords: a tuple containing two tuples of coordinates ((from_lng, from_lat), (to_lng, to_lat))
+    :param client: openrouteservice client to be used, by default the client of the current thread, which is only
+        created if the route is not cached
+    :param cache: response cache, the route is only requested if the coordinate pair is not cached
+    :param rate_limiter: token bucket to be acquired before a request is sent
+    :param base_url: base url of the openrouteservice API of the default client
     :return: result from OpenRouteService API
     """
-    api_key = 'insert API key here'
-    client = openrouteservice.Client(key=ORS_API_KEY)
+    key = route_key(coords, profile='driving-hgv')
+    if cache is not None:
+        routes_result = cache.get('route', key)
+        if routes_result is not None:
+            return routes_result
+
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    client = client or get_ors_client(base_url)
     print(f'Routeing (from, to): {coords}')
     routes_result = client.directions(
         coordinates=coords,
@@ -39,9 +149,69 @@ def ors_route(coords: tuple) -> dict:
         instructions='false',
         radiuses='-1'
     )
+
+    if cache is not None:
+        cache.set('route', key, routes_result)
     return routes_result
 
 
+def ors_route_with_retries(coords: tuple, rate_limiter: TokenBucket, client: openrouteservice.Client = None,
+                           cache: ResponseCache = None, max_retries: int = 5, backoff: float = 2.0,
+                           base_url: str = DEFAULT_ORS_BASE_URL) -> dict:
+    """
+    Get a route from the OpenRouteService API within the rate limit, retry with exponential backoff if the rate limit
+    is exceeded (HTTP 429), the server fails (HTTP 5xx) or the connection fails
+    :param coords: a tuple containing two tuples of coordinates ((from_lng, from_lat), (to_lng, to_lat))
+    :param rate_limiter: token bucket shared by all routeing requests
+    :param client: openrouteservice client to be used, by default the client of the current thread
+    :param cache: response cache, the route is only requested if the coordinate pair is not cached
+    :param max_retries: maximum number of retries before the last error is raised
+    :param backoff: delay before the first retry in seconds, doubled for every further retry
+    :param base_url: base url of the openrouteservice API of the default client
+    :return: result from OpenRouteService API
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return ors_route(coords, client, cache, rate_limiter, base_url)
+        except (openrouteservice.exceptions.ApiError, openrouteservice.exceptions.HTTPError,
+                openrouteservice.exceptions.Timeout, requests.exceptions.ConnectionError) as error:
+            status = getattr(error, 'status', getattr(error, 'status_code', None))
+            retriable = status is None or status in ORS_RETRIABLE_STATUSES
+            if not retriable or attempt == max_retries:
+                raise
+            # jitter the delay, so that concurrent requests do not retry at the same time
+            delay = backoff * 2 ** attempt * (0.5 + random.random())
+            print(f'Routeing {coords} failed ({error}), retrying in {delay:.1f} seconds')
+        time.sleep(delay)
+
+
+def route_coordinate_pairs(coordinate_pairs: list, max_workers: int = 4, requests_per_minute: float = 40,
+                           burst: int = 1, base_url: str = DEFAULT_ORS_BASE_URL, max_retries: int = 5,
+                           cache: ResponseCache = None, backoff: float = 2.0) -> list:
+    """
+    Route several coordinate pairs concurrently using the OpenRouteService API. The request rate is limited by a token
+    bucket according to the quota, failed requests are retried with exponential backoff.
+    :param coordinate_pairs: list of ((from_lng, from_lat), (to_lng, to_lat)) tuples
+    :param max_workers: maximum number of requests in flight
+    :param requests_per_minute: maximum number of requests per minute, i.e., the quota of the API key
+    :param burst: maximum number of requests sent at once, i.e., the capacity of the token bucket
+    :param base_url: base url of the openrouteservice API
+    :param max_retries: maximum number of retries per request
+    :param cache: response cache, only coordinate pairs which are not cached are requested, i.e., no client is created
+        and no API key is needed if all of them are cached
+    :param backoff: delay before the first retry in seconds, see ors_route_with_retries
+    :return: list of results from OpenRouteService API in the order of the coordinate pairs
+    """
+    rate_limiter = TokenBucket(rate=requests_per_minute / 60, capacity=burst)
+
+    def route(coordinate_pair):
+        return ors_route_with_retries(coordinate_pair, rate_limiter, cache=cache, max_retries=max_retries,
+                                      backoff=backoff, base_url=base_url)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(route, coordinate_pairs))
+
+
 def style_relations(feature):
     """
     Style the relations layer in the map
@@ -78,6 +248,24 @@ def style_locations(feature):
     }
 
 
+def add_geojson_layer(m: folium.Map, geojsons: list, name: str, child_kwargs: dict = None, **kwargs):
+    """
+    Add a layer of GeoJSON objects to the map, the first object creates the layer and the others are added to it
+    :param m: folium map
+    :param geojsons: list of GeoJSON dicts, e.g., created with shapely.geometry.mapping
+    :param name: name of the layer in the layer control
+    :param child_kwargs: keyword arguments of the folium.GeoJson of the other objects
+    :param kwargs: keyword arguments of the folium.GeoJson of the first object, e.g., style_function
+    :return: None
+    """
+    if not geojsons:
+        return
+    layer = folium.GeoJson(geojsons[0], name=name, **kwargs)
+    layer.add_to(m)
+    for geojson in geojsons[1:]:
+        layer.add_child(folium.GeoJson(geojson, **(child_kwargs or {})))
+
+
 def get_intersection_point_marker():
     """
         Style the relations layer in the map
@@ -97,37 +285,86 @@ def get_shipments_for_relation(df_shipments: pd.DataFrame, from_location_id: int
         ]
 
 
-def append_point(df, coords):
-    return pd.concat([df, pd.DataFrame([{'geometry': Point(coords)}])], ignore_index=True)
-
-
-def get_section_with_second_intersection_point(section, df_intersection_points):
-    to_intersection_point_index = section['to_intersection_point_index']
-    to_intersection_point_geom = df_intersection_points.iloc[to_intersection_point_index]['geometry']
-
-    if not section['geometry'].intersection(to_intersection_point_geom).is_empty:
-        return section['geometry']
-
-    # Append the new Point to the existing LineString coordinates
-    extended_section_coords = list(section['geometry'].coords) + [
-        (to_intersection_point_geom.x, to_intersection_point_geom.y)]
-
-    # Create the new extended LineString
-    extended_section = LineString(extended_section_coords)
-    return extended_section
+def get_candidate_relation_pairs(bounds: np.ndarray) -> tuple:
+    """
+    Get all unordered pairs of routes whose bounding boxes overlap, using an STRtree of the bounding boxes as a
+    pre-filter. Pairs whose bounding boxes do not overlap cannot intersect, so they do not need to be intersected at all.
+    :param bounds: array of shape (m, 4), the bounding box (min_x, min_y, max_x, max_y) of every route, e.g.,
+        CoordinateStore.bounds
+    :return: tuple of (dict mapping each index i to the sorted list of indices j > i whose bounding box overlaps the one
+        of i, number of pruned pairs)
+    """
+    # the tree only needs the bounding boxes, i.e., no LineString of the routes is built
+    boxes = [box(*route_bounds) for route_bounds in np.asarray(bounds, dtype=np.float64).tolist()]
+    tree = STRtree(boxes)
 
+    candidate_pairs = {}
+    number_of_candidates = 0
+    for i, route_box in enumerate(boxes):
+        candidates = sorted(j for j in query_tree(tree, route_box) if j > i)
+        candidate_pairs[i] = candidates
+        number_of_candidates += len(candidates)
 
-def get_section_with_first_intersection_point(section, df_intersection_points):
-    from_intersection_point_index = section['from_intersection_point_index']
-    from_intersection_point_geom = df_intersection_points.iloc[from_intersection_point_index]['geometry']
+    number_of_pairs = len(boxes) * (len(boxes) - 1) // 2
+    return candidate_pairs, number_of_pairs - number_of_candidates
 
-    if not section['geometry'].intersection(from_intersection_point_geom).is_empty:
-        return section['geometry']
 
-    # Append the new Point to the existing LineString coordinates
-    extended_section_coords = [(from_intersection_point_geom.x, from_intersection_point_geom.y)] + list(
-        section['geometry'].coords)
+def get_intersection_endpoints(geometry_1, geometry_2, relation_id_1: str, relation_id_2: str,
+                               metrics: Metrics = None) -> list:
+    """
+    Intersect the routes of two relations and get the start and end coordinates of their common sections
+    :param geometry_1: shapely geometry of the first relation
+    :param geometry_2: shapely geometry of the second relation
+    :param relation_id_1: id of the first relation, only used for logging
+    :param relation_id_2: id of the second relation, only used for logging
+    :param metrics: Metrics counting the intersections whose common sections could not be merged to one line or are
+        of an unexpected geometry type, None to not count them
+    :return: list of coordinate tuples, i.e., the start and end point of each common section
+    """
+    metrics = metrics or Metrics()
+    endpoints = []
+    intersection = geometry_1.intersection(geometry_2)
 
-    # Create the new extended LineString
-    extended_section = LineString(extended_section_coords)
-    return extended_section
+    # extract intersection points from the intersection
+    if intersection.is_empty:
+        return endpoints
+    if isinstance(intersection, LineString):
+        endpoints += [intersection.coords[0], intersection.coords[-1]]
+    elif isinstance(intersection, MultiLineString):
+        # try to merge the lines to one line - works only for contiguous lines
+        intersection = ops.linemerge(intersection)
+        if isinstance(intersection, MultiLineString):
+            # if the lines are not contiguous, add the start and end point of each line
+            print(f'MultiLineString of {relation_id_1} and {relation_id_2} has {len(intersection.geoms)} lines')
+            metrics.count('intersect.merge_failures')
+            for linestring in intersection.geoms:
+                endpoints += [linestring.coords[0], linestring.coords[-1]]
+        else:
+            # if the lines are contiguous, add the start and end point of the line
+            endpoints += [intersection.coords[0], intersection.coords[-1]]
+    elif isinstance(intersection, GeometryCollection):
+        # try to get all lines from the geometry collection and merge them to one line
+        mls = MultiLineString([geometry for geometry in intersection.geoms if isinstance(geometry, LineString)])
+        intersection = ops.linemerge(mls)
+        # if the lines are contiguous, add the start and end point of the line
+        if isinstance(intersection, LineString):
+            endpoints += [intersection.coords[0], intersection.coords[-1]]
+        elif isinstance(intersection, MultiLineString):
+            # if the lines are not contiguous, add the start and end point of each line
+            metrics.count('intersect.merge_failures')
+            for geometry in intersection.geoms:
+                if isinstance(geometry, LineString):
+                    endpoints += [geometry.coords[0], geometry.coords[-1]]
+        else:
+            print(
+                f'Error: A GeometryCollection Geometry of intersection of {relation_id_1} and {relation_id_2} is not a line or point, but a {type(intersection)}')
+            metrics.count('intersect.unexpected_geometries')
+    elif isinstance(intersection, Point):
+        # if intersection is a point, the relations do not have a common section that can be consolidated
+        # so the point is not needed
+        pass
+    else:
+        print(
+            f'Error: intersection of {relation_id_1} and {relation_id_2} is not a line or point, but a {type(intersection)}')
+        metrics.count('intersect.unexpected_geometries')
+    return endpoints
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+from utils.geometry import get_cumulative_distances
+
+METERS_PER_DEGREE = 111320  # at the equator, the synthetic distances only have to be plausible
+
+
+def get_grid_nodes(grid_size: int, spacing: float, origin: tuple) -> np.ndarray:
+    """
+    Get the nodes of a square grid of corridors, e.g., motorway junctions
+    :param grid_size: number of nodes per row and column
+    :param spacing: distance between neighbouring nodes, in degrees
+    :param origin: (x, y) of the south-western node
+    :return: array of shape (grid_size, grid_size, 2), indexed by column and row
+    """
+    columns, rows = np.meshgrid(np.arange(grid_size), np.arange(grid_size), indexing='ij')
+    return np.stack([origin[0] + columns * spacing, origin[1] + rows * spacing], axis=-1)
+
+
+def get_corridor_path(from_node: tuple, to_node: tuple, nodes: np.ndarray, vertices_per_edge: int) -> np.ndarray:
+    """
+    Get the vertices of the path between two grid nodes, first along the row of the start node and then along the
+    column of the end node. Every corridor edge has the same vertices for every path using it, so paths on the same
+    corridor share their edges exactly, like routes on the same motorway.
+    :param from_node: (column, row) of the start node
+    :param to_node: (column, row) of the end node
+    :param nodes: grid nodes, see get_grid_nodes
+    :param vertices_per_edge: number of vertices between two neighbouring nodes, i.e., the vertex density
+    :return: array of shape (n, 2)
+    """
+    column_step = 1 if to_node[0] >= from_node[0] else -1
+    row_step = 1 if to_node[1] >= from_node[1] else -1
+    steps = [(column, from_node[1]) for column in range(from_node[0], to_node[0], column_step)]
+    steps += [(to_node[0], row) for row in range(from_node[1], to_node[1], row_step)]
+    steps.append(to_node)
+    fractions = np.arange(vertices_per_edge + 1) / (vertices_per_edge + 1)
+    vertices = [nodes[steps[0]]]
+    for step_from, step_to in zip(steps[:-1], steps[1:]):
+        vertices.extend(nodes[step_from] + fractions[1:, None] * (nodes[step_to] - nodes[step_from]))
+        vertices.append(nodes[step_to])
+    return np.round(np.array(vertices, dtype=np.float64).reshape(-1, 2), 7)
+
+
+def generate_network(relations: int, grid_size: int = 10, spacing: float = 0.5, vertices_per_edge: int = 20,
+                     spur_vertices: int = 5, shipments_per_relation: int = 20, origin: tuple = (5.0, 45.0),
+                     seed: int = 1) -> tuple:
+    """
+    Generate a synthetic network of routes sharing corridors and the shipments on them, e.g., to benchmark STEP 4 to
+    STEP 6 without geocoding and routeing. Every location is connected to a grid node by its own spur, and the route of
+    a relation follows the spur of its start location, the corridors between the grid nodes and the spur of its end
+    location.
+    :param relations: number of relations
+    :param grid_size: number of grid nodes per row and column
+    :param spacing: distance between neighbouring grid nodes, in degrees
+    :param vertices_per_edge: number of vertices between two neighbouring grid nodes
+    :param spur_vertices: number of vertices of the spur of a location
+    :param shipments_per_relation: mean number of shipments per relation in 2021
+    :param origin: (x, y) of the south-western grid node
+    :param seed: seed of the random numbers, the same arguments always generate the same network
+    :return: tuple of (list of route coordinate arrays of shape (n, 2), array of the route distances in meters,
+        df_relations with the columns of RELATION_SCHEMA, df_shipments with the columns of SHIPMENT_SCHEMA)
+    """
+    random = np.random.default_rng(seed)
+    nodes = get_grid_nodes(grid_size, spacing, origin)
+
+    # the smallest number of locations with enough ordered location pairs
+    locations = int(np.ceil((1 + np.sqrt(1 + 4 * relations)) / 2))
+    location_nodes = [tuple(node) for node in random.integers(0, grid_size, size=(locations, 2)).tolist()]
+    spurs = []
+    for location_node in location_nodes:
+        steps = np.cumsum(random.uniform(-0.2, 0.2, size=(spur_vertices, 2)) * spacing, axis=0)
+        spurs.append(np.round(nodes[location_node] + steps, 7))
+
+    # draw distinct relations, i.e., ordered pairs of different locations
+    pair_indices = random.choice(locations * (locations - 1), size=relations, replace=False)
+    from_locations = pair_indices // (locations - 1)
+    to_locations = pair_indices % (locations - 1)
+    to_locations = to_locations + (to_locations >= from_locations)
+
+    route_coordinates = []
+    for from_location, to_location in zip(from_locations.tolist(), to_locations.tolist()):
+        corridor = get_corridor_path(location_nodes[from_location], location_nodes[to_location], nodes,
+                                     vertices_per_edge)
+        route_coordinates.append(np.concatenate([spurs[from_location][::-1], corridor, spurs[to_location]]))
+    distances = np.array([get_cumulative_distances(coords)[-1] * METERS_PER_DEGREE for coords in route_coordinates])
+
+    df_relations = pd.DataFrame({'from_location_id': from_locations + 1, 'to_location_id': to_locations + 1})
+
+    # the shipments of a relation are spread over the year, so some weeks utilize a load unit and others do not
+    shipments = random.poisson(shipments_per_relation, size=relations)
+    df_shipments = pd.DataFrame({
+        'date': pd.Timestamp('2021-01-01') + pd.to_timedelta(random.integers(0, 365, size=shipments.sum()), unit='D'),
+        'from_location_id': np.repeat(df_relations['from_location_id'].to_numpy(), shipments),
+        'to_location_id': np.repeat(df_relations['to_location_id'].to_numpy(), shipments),
+        'weight_in_tons': random.uniform(1, 25, size=shipments.sum())})
+    # only the weight limits the load units, like an input without volumes and loading lengths
+    df_shipments['volume_in_cubic_meters'] = np.nan
+    df_shipments['loading_length_in_meters'] = np.nan
+    return route_coordinates, distances, df_relations, df_shipments
@@ -0,0 +1,36 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter. The bucket holds up to capacity tokens and is refilled with rate tokens per
+    second, every request takes one token and waits until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        """
+        :param rate: number of tokens added per second, i.e., the sustained number of requests per second
+        :param capacity: maximum number of tokens, i.e., the number of requests that may be sent in a burst
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token from the bucket, block until a token is available
+        :return: None
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)